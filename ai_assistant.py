@@ -1,14 +1,19 @@
 import os
 import logging
 import base64
-import tempfile
 import requests
 import json
-from flask import jsonify
+from flask import current_app, jsonify
+from metrics import observe_ai_call, observe_ai_stream
+from response_cache import cached_response, response_cache
+from upstream import get_client
+from intents import topic_index
+from audio import split_audio, stitch_transcripts, transcribe_segments
 
 # Get GitHub token from environment variable
 GITHUB_TOKEN = os.environ.get("OPENAI_API_KEY")  # Using the same env var for backward compatibility
 
+@observe_ai_call
 def text_to_speech(text, voice="alloy"):
     """
     Convert text to speech using GitHub's text-to-speech service
@@ -30,31 +35,58 @@ def text_to_speech(text, voice="alloy"):
         logging.error(f"Error in text_to_speech: {str(e)}")
         return {"error": str(e)}, 500
 
+def _transcribe_segment(client, model, segment):
+    if client is None:
+        # Simulate a response when no AI service is configured
+        return "This is a simulated transcription of the audio file."
+    
+    response = client.request(
+        "POST", "audio/transcriptions",
+        files={"file": (segment.file_name, segment.data, segment.content_type)},
+        data={"model": model}
+    )
+    response.raise_for_status()
+    return response.json()["text"]
+
+@observe_ai_call
 def speech_to_text(audio_file):
     """
-    Convert speech to text using GitHub speech recognition API
+    Convert speech to text using GitHub speech recognition API. Long
+    recordings are split into overlapping segments that are transcribed in
+    parallel and stitched back together.
     """
     try:
         if not GITHUB_TOKEN:
             return {"error": "GitHub token not configured"}, 500
         
-        # Save the uploaded file to a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-            audio_file.save(temp_file)
-            temp_path = temp_file.name
+        config = current_app.config
+        client = get_client(GITHUB_TOKEN)
+        model = config.get("AI_API_TRANSCRIPTION_MODEL")
         
-        # In a real implementation, you would send this file to a speech recognition API
-        logging.info(f"Speech to text request with file: {temp_path}")
+        # The form parser already spooled the upload, in memory or past a size on
+        # disk, so it is read where it is rather than saved again
+        stream = audio_file.stream
+        stream.seek(0)
+        logging.info(f"Speech to text request with file: {audio_file.filename}")
         
-        # Clean up the temporary file
-        os.unlink(temp_path)
+        segments = split_audio(
+            stream, audio_file.filename or "audio", audio_file.mimetype or "application/octet-stream",
+            config["AUDIO_SEGMENT_SECONDS"], config["AUDIO_SEGMENT_OVERLAP"]
+        )
+        texts = transcribe_segments(
+            segments, lambda segment: _transcribe_segment(client, model, segment),
+            config["AUDIO_TRANSCRIBE_WORKERS"]
+        )
         
-        # Simulate a response
-        return {"text": "This is a simulated transcription of the audio file.", "message": "Using speech-to-text simulation"}, 200
+        result = {"text": stitch_transcripts(texts, config["AUDIO_SEGMENT_OVERLAP"]), "segments": len(texts)}
+        if client is None:
+            result["message"] = "Using speech-to-text simulation"
+        return result, 200
     except Exception as e:
         logging.error(f"Error in speech_to_text: {str(e)}")
         return {"error": str(e)}, 500
 
+@observe_ai_call
 def speech_to_speech_translation(audio_file, target_language):
     """
     Translate speech from one language to another
@@ -69,23 +101,24 @@ def speech_to_speech_translation(audio_file, target_language):
         text = transcription_result["text"]
         
         # Then translate using GitHub Copilot
-        headers = {
-            "Authorization": f"Bearer {GITHUB_TOKEN}",
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-        
         data = {
+            "model": current_app.config.get("AI_API_MODEL"),
             "messages": [
                 {"role": "system", "content": f"You are a translator. Translate the following text to {target_language}."},
                 {"role": "user", "content": text}
             ]
         }
         
-        # Simulate GitHub Copilot API call (in reality, we'd make an actual API call)
         logging.info(f"Translation request to {target_language}: {text[:50]}...")
         
-        translated_text = f"[Translated to {target_language}] {text}"
+        client = get_client(GITHUB_TOKEN)
+        if client is not None:
+            response = client.request("POST", "chat/completions", json=data)
+            response.raise_for_status()
+            translated_text = response.json()["choices"][0]["message"]["content"]
+        else:
+            # Simulate the API call when no AI service is configured
+            translated_text = f"[Translated to {target_language}] {text}"
         
         # Get the translated speech
         return text_to_speech(translated_text)
@@ -93,6 +126,7 @@ def speech_to_speech_translation(audio_file, target_language):
         logging.error(f"Error in speech_to_speech_translation: {str(e)}")
         return {"error": str(e)}, 500
 
+@observe_ai_call
 def text_to_image(prompt):
     """
     Generate an image from text using GitHub's image generation API
@@ -112,454 +146,112 @@ def text_to_image(prompt):
         logging.error(f"Error in text_to_image: {str(e)}")
         return {"error": str(e)}, 500
 
-def educational_assistant(prompt, role):
+class AssistantError(Exception):
+    """The assistant could not produce an answer"""
+
+def educational_assistant_chunks(prompt, role):
     """
-    Provide educational assistance based on the user's role and prompt using GitHub Copilot
+    Yield the answer to a student's or teacher's prompt in chunks as GitHub
+    Copilot produces them. Raises AssistantError if no answer can be given.
     """
+    if not GITHUB_TOKEN:
+        raise AssistantError("GitHub token not configured")
+    
+    system_content = ""
+    if role == "student":
+        system_content = """You are an educational assistant for students. 
+        Your goal is to help students understand concepts, solve problems, 
+        and improve their learning. Provide clear, age-appropriate explanations 
+        and guide students to discover answers rather than giving them directly."""
+    elif role == "teacher":
+        system_content = """You are an educational assistant for teachers. 
+        Your goal is to help teachers create lesson plans, develop teaching 
+        strategies, find resources, and improve their teaching methods. 
+        Provide professional advice and practical solutions."""
+    
+    payload = {
+        "model": current_app.config.get("AI_API_MODEL"),
+        "messages": [
+            {"role": "system", "content": system_content},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.7,
+        "stream": True
+    }
+    
     try:
-        if not GITHUB_TOKEN:
-            return {"error": "GitHub token not configured"}, 500
+        logging.info(f"Educational assistant request as {role}: {prompt[:50]}...")
         
-        system_content = ""
-        if role == "student":
-            system_content = """You are an educational assistant for students. 
-            Your goal is to help students understand concepts, solve problems, 
-            and improve their learning. Provide clear, age-appropriate explanations 
-            and guide students to discover answers rather than giving them directly."""
-        elif role == "teacher":
-            system_content = """You are an educational assistant for teachers. 
-            Your goal is to help teachers create lesson plans, develop teaching 
-            strategies, find resources, and improve their teaching methods. 
-            Provide professional advice and practical solutions."""
+        client = get_client(GITHUB_TOKEN)
+        if client is not None:
+            # The answer arrives as Server-Sent Events, one delta of text per event.
+            # SSE is always UTF-8, whatever charset requests would guess for it
+            with client.stream("POST", "chat/completions", json=payload) as response:
+                response.raise_for_status()
+                for raw_line in response.iter_lines():
+                    line = raw_line.decode("utf-8")
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    content = choices[0].get("delta", {}).get("content")
+                    if content:
+                        yield content
+            return
         
-        headers = {
-            "Authorization": f"Bearer {GITHUB_TOKEN}",
-            "Content-Type": "application/json"
-        }
+        # Without an AI service, answer with the closest topic's prepared response
+        topic = topic_index.match(prompt, "student" if role == "student" else "teacher")
+        if topic is None:
+            raise AssistantError("No assistant topics are configured")
+        response_text = topic.response
         
-        payload = {
-            "model": "github-copilot",
-            "messages": [
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.7
-        }
+        # Sent a line at a time, like a model writing its answer
+        for line in response_text.splitlines(keepends=True):
+            yield line
         
-        try:
-            logging.info(f"Educational assistant request as {role}: {prompt[:50]}...")
-            
-            # Generate comprehensive responses based on the prompt and role
-            
-            # Extract keywords from the prompt to customize response
-            keywords = prompt.lower().split()
-            
-            if role == "student":
-                if any(word in keywords for word in ["math", "mathematics", "algebra", "geometry", "calculus"]):
-                    response_text = """
-Let me help you understand this mathematical concept clearly.
-
-Mathematics is all about patterns and problem-solving strategies. Here's a comprehensive explanation:
-
-1. **Understanding the Core Concept**:
-   - The fundamental principles involve recognizing patterns and relationships
-   - Every math problem has a logical structure you can break down
-
-2. **Step-by-Step Approach**:
-   - First, identify what information you're given and what you need to find
-   - Break down complex problems into smaller, manageable parts
-   - Apply relevant formulas and check your work at each step
-
-3. **Practice Strategies**:
-   - Work through examples with increasing difficulty
-   - Identify similarities between problems you've solved and new ones
-   - Create visual representations whenever possible (graphs, diagrams)
-
-4. **Common Mistakes to Avoid**:
-   - Rushing calculations without understanding the concept
-   - Forgetting to check units and dimensions
-   - Not verifying your answer makes sense in the context of the problem
-
-Remember, mathematics builds upon itself - make sure you understand each concept before moving to more advanced topics.
-
-Would you like me to explain a specific part of this topic in more detail or provide practice problems?
-"""
-                
-                elif any(word in keywords for word in ["science", "biology", "chemistry", "physics"]):
-                    response_text = """
-I'll help you understand this scientific concept thoroughly.
-
-Science is about observation, hypothesis formation, and testing. Here's a detailed explanation:
-
-1. **Fundamental Principles**:
-   - The scientific method forms the backbone of all scientific inquiry
-   - Evidence-based reasoning is essential for drawing valid conclusions
-   - All scientific knowledge is subject to revision with new evidence
-
-2. **Key Concepts**:
-   - Matter and energy interactions drive most physical processes
-   - Biological systems demonstrate remarkable complexity and adaptation
-   - Chemical reactions follow predictable patterns based on electron configuration
-
-3. **Practical Applications**:
-   - This concept appears in various technological advancements
-   - Understanding it helps explain everyday phenomena around you
-   - Scientists use these principles to develop new solutions to global challenges
-
-4. **Study Approach**:
-   - Connect theoretical knowledge with observable examples
-   - Design simple experiments to test your understanding
-   - Use analogy and visualization to grasp abstract concepts
-
-5. **Further Exploration**:
-   - Consider researching recent discoveries in this field
-   - Make connections between this topic and related scientific concepts
-   - Look for interactive simulations online that demonstrate these principles
-
-Science education is most effective when it combines conceptual understanding with hands-on experience. Would you like me to suggest some experiments or activities to reinforce this concept?
-"""
-                
-                else:
-                    response_text = """
-I'm happy to help you understand this concept thoroughly.
-
-Here's a comprehensive explanation:
-
-1. **Core Principles**:
-   - This topic builds on fundamental knowledge in this field
-   - Understanding the underlying structure will help you apply it to various situations
-   - There are several different approaches, each with their own strengths
-
-2. **Key Components**:
-   - The main elements that make up this concept include several interconnected parts
-   - Each component serves a specific purpose in the overall framework
-   - The relationships between these elements create the complete picture
-
-3. **Practical Application**:
-   - Here's how this knowledge applies in real-world scenarios
-   - Look for these patterns in examples around you
-   - You can practice applying this concept through various exercises
-
-4. **Learning Strategy**:
-   - Break down complex ideas into smaller, manageable parts
-   - Connect new information to knowledge you already have
-   - Use multiple methods (visual, verbal, practical) to reinforce understanding
-
-5. **Common Misconceptions**:
-   - Many students misunderstand this aspect of the topic
-   - Be careful not to confuse this concept with similar ideas
-   - Focus on understanding rather than memorizing
-
-I hope this helps clarify the concept! What specific aspect would you like me to elaborate on further?
-"""
-            
-            else:  # teacher
-                if any(word in keywords for word in ["lesson", "plan", "curriculum", "teach"]):
-                    response_text = """
-# Comprehensive Lesson Plan Framework
-
-## Topic Overview and Educational Goals
-
-**Subject Matter Context:**
-- Position this lesson within your broader curriculum sequence
-- Identify prerequisite knowledge students should possess
-- Connect to previous and upcoming content for continuity
-
-**Learning Objectives:**
-- Knowledge objectives: What students will know
-- Skill objectives: What students will be able to do
-- Understanding objectives: What insights students will develop
-- Each objective should be specific, measurable, and aligned with standards
-
-## Instructional Design
-
-**Engagement Phase (10-15 minutes):**
-- Hook: Start with a provocative question, demonstration, or real-world scenario
-- Activate prior knowledge: Connect to students' existing understanding
-- Set clear expectations: Communicate learning goals and success criteria
-
-**Instruction Phase (20-30 minutes):**
-- Present new content using multiple modalities (visual, auditory, kinesthetic)
-- Structure content from simple to complex concepts
-- Include worked examples that demonstrate expert thinking
-- Incorporate checks for understanding throughout
-
-**Guided Practice (15-20 minutes):**
-- Provide scaffolded activities with decreasing support levels
-- Implement think-pair-share or small group collaborative structures
-- Circulate to provide targeted feedback and identify common misconceptions
-
-**Independent Practice (15-20 minutes):**
-- Design activities requiring application of new knowledge/skills
-- Differentiate: Provide tiered activities for various readiness levels
-- Include extension options for advanced learners
-
-**Closure (5-10 minutes):**
-- Facilitate student synthesis of key takeaways
-- Conduct exit assessment to gauge achievement of objectives
-- Preview connections to future learning
-
-## Assessment Strategy
-
-**Formative Assessment:**
-- Specific questioning techniques to check understanding
-- Student self-assessment opportunities
-- Digital or physical response systems to gauge whole-class comprehension
-
-**Summative Assessment:**
-- Clear evaluation criteria with sample exemplars
-- Authentic performance tasks that demonstrate mastery
-- Balanced assessment types (written, oral, project-based)
-
-## Differentiation and Accommodation
-
-**Content Differentiation:**
-- Resources at multiple readability levels
-- Concept presentation using various complexity levels
-
-**Process Differentiation:**
-- Flexible grouping strategies
-- Varied time allocations based on student needs
-- Multiple pathways to demonstrate understanding
-
-**Product Differentiation:**
-- Choice boards or menus of assessment options
-- Scaffolded templates for various ability levels
-
-## Materials and Resources
-
-**Teacher Resources:**
-- Content references and background information
-- Answer keys and scoring rubrics
-- Technology tools and backup plans
-
-**Student Resources:**
-- Handouts, digital resources, manipulatives
-- Reference materials and examples
-- Technology requirements and alternatives
-
-## Reflection and Iteration
-
-**Post-Lesson Analysis:**
-- Evidence-gathering strategy for effectiveness
-- Specific success indicators to monitor
-- Adjustment points for future implementation
+    except requests.exceptions.RequestException as e:
+        logging.error(f"API request error: {str(e)}")
+        raise AssistantError(f"API request failed: {str(e)}")
 
-Would you like me to focus on any particular section of this framework for your specific teaching context?
-"""
-                
-                elif any(word in keywords for word in ["assessment", "evaluate", "grading", "test"]):
-                    response_text = """
-# Comprehensive Assessment Strategy Guide
+ASSISTANT_MESSAGE = "Comprehensive educational assistant response"
 
-## Assessment Philosophy and Purpose
-
-**Balanced Assessment Approach:**
-- Diagnostic assessments to identify starting points
-- Formative assessments to guide instruction
-- Summative assessments to evaluate mastery
-- Assessment should drive instruction, not just measure it
-
-**Learning-Centered Assessment:**
-- Focus on growth rather than comparative performance
-- Use data to identify gaps and misconceptions
-- Create a culture where assessment is viewed as helpful feedback
-
-## High-Quality Assessment Design
-
-**Assessment Validity Principles:**
-- Align directly with specific learning objectives
-- Sample representative content proportionally
-- Use appropriate cognitive complexity levels
-- Match assessment format to learning outcomes
-
-**Question and Task Development:**
-- Develop clear, unambiguous prompts
-- Include various question types (selected response, constructed response, performance tasks)
-- Design authentic tasks that mirror real-world application
-- Create scoring guides with specific criteria before administering
-
-## Formative Assessment Strategies
-
-**Quick Checks for Understanding:**
-- Entry/exit tickets focusing on key concepts
-- Strategic questioning techniques (wait time, no hands up, random selection)
-- Digital response systems for immediate feedback
-- Visual signals from students (thumbs up/down, colored cards)
-
-**Deeper Formative Techniques:**
-- Student self-assessment with specific criteria
-- Peer feedback protocols with structured guidelines
-- Think-alouds to expose student reasoning
-- Misconception analysis and targeted correction
-
-## Feedback Implementation
-
-**Effective Feedback Principles:**
-- Timely: Provide feedback while the task is still relevant
-- Specific: Identify exactly what was effective or needs improvement
-- Actionable: Give clear guidance on next steps
-- Balanced: Note strengths and growth areas
-
-**Feedback Delivery Methods:**
-- Written comments focused on improvement
-- One-on-one conferencing for complex skills
-- Whole-class feedback addressing common patterns
-- Student-led reflection on feedback received
-
-## Grading and Reporting Practices
-
-**Grading Philosophy:**
-- Grade against standards, not against other students
-- Separate academic achievement from behavioral factors
-- Use most recent evidence rather than averaging
-- Provide multiple opportunities to demonstrate mastery
-
-**Alternative Grading Approaches:**
-- Standards-based grading with specific proficiency levels
-- Portfolio assessment with student reflection
-- Mastery-based progression models
-- Narrative evaluation combined with performance indicators
-
-## Technology Integration in Assessment
-
-**Digital Assessment Tools:**
-- Automated feedback systems for basic skills
-- Digital portfolios for longitudinal evidence
-- Analytics to identify patterns across student performance
-- Adaptive assessment platforms for personalization
-
-**Technology Implementation Tips:**
-- Ensure accessibility for all students
-- Balance efficiency with assessment quality
-- Provide technology training before high-stakes assessment
-- Have backup plans for technology failures
-
-## Data Analysis and Instructional Response
-
-**Data Collection Systems:**
-- Tracking methods for individual student progress
-- Class-wide performance analysis techniques
-- Longitudinal data monitoring across units
-
-**Data-Based Decision Making:**
-- Identifying students needing intervention
-- Recognizing content requiring re-teaching
-- Adjusting instructional methods based on results
-- Curriculum refinement for future implementation
-
-Would you like specific examples or templates for any of these assessment components?
-"""
-                
-                else:
-                    response_text = """
-# Comprehensive Teaching Strategy Guide
-
-## Building an Effective Learning Environment
-
-**Classroom Climate Development:**
-- Establish clear expectations with student input
-- Create physical and emotional safety for risk-taking
-- Develop routines that maximize learning time
-- Build relationships through regular check-ins and personal connections
-
-**Student Engagement Foundations:**
-- Connect content to students' lives and interests
-- Incorporate student choice in topics, processes, and products
-- Use varied instructional formats to maintain attention
-- Implement appropriate challenge levels for productive struggle
-
-## Instructional Design Excellence
-
-**Learning Sequence Planning:**
-- Structure units with clear progression of complexity
-- Front-load vocabulary and background knowledge
-- Chunk information into manageable segments
-- Build in regular review and spiral back to key concepts
-
-**Effective Direct Instruction:**
-- Use clear, concise explanations with examples
-- Incorporate think-alouds to model expert thinking
-- Check for understanding frequently
-- Gradually release responsibility to students
-
-**Inquiry-Based Learning Implementation:**
-- Develop thought-provoking essential questions
-- Guide students through structured investigation processes
-- Teach explicit research and information evaluation skills
-- Facilitate meaning-making discussions to consolidate learning
-
-## Differentiation and Personalization
-
-**Readiness-Based Differentiation:**
-- Use pre-assessment to identify starting points
-- Implement tiered assignments for various levels
-- Provide additional scaffolding or extension as needed
-- Allow flexible pacing when appropriate
-
-**Interest and Learning Profile Differentiation:**
-- Offer content choice that addresses same standards
-- Provide multiple ways to engage with material
-- Allow for diverse expression methods
-- Create flexible environmental options
-
-**Supporting Diverse Learners:**
-- Implement research-based ELL strategies
-- Adapt materials while maintaining rigor
-- Collaborate with specialists for specific interventions
-- Use strengths-based approach for exceptional learners
-
-## Technology Integration
-
-**Purposeful Educational Technology:**
-- Select tools that enhance rather than replace quality teaching
-- Use technology to access resources not otherwise available
-- Implement digital tools for creation and collaboration
-- Provide options for demonstrating learning digitally
-
-**Digital Citizenship Development:**
-- Teach information literacy and source evaluation
-- Model appropriate online interaction
-- Address digital footprint awareness
-- Balance technology use with face-to-face interaction
-
-## Assessment for Learning
-
-**Formative Assessment Implementation:**
-- Embed checks for understanding throughout instruction
-- Use exit tickets to guide next-day planning
-- Implement peer and self-assessment with clear criteria
-- Provide specific, actionable feedback
-
-**Summative Assessment Design:**
-- Create authentic assessment opportunities
-- Align evaluation directly with learning objectives
-- Offer varied assessment formats
-- Use backward design from assessment to instruction
-
-## Professional Growth and Collaboration
-
-**Reflective Practice:**
-- Document lesson effectiveness systematically
-- Analyze student work for instructional implications
-- Seek and utilize feedback from colleagues
-- Stay current with educational research
-
-**Professional Learning Communities:**
-- Engage in collaborative planning
-- Participate in lesson study processes
-- Share resources and best practices
-- Analyze collective student data for improvement
-
-Would you like more specific strategies for any particular aspect of teaching?
-"""
-            
-            return {"response": response_text, "message": "Comprehensive educational assistant response"}, 200
-            
-        except requests.exceptions.RequestException as e:
-            logging.error(f"API request error: {str(e)}")
-            return {"error": f"API request failed: {str(e)}"}, 500
-            
+@cached_response
+@observe_ai_call
+def educational_assistant(prompt, role):
+    """
+    Provide educational assistance based on the user's role and prompt using GitHub Copilot
+    """
+    try:
+        response_text = ''.join(educational_assistant_chunks(prompt, role))
+        return {"response": response_text, "message": ASSISTANT_MESSAGE}, 200
     except Exception as e:
         logging.error(f"Error in educational_assistant: {str(e)}")
         return {"error": str(e)}, 500
+
+@observe_ai_stream
+def stream_educational_assistant(prompt, role):
+    """
+    Yield the answer as ("chunk", text) events while it is produced, then a
+    ("done", metadata) or ("error", details) event. Answers are cached and
+    reused exactly as for educational_assistant.
+    """
+    cached = response_cache.get(role, prompt)
+    if cached is not None:
+        yield "chunk", cached["response"]
+        yield "done", {"message": cached["message"], "cached": True}
+        return
+    
+    chunks = []
+    try:
+        for chunk in educational_assistant_chunks(prompt, role):
+            chunks.append(chunk)
+            yield "chunk", chunk
+    except Exception as e:
+        logging.error(f"Error in stream_educational_assistant: {str(e)}")
+        yield "error", {"error": str(e)}
+        return
+    
+    response_cache.put(role, prompt, {"response": ''.join(chunks), "message": ASSISTANT_MESSAGE})
+    yield "done", {"message": ASSISTANT_MESSAGE, "cached": False}
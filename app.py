@@ -1,10 +1,11 @@
 import os
 import logging
-from flask import Flask
+import tempfile
+import click
+from flask import Flask, Request
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_login import LoginManager
-from werkzeug.security import generate_password_hash
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -15,8 +16,16 @@ class Base(DeclarativeBase):
 # Initialize SQLAlchemy with the Base class
 db = SQLAlchemy(model_class=Base)
 
+class SpoolingRequest(Request):
+    """Keeps uploaded files in memory up to UPLOAD_SPOOL_MAX_MEMORY bytes, then on disk"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        max_size = app.config.get("UPLOAD_SPOOL_MAX_MEMORY", 500 * 1024)
+        return tempfile.SpooledTemporaryFile(max_size=max_size, mode="rb+")
+
 # Create the Flask application
 app = Flask(__name__)
+app.request_class = SpoolingRequest
 
 # Configure application secret key
 app.secret_key = os.environ.get("SESSION_SECRET")
@@ -28,7 +37,53 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
 }
 app.config["UPLOAD_FOLDER"] = "uploads"
+app.config["STORAGE_BACKEND"] = os.environ.get("STORAGE_BACKEND", "local")  # "local" (UPLOAD_FOLDER) or "s3"
+app.config["S3_BUCKET"] = os.environ.get("S3_BUCKET")
+app.config["S3_PREFIX"] = os.environ.get("S3_PREFIX", "")
+app.config["S3_ENDPOINT_URL"] = os.environ.get("S3_ENDPOINT_URL")  # e.g. http://localhost:9000 for MinIO
+app.config["S3_REGION"] = os.environ.get("S3_REGION")
+app.config["S3_PRESIGN_EXPIRES"] = int(os.environ.get("S3_PRESIGN_EXPIRES", 300))  # Seconds a download link stays valid
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max upload
+app.config["AUDIO_MAX_CONTENT_LENGTH"] = 512 * 1024 * 1024  # 512MB max recording, several hours of MP3
+app.config["UPLOAD_SPOOL_MAX_MEMORY"] = 1024 * 1024  # Bytes of each uploaded file kept in memory before spilling to disk
+app.config["CHUNKED_UPLOAD_PART_SIZE"] = 8 * 1024 * 1024  # Bytes per part of a resumable upload (S3 needs at least 5MB)
+app.config["CHUNKED_UPLOAD_MAX_SIZE"] = 4 * 1024 * 1024 * 1024  # 4GB max resumable upload
+app.config["CHUNKED_UPLOAD_EXPIRY"] = 24 * 3600  # Seconds before an unfinished upload is discarded
+app.config["MODULE_TEXT_MAX_CHARS"] = 1000000  # Text kept from each module file
+app.config["JOB_QUEUE_ENABLED"] = os.environ.get("JOB_QUEUE_ENABLED", "").lower() in ("1", "true", "yes")  # Needs `flask worker` running
+app.config["JOB_MAX_ATTEMPTS"] = 5
+app.config["JOB_RETRY_BACKOFF"] = 10  # Seconds before the first retry, doubled for each later one
+app.config["JOB_RETRY_BACKOFF_MAX"] = 3600
+app.config["JOB_VISIBILITY_TIMEOUT"] = 600  # Seconds before a job held by a silent worker is run again
+app.config["JOB_POLL_INTERVAL"] = 1  # Seconds an idle worker waits between queue checks
+app.config["DOWNLOAD_OFFLOAD"] = os.environ.get("DOWNLOAD_OFFLOAD")  # None, "x-accel-redirect" or "x-sendfile"
+app.config["DOWNLOAD_ACCEL_PREFIX"] = os.environ.get("DOWNLOAD_ACCEL_PREFIX", "/protected-uploads/")
+app.config["USE_X_SENDFILE"] = app.config["DOWNLOAD_OFFLOAD"] == "x-sendfile"
+app.config["ITEMS_PER_PAGE"] = 20
+app.config["MAX_ITEMS_PER_PAGE"] = 100
+app.config["NOTIFICATION_BACKGROUND_THRESHOLD"] = 500  # Recipients; None to always send inline
+app.config["ROSTER_CACHE_CHECK_INTERVAL"] = 5  # Seconds between roster version checks
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")  # e.g. "pbkdf2:sha256:600000"
+app.config["IDENTITY_CACHE_TTL"] = int(os.environ.get("IDENTITY_CACHE_TTL", 30))  # Seconds; 0 disables
+app.config["AI_API_BASE_URL"] = os.environ.get("AI_API_BASE_URL")  # OpenAI-compatible API; unset uses simulated answers
+app.config["AI_API_MODEL"] = os.environ.get("AI_API_MODEL", "github-copilot")
+app.config["AI_API_MAX_IN_FLIGHT"] = int(os.environ.get("AI_API_MAX_IN_FLIGHT", 8))  # Concurrent AI calls per worker
+app.config["AI_API_QUEUE_TIMEOUT"] = 5  # Seconds a call waits for a free slot before failing
+app.config["AI_API_CONNECT_TIMEOUT"] = 3.05
+app.config["AI_API_READ_TIMEOUT"] = 30  # Seconds without data from the AI service
+app.config["AI_API_MAX_RETRIES"] = 2
+app.config["AI_API_RETRY_BACKOFF"] = 0.5  # Seconds, doubled for each retry and jittered
+app.config["AI_API_CIRCUIT_FAILURES"] = 5  # Consecutive failures before calls are refused
+app.config["AI_API_CIRCUIT_RESET"] = 30  # Seconds before a refused service is tried again
+app.config["AI_API_TRANSCRIPTION_MODEL"] = os.environ.get("AI_API_TRANSCRIPTION_MODEL", "whisper-1")
+app.config["AUDIO_SEGMENT_SECONDS"] = 120  # Length of each piece of a long recording sent for transcription
+app.config["AUDIO_SEGMENT_OVERLAP"] = 2  # Seconds shared by neighbouring pieces so no word is cut in half
+app.config["AUDIO_TRANSCRIBE_WORKERS"] = 4  # Pieces of one recording transcribed at once
+app.config["AI_RESPONSE_CACHE_TTL"] = int(os.environ.get("AI_RESPONSE_CACHE_TTL", 600))  # Seconds; 0 disables
+app.config["AI_RESPONSE_CACHE_SIZE"] = 1024  # Responses kept per worker
+app.config["AI_RESPONSE_CACHE_SHARED"] = True  # Share responses between workers through the database
+app.config["ROSTER_IMPORT_CHUNK_SIZE"] = 500  # Rows per transaction
+app.config["ROSTER_IMPORT_WORKERS"] = None  # Password hashing processes; None uses every CPU
 
 # Initialize the database with the app
 db.init_app(app)
@@ -38,37 +93,50 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-# Create the uploads directory if it doesn't exist
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
-
-# Import models here to avoid circular imports
-with app.app_context():
-    # Import models after db is initialized
-    from models import User, Student, Teacher, Module, Attendance, Grade, Notification
-    db.create_all()
-    
-    # Check if there are any users, if not create admin
-    if not User.query.first():
-        admin = User(
-            username="admin",
-            email="admin@example.com",
-            role="admin",
-            password_hash=generate_password_hash("admin123")
-        )
-        db.session.add(admin)
-        db.session.commit()
-        logging.info("Admin user created")
+# Tables are created by `flask db upgrade` and the first admin by
+# `flask seed-admin`; importing the app touches neither the database nor disk
+import models
 
 # Register blueprints
 from auth import auth as auth_blueprint
 app.register_blueprint(auth_blueprint)
 
+# Register the schema migration commands (flask db upgrade)
+from migrations import db_cli, seed_admin_command
+app.cli.add_command(db_cli)
+app.cli.add_command(seed_admin_command)
+
+from summaries import rebuild_summaries_command
+app.cli.add_command(rebuild_summaries_command)
+
+# The importer is only loaded when the command or one of its jobs runs
+@app.cli.command('import-roster')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', type=int, default=None, help='Rows per transaction.')
+@click.option('--workers', type=int, default=None, help='Password hashing processes.')
+def import_roster_command(path, chunk_size, workers):
+    """Import student and teacher accounts from a CSV file."""
+    from roster_import import import_roster_file
+    import_roster_file(path, chunk_size=chunk_size, workers=workers)
+
+from uploads import gc_uploads_command
+app.cli.add_command(gc_uploads_command)
+
+from processing import process_modules_command
+app.cli.add_command(process_modules_command)
+
+from jobs import worker_command
+app.cli.add_command(worker_command)
+
+# Per-route latency, SQL and pool metrics exposed on /metrics
+import metrics
+metrics.init_app(app, db)
+
 # Add user loader callback for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    from identity import load_user_with_profile
+    return load_user_with_profile(int(user_id))
 
 # Import and register routes
 from routes import *
@@ -0,0 +1,77 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import Student, Attendance
+from summaries import attendance_changed
+
+def upsert_attendance(rows):
+    """
+    Insert or update attendance rows keyed on (student_id, date) with a single
+    statement. Each row is a dict with date, status, notes, student_id and
+    recorded_by. The caller is responsible for committing.
+    """
+    if not rows:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        insert = postgresql.insert
+    elif dialect == 'sqlite':
+        insert = sqlite.insert
+    else:
+        insert = None
+
+    if insert is None:
+        # Fall back to one merge per row on databases without ON CONFLICT
+        for row in rows:
+            existing = Attendance.query.filter_by(student_id=row['student_id'], date=row['date']).first()
+            if existing:
+                existing.status = row['status']
+                existing.notes = row['notes']
+                existing.recorded_by = row['recorded_by']
+            else:
+                db.session.add(Attendance(**row))
+        return
+
+    stmt = insert(Attendance.__table__).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['student_id', 'date'],
+        set_={
+            'status': stmt.excluded.status,
+            'notes': stmt.excluded.notes,
+            'recorded_by': stmt.excluded.recorded_by,
+        }
+    )
+    db.session.execute(stmt)
+
+def record_roll_call(teacher_id, date, entries):
+    """
+    Record attendance for a whole class in one transaction. `entries` is a list
+    of dicts with student_id, status and notes. Returns the number of rows
+    written; raises ValueError if any student does not exist.
+    """
+    # Later entries for the same student win, as they would with one POST each
+    rows_by_student = {}
+    for entry in entries:
+        rows_by_student[entry['student_id']] = {
+            'date': date,
+            'status': entry['status'],
+            'notes': entry.get('notes') or None,
+            'student_id': entry['student_id'],
+            'recorded_by': teacher_id,
+        }
+
+    student_ids = list(rows_by_student)
+    known_ids = {sid for (sid,) in db.session.query(Student.id).filter(Student.id.in_(student_ids))}
+    unknown_ids = set(student_ids) - known_ids
+    if unknown_ids:
+        raise ValueError(f"Unknown student ids: {', '.join(str(sid) for sid in sorted(unknown_ids))}")
+
+    try:
+        upsert_attendance(list(rows_by_student.values()))
+        attendance_changed(student_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return len(rows_by_student)
@@ -0,0 +1,215 @@
+import io
+import math
+import os
+import re
+import wave
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Bitrates in kbps by (MPEG-1?, layer), indexed by the header's bitrate bits
+MP3_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates by the header's version bits (MPEG-2.5, reserved, MPEG-2, MPEG-1)
+MP3_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+WORD_PATTERN = re.compile(r'\w+')
+MAX_WORDS_PER_SECOND = 4  # Faster than almost anyone speaks
+
+class Segment:
+    """A piece of a recording starting `start` seconds in"""
+
+    def __init__(self, index, start, data, file_name, content_type):
+        self.index = index
+        self.start = start
+        self.data = data  # Seekable file object
+        self.file_name = file_name
+        self.content_type = content_type
+
+def _wav_segments(stream, file_name, segment_seconds, overlap_seconds):
+    with wave.open(stream, 'rb') as source:
+        params = source.getparams()
+        rate = source.getframerate()
+        total = source.getnframes()
+        length = int(segment_seconds * rate)
+        step = max(length - int(overlap_seconds * rate), 1)
+
+        base, _ = os.path.splitext(file_name)
+        start = 0
+        index = 0
+        while True:
+            source.setpos(start)
+            data = io.BytesIO()
+            with wave.open(data, 'wb') as out:
+                out.setparams(params)
+                out.writeframes(source.readframes(length))
+            data.seek(0)
+            yield Segment(index, start / rate, data, f"{base}-{index}.wav", 'audio/wav')
+            if start + length >= total:
+                break
+            start += step
+            index += 1
+
+def _mp3_frame_length(header):
+    """Return (bytes, seconds) of the MP3 frame starting with `header`, or None if it is not a frame header"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 1
+    if layer == 1:
+        return (12 * bitrate // rate + padding) * 4, 384 / rate
+    samples = 1152 if mpeg1 or layer == 2 else 576
+    return samples // 8 * bitrate // rate + padding, samples / rate
+
+def _mp3_frames(stream):
+    """Yield (seconds, frame bytes) for each MP3 frame, skipping ID3 tags and junk"""
+    buffer = stream.read(10)
+    if buffer[:3] == b'ID3' and len(buffer) == 10:
+        # Tag size is a 28-bit "syncsafe" integer, plus a footer if flagged
+        size = (buffer[6] << 21) | (buffer[7] << 14) | (buffer[8] << 7) | buffer[9]
+        stream.seek(size + (10 if buffer[5] & 0x10 else 0), io.SEEK_CUR)
+        buffer = b''
+
+    position = 0
+    elapsed = 0.0
+    while True:
+        frame = _mp3_frame_length(buffer[position:position + 4])
+        if frame is not None and position + frame[0] <= len(buffer):
+            size, seconds = frame
+            yield elapsed, buffer[position:position + size]
+            position += size
+            elapsed += seconds
+            continue
+
+        if frame is None and len(buffer) - position >= 4:
+            # Lost sync: look for the next frame header
+            next_sync = buffer.find(b'\xff', position + 1)
+            position = next_sync if next_sync != -1 else len(buffer)
+            continue
+
+        # Need more data for this frame or its header
+        more = stream.read(64 * 1024)
+        if not more:
+            return
+        buffer = buffer[position:] + more
+        position = 0
+
+def _mp3_segments(stream, file_name, segment_seconds, overlap_seconds):
+    # Frames decode on their own, so segments are cut between frames
+    base, _ = os.path.splitext(file_name)
+    step = max(segment_seconds - overlap_seconds, 0.001)
+    start = 0.0
+    index = 0
+    frames = []
+    fresh = False  # Whether the current segment has anything the last one did not
+    for at, frame in _mp3_frames(stream):
+        if at >= start + segment_seconds:
+            yield Segment(index, start, io.BytesIO(b''.join(f for _, f in frames)), f"{base}-{index}.mp3", 'audio/mpeg')
+            start += step
+            index += 1
+            frames = [(t, f) for t, f in frames if t >= start]
+            fresh = False
+        frames.append((at, frame))
+        fresh = True
+    if fresh or index == 0:
+        yield Segment(index, start, io.BytesIO(b''.join(f for _, f in frames)), f"{base}-{index}.mp3", 'audio/mpeg')
+
+def split_audio(stream, file_name, content_type, segment_seconds, overlap_seconds):
+    """
+    Yield a seekable stream's recording as segments of `segment_seconds`,
+    each overlapping the previous one by `overlap_seconds`. Only a segment
+    at a time is held in memory. WAV and MP3 are split; anything else, and
+    recordings that cannot be parsed, are yielded whole without copying.
+    """
+    extension = os.path.splitext(file_name or '')[1].lower()
+    start = stream.tell()
+    if extension == '.wav':
+        segments = _wav_segments(stream, file_name, segment_seconds, overlap_seconds)
+    elif extension == '.mp3':
+        segments = _mp3_segments(stream, file_name, segment_seconds, overlap_seconds)
+    else:
+        segments = iter(())
+
+    # Anything that fails to parse before the first segment is sent whole
+    try:
+        first = next(segments, None)
+    except (wave.Error, EOFError):
+        first = None
+    if first is not None and first.data.getbuffer().nbytes:
+        yield first
+        yield from segments
+        return
+
+    stream.seek(start)
+    yield Segment(0, 0.0, stream, file_name, content_type)
+
+def transcribe_segments(segments, transcribe, workers):
+    """
+    Run `transcribe(segment)` for each segment on up to `workers` threads and
+    return the texts in order. Segments are read only as threads free up, so
+    at most `workers` of them are in memory at once.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transcribe') as executor:
+        pending = {}
+        segments = iter(segments)
+        while True:
+            # Wait for a free thread before reading the next segment
+            if len(pending) >= workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+            segment = next(segments, None)
+            if segment is None:
+                break
+            pending[executor.submit(transcribe, segment)] = segment.index
+        for future, index in pending.items():
+            results[index] = future.result()
+    return [results[index] for index in sorted(results)]
+
+def stitch_transcripts(texts, overlap_seconds, min_overlap_words=2):
+    """
+    Join the transcripts of segments that overlap by `overlap_seconds`,
+    dropping the words each one repeats from the end of the one before. Only
+    as many words as fit in the overlap are compared, and a repeat shorter
+    than `min_overlap_words` is taken to be a coincidence and kept.
+    """
+    # Fast speech plus a word cut in half at each edge of the overlap
+    max_overlap_words = math.ceil(overlap_seconds * MAX_WORDS_PER_SECOND) + 2
+    stitched = []
+    for text in texts:
+        words = text.split()
+        if stitched:
+            previous = [w.lower() for w in WORD_PATTERN.findall(' '.join(stitched[-max_overlap_words:]))]
+            current = [w.lower() for w in WORD_PATTERN.findall(' '.join(words[:max_overlap_words]))]
+            previous = previous[-max_overlap_words:]
+            current = current[:max_overlap_words]
+            overlap = 0
+            for size in range(min(len(previous), len(current)), min_overlap_words - 1, -1):
+                if previous[-size:] == current[:size]:
+                    overlap = size
+                    break
+            words = _drop_words(words, overlap)
+        stitched.extend(words)
+    return ' '.join(stitched)
+
+def _drop_words(words, count):
+    """Drop leading whitespace-separated words covering `count` normalized words"""
+    dropped = 0
+    for i, word in enumerate(words):
+        if dropped >= count:
+            return words[i:]
+        dropped += len(WORD_PATTERN.findall(word))
+    return []
@@ -23,6 +23,11 @@ def login():
         user = User.query.filter_by(username=form.username.data).first()
         
         if user and user.check_password(form.password.data):
+            # Move the stored hash to the configured algorithm and cost
+            if user.password_needs_rehash():
+                user.set_password(form.password.data)
+                db.session.commit()
+            
             login_user(user, remember=form.remember.data)
             next_page = request.args.get('next')
             
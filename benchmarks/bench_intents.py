@@ -0,0 +1,72 @@
+"""
+Time matching a prompt to an assistant topic as the number of topics grows,
+against a linear keyword scan over every topic like the one it replaced.
+
+    python benchmarks/bench_intents.py [--topics 10 100 1000] [--prompts 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intents import Topic, TopicIndex, load_topics
+
+def synthetic_topics(count):
+    """The shipped topics plus `count` made-up ones with their own keywords and stems"""
+    topics = list(load_topics().topics)
+    for i in range(count):
+        topics.append(Topic(
+            name=f"subject-{i}", role=random.choice(("student", "teacher")), title=f"Subject {i}",
+            response=f"About subject {i}", keywords=[f"subject{i}", f"topic{i}", f"area{i}"],
+            stems=[f"subj{i}x"], order=100 + i
+        ))
+    return topics
+
+def linear_match(topics, prompt, role):
+    keywords = prompt.lower().split()
+    for topic in topics:
+        if topic.role == role and any(word in keywords for word in topic.keywords):
+            return topic
+    return None
+
+def make_prompts(count, topic_count):
+    words = "how do I explain this idea to my class with a worked example please".split()
+    prompts = []
+    for _ in range(count):
+        prompt = random.sample(words, 8)
+        # Half the prompts mention a subject, most of them far down the list
+        if random.random() < 0.5:
+            prompt.append(f"topic{random.randrange(topic_count)}")
+        prompts.append(" ".join(prompt))
+    return prompts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--topics", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--prompts", type=int, default=2000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    print(f"{'topics':>8} {'linear us/prompt':>18} {'index us/prompt':>17}")
+    for count in args.topics:
+        topics = synthetic_topics(count)
+        index = TopicIndex(topics)
+        prompts = make_prompts(args.prompts, count)
+
+        start = time.perf_counter()
+        for prompt in prompts:
+            linear_match(topics, prompt, "teacher")
+        linear = (time.perf_counter() - start) / len(prompts)
+
+        start = time.perf_counter()
+        for prompt in prompts:
+            index.match(prompt, "teacher")
+        indexed = (time.perf_counter() - start) / len(prompts)
+
+        print(f"{len(topics):>8} {linear * 1e6:>18.1f} {indexed * 1e6:>17.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Measure how many password checks (logins) per second one worker can do for
+each password hashing setting, to size capacity against a security target.
+
+    python benchmarks/bench_password_hashing.py [--seconds 2] [--methods scrypt pbkdf2:sha256:600000 ...]
+
+Each check runs on a single core, as it does on a gunicorn sync worker.
+"""
+import argparse
+import time
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHODS = [
+    'scrypt:32768:8:1',
+    'scrypt:16384:8:1',
+    'pbkdf2:sha256:1000000',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:260000',
+]
+
+def logins_per_second(method, seconds):
+    password_hash = generate_password_hash('correct horse battery staple', method=method)
+    checks = 0
+    start = time.perf_counter()
+    while True:
+        check_password_hash(password_hash, 'correct horse battery staple')
+        checks += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return checks / elapsed, password_hash.split('$', 1)[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=2.0, help='Time spent on each method')
+    parser.add_argument('--methods', nargs='+', default=DEFAULT_METHODS)
+    args = parser.parse_args()
+
+    print(f"{'method':<28} {'logins/s/worker':>16} {'ms/login':>10}")
+    for method in args.methods:
+        rate, canonical = logins_per_second(method, args.seconds)
+        print(f"{canonical:<28} {rate:>16.1f} {1000 / rate:>10.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare recording attendance for a class one student per request (the
+original teacher_attendance path) with the set-based roll call.
+
+    python benchmarks/bench_roll_call.py [--students 35] [--days 20]
+
+Uses a temporary SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("SESSION_SECRET", "bench")
+
+import logging
+logging.disable(logging.INFO)
+
+from app import app, db
+from models import User, Student, Teacher, Attendance
+from attendance import record_roll_call
+from migrations import upgrade
+from summaries import attendance_changed
+
+def create_class(size):
+    teacher_user = User(username="bench_teacher", email="bench_teacher@example.com", role="teacher", password_hash="x")
+    db.session.add(teacher_user)
+    db.session.flush()
+    teacher = Teacher(first_name="Bench", last_name="Teacher", user_id=teacher_user.id)
+    db.session.add(teacher)
+
+    students = []
+    for i in range(size):
+        user = User(username=f"bench_student_{i}", email=f"bench_student_{i}@example.com", role="student", password_hash="x")
+        db.session.add(user)
+        db.session.flush()
+        student = Student(first_name="Bench", last_name=f"Student {i}", user_id=user.id, grade_level="bench")
+        db.session.add(student)
+        students.append(student)
+
+    db.session.commit()
+    return teacher, [s.id for s in students]
+
+def per_student(teacher_id, day, student_ids):
+    """
+    The original path: one SELECT, one write, a summary refresh and one
+    commit per student, as one request per student would do
+    """
+    for student_id in student_ids:
+        existing_record = Attendance.query.filter_by(student_id=student_id, date=day).first()
+        if existing_record:
+            existing_record.status = "late"
+            existing_record.notes = None
+            existing_record.recorded_by = teacher_id
+        else:
+            db.session.add(Attendance(date=day, status="present", notes=None, student_id=student_id, recorded_by=teacher_id))
+        db.session.flush()
+        # record_roll_call refreshes the dashboard summaries too, so both paths do the same work
+        attendance_changed([student_id])
+        db.session.commit()
+
+def roll_call(teacher_id, day, student_ids, status):
+    record_roll_call(teacher_id, day, [{"student_id": sid, "status": status, "notes": None} for sid in student_ids])
+
+def timed(func, days):
+    start = time.perf_counter()
+    for day in days:
+        func(day)
+    return (time.perf_counter() - start) / len(days)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--students", type=int, default=35)
+    parser.add_argument("--days", type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        # Importing the app no longer creates tables
+        upgrade()
+        teacher, student_ids = create_class(args.students)
+        base = date(2000, 1, 1)
+        days_a = [base + timedelta(days=i) for i in range(args.days)]
+        days_b = [base + timedelta(days=args.days + i) for i in range(args.days)]
+
+        results = [
+            ("per-student insert", timed(lambda d: per_student(teacher.id, d, student_ids), days_a)),
+            ("per-student update", timed(lambda d: per_student(teacher.id, d, student_ids), days_a)),
+            ("roll call insert", timed(lambda d: roll_call(teacher.id, d, student_ids, "present"), days_b)),
+            ("roll call update", timed(lambda d: roll_call(teacher.id, d, student_ids, "late"), days_b)),
+        ]
+        dialect = db.engine.dialect.name
+
+    print(f"{args.students} students, {args.days} days ({dialect})")
+    for name, seconds in results:
+        print(f"  {name:<20} {seconds * 1000:8.2f} ms per class")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Measure cold start: the time from launching a web server process to its
+first served request, as a new autoscale instance experiences it, and the
+part of it spent importing the application.
+
+    python benchmarks/bench_startup.py [--runs 5] [--server gunicorn|flask]
+
+Uses DATABASE_URL when set; otherwise a temporary SQLite database is created
+and upgraded before timing starts.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def server_command(server, port):
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', '1', 'main:app']
+    return [sys.executable, '-m', 'flask', '--app', 'main', 'run', '--port', str(port)]
+
+def first_request_seconds(server, env, timeout=60):
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(server_command(server, port), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1)
+                return time.perf_counter() - start
+            except urllib.error.HTTPError:
+                # Any HTTP response, even an error page, means a request was served
+                return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.01)
+        raise RuntimeError(f"{server} did not answer within {timeout} seconds")
+    finally:
+        process.terminate()
+        process.wait()
+
+def import_seconds(env):
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)'
+    ], cwd=ROOT, env=env, stderr=subprocess.DEVNULL)
+    return float(output.decode().strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--server', choices=['gunicorn', 'flask'], default='gunicorn')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('SESSION_SECRET', 'bench')
+    if not env.get('DATABASE_URL'):
+        env['DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+        subprocess.check_call([sys.executable, '-m', 'flask', '--app', 'main', 'db', 'upgrade'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    imports = [import_seconds(env) for _ in range(args.runs)]
+    starts = [first_request_seconds(args.server, env) for _ in range(args.runs)]
+
+    print(f"{'measure':<28} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+    for name, values in (('import main', imports), (f'{args.server} first request', starts)):
+        print(f"{name:<28} {statistics.median(values) * 1000:>10.1f} "
+              f"{min(values) * 1000:>10.1f} {max(values) * 1000:>10.1f}")
+
+if __name__ == '__main__':
+    main()
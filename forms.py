@@ -1,7 +1,20 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, SelectField, TextAreaField, DateField, FloatField, FileField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError
+from wtforms import Form, StringField, PasswordField, BooleanField, SubmitField, SelectField, TextAreaField, DateField, FloatField, FileField, IntegerField, FieldList, FormField, SelectMultipleField
+from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, ValidationError
 from models import User
+from roster import roster_cache
+
+class RosterStudent:
+    """Check submitted student ids against the cached roster instead of a list of choices"""
+
+    def __init__(self, message='Unknown student.'):
+        self.message = message
+
+    def __call__(self, form, field):
+        student_ids = field.data if isinstance(field.data, list) else [field.data]
+        for student_id in student_ids:
+            if student_id is not None and roster_cache.get(student_id) is None:
+                raise ValidationError(self.message)
 
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
@@ -88,7 +101,7 @@ class ModuleForm(FlaskForm):
     submit = SubmitField('Upload Module')
 
 class GradeForm(FlaskForm):
-    student = SelectField('Student', coerce=int, validators=[DataRequired()])
+    student = IntegerField('Student', validators=[DataRequired(), RosterStudent()])
     module = SelectField('Module', coerce=int, validators=[DataRequired()])
     score = FloatField('Score', validators=[DataRequired()])
     max_score = FloatField('Maximum Score', validators=[DataRequired()])
@@ -96,7 +109,7 @@ class GradeForm(FlaskForm):
     submit = SubmitField('Submit Grade')
 
 class AttendanceForm(FlaskForm):
-    student = SelectField('Student', coerce=int, validators=[DataRequired()])
+    student = IntegerField('Student', validators=[DataRequired(), RosterStudent()])
     date = DateField('Date', validators=[DataRequired()])
     status = SelectField('Status', choices=[
         ('present', 'Present'),
@@ -106,12 +119,66 @@ class AttendanceForm(FlaskForm):
     notes = TextAreaField('Notes')
     submit = SubmitField('Record Attendance')
 
+class RollCallEntryForm(Form):
+    student_id = IntegerField('Student', validators=[DataRequired()])
+    status = SelectField('Status', choices=[
+        ('present', 'Present'),
+        ('absent', 'Absent'),
+        ('late', 'Late')
+    ], validators=[DataRequired()])
+    notes = StringField('Notes')
+
+class RollCallForm(FlaskForm):
+    date = DateField('Date', validators=[DataRequired()])
+    entries = FieldList(FormField(RollCallEntryForm), validators=[Length(min=1)])
+    submit = SubmitField('Record Roll Call')
+
 class NotificationForm(FlaskForm):
     title = StringField('Title', validators=[DataRequired(), Length(max=128)])
     message = TextAreaField('Message', validators=[DataRequired()])
-    student = SelectField('Student', coerce=int, validators=[DataRequired()])
+    audience = SelectField('Send To', choices=[
+        ('student', 'A Single Student'),
+        ('students', 'Selected Students'),
+        ('grade', 'A Grade Level'),
+        ('all', 'All Students')
+    ], default='student')
+    student = IntegerField('Student', validators=[Optional(), RosterStudent()])
+    students = SelectMultipleField('Students', coerce=int, choices=[], validate_choice=False, validators=[Optional(), RosterStudent()])
+    grade_level = SelectField('Grade Level', choices=[
+        ('', 'Select Grade Level'),
+        ('1', 'Grade 1'),
+        ('2', 'Grade 2'),
+        ('3', 'Grade 3'),
+        ('4', 'Grade 4'),
+        ('5', 'Grade 5'),
+        ('6', 'Grade 6'),
+        ('7', 'Grade 7'),
+        ('8', 'Grade 8'),
+        ('9', 'Grade 9'),
+        ('10', 'Grade 10'),
+        ('11', 'Grade 11'),
+        ('12', 'Grade 12')
+    ], validators=[Optional()])
     submit = SubmitField('Send Notification')
 
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+
+        # Each audience needs its own target field
+        required = {
+            'student': (self.student, 'Please select a student.'),
+            'students': (self.students, 'Please select at least one student.'),
+            'grade': (self.grade_level, 'Please select a grade level.'),
+        }
+        if self.audience.data in required:
+            field, message = required[self.audience.data]
+            if not field.data:
+                field.errors.append(message)
+                return False
+
+        return True
+
 class AIAssistantForm(FlaskForm):
     prompt = TextAreaField('Your Question', validators=[DataRequired()])
     submit = SubmitField('Ask AI Assistant')
@@ -0,0 +1,79 @@
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+from app import db
+from models import User, Student, Teacher
+
+class IdentityCache:
+    """
+    Per-worker cache of detached User objects with their profile loaded, kept
+    for IDENTITY_CACHE_TTL seconds. Each request gets its own session-bound
+    copy through a no-SQL merge. Profile counters that are updated in bulk
+    (such as unread notifications) may lag; read them with populate_existing.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            self.discard(user_id)
+            return None
+        return user
+
+    def put(self, user_id, user, ttl):
+        with self.lock:
+            self.entries[user_id] = (time.monotonic() + ttl, user)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+identity_cache = IdentityCache()
+
+def load_user_with_profile(user_id):
+    """Load a user and their student or teacher profile in one query"""
+    ttl = current_app.config.get('IDENTITY_CACHE_TTL', 0)
+
+    if ttl:
+        cached = identity_cache.get(user_id)
+        if cached is not None:
+            return db.session.merge(cached, load=False)
+
+    user = User.query.options(
+        joinedload(User.student),
+        joinedload(User.teacher)
+    ).filter_by(id=user_id).first()
+
+    if user is None or not ttl:
+        return user
+
+    # Keep a detached copy for later requests and hand this one a bound copy
+    db.session.expunge(user)
+    identity_cache.put(user_id, user, ttl)
+    return db.session.merge(user, load=False)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    identity_cache.discard(target.id)
+
+@event.listens_for(Student, 'after_insert')
+@event.listens_for(Student, 'after_update')
+@event.listens_for(Student, 'after_delete')
+@event.listens_for(Teacher, 'after_insert')
+@event.listens_for(Teacher, 'after_update')
+@event.listens_for(Teacher, 'after_delete')
+def _profile_changed(mapper, connection, target):
+    identity_cache.discard(target.user_id)
@@ -0,0 +1,109 @@
+import os
+import re
+from collections import defaultdict
+
+# One Markdown file per topic: a header between --- lines, then the response
+TOPICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assistant_topics')
+WORD_PATTERN = re.compile(r'\w+')
+ROLES = ('student', 'teacher')
+
+class Topic:
+    """A subject the educational assistant recognizes, with the answer it gives"""
+
+    def __init__(self, name, role, title, response, keywords=(), stems=(), order=0, default=False):
+        self.name = name
+        self.role = role
+        self.title = title
+        self.response = response
+        self.keywords = frozenset(keywords)
+        self.stems = frozenset(stems)
+        self.order = order
+        self.default = default
+
+    def __repr__(self):
+        return f'<Topic {self.role}/{self.name}>'
+
+def _split_list(value):
+    return [item.strip().lower() for item in value.split(',') if item.strip()]
+
+def parse_topic(path):
+    """Read a topic file; raises ValueError if its header is malformed"""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+
+    if not text.startswith('---\n') or '\n---\n' not in text[3:]:
+        raise ValueError(f"{path}: missing --- header")
+    header, response = text[4:].split('\n---\n', 1)
+
+    fields = {}
+    for line in header.splitlines():
+        key, sep, value = line.partition(':')
+        if not sep:
+            raise ValueError(f"{path}: bad header line {line!r}")
+        fields[key.strip().lower()] = value.strip()
+
+    role = fields.get('role')
+    if role not in ROLES:
+        raise ValueError(f"{path}: role must be one of {', '.join(ROLES)}")
+
+    return Topic(
+        name=os.path.splitext(os.path.basename(path))[0],
+        role=role,
+        title=fields.get('title', ''),
+        response=response,
+        keywords=_split_list(fields.get('keywords', '')),
+        stems=_split_list(fields.get('stems', '')),
+        order=int(fields.get('order', 0)),
+        default=fields.get('default', '').lower() == 'true'
+    )
+
+class TopicIndex:
+    """
+    Inverted index from prompt words to topics. Keywords are looked up whole
+    and stems by the prefixes of each word, so matching a prompt costs the
+    same however many topics there are.
+    """
+
+    def __init__(self, topics):
+        self.topics = list(topics)
+        self.keywords = defaultdict(list)  # (role, word) -> topics
+        self.stems = defaultdict(list)  # (role, stem) -> topics
+        self.defaults = {}
+        for topic in self.topics:
+            for keyword in topic.keywords:
+                self.keywords[(topic.role, keyword)].append(topic)
+            for stem in topic.stems:
+                self.stems[(topic.role, stem)].append(topic)
+            if topic.default:
+                if topic.role in self.defaults:
+                    raise ValueError(f"More than one default topic for {topic.role}s")
+                self.defaults[topic.role] = topic
+        # Only prefixes as long as some stem can match
+        self.stem_lengths = sorted({len(stem) for _, stem in self.stems})
+
+    def match(self, prompt, role):
+        """Return the topic sharing the most words with the prompt, or the role's default topic"""
+        scores = defaultdict(int)
+        for word in set(WORD_PATTERN.findall(prompt.lower())):
+            matched = set(self.keywords.get((role, word), ()))
+            for length in self.stem_lengths:
+                if length > len(word):
+                    break
+                matched.update(self.stems.get((role, word[:length]), ()))
+            for topic in matched:
+                scores[topic] += 1
+
+        if not scores:
+            return self.defaults.get(role)
+        # Ties go to the topic with the lowest order
+        return min(scores, key=lambda topic: (-scores[topic], topic.order, topic.name))
+
+def load_topics(directory=TOPICS_DIR):
+    """Build the topic index from every .md file in `directory`"""
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.md')
+    )
+    return TopicIndex(parse_topic(path) for path in paths)
+
+# Built once per process, when the assistant is first imported
+topic_index = load_topics()
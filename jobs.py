@@ -0,0 +1,278 @@
+import importlib
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, or_, select, update
+from app import db
+from models import Job
+
+# Registered job handlers by name; each takes the job's payload as keyword arguments
+HANDLERS = {}
+
+# Modules registering handlers that are imported only when one of their jobs
+# is submitted or run, rather than by every web worker at startup
+LAZY_HANDLERS = {
+    'import_roster': 'roster_import',
+}
+
+# Runs jobs in this process when the durable queue is turned off
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='jobs')
+
+def job_handler(name, max_attempts=None):
+    """Register a function that can be run as a background job called `name`"""
+    def decorator(func):
+        func.max_attempts = max_attempts
+        HANDLERS[name] = func
+        return func
+    return decorator
+
+def get_handler(name):
+    """Return the handler for job `name`, importing its module if needed, or None"""
+    if name not in HANDLERS and name in LAZY_HANDLERS:
+        importlib.import_module(LAZY_HANDLERS[name])
+    return HANDLERS.get(name)
+
+def enqueue(name, payload, created_by=None, max_attempts=None, delay=0):
+    """
+    Add a job to the durable queue. The job runs once this session commits;
+    the caller is responsible for committing.
+    """
+    handler = get_handler(name)
+    if handler is None:
+        raise ValueError(f"Unknown job {name}")
+
+    job = Job(
+        name=name,
+        payload=payload,
+        status='queued',
+        max_attempts=max_attempts or handler.max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        created_by=created_by
+    )
+    db.session.add(job)
+    return job
+
+def _run_in_thread(app, name, payload):
+    with app.app_context():
+        try:
+            get_handler(name)(**payload)
+        except Exception as e:
+            logging.error(f"Error in background job {name}: {str(e)}")
+
+def _run_claimed_in_thread(app, job_id, worker_id):
+    with app.app_context():
+        try:
+            run_job(db.session.get(Job, job_id), worker_id)
+        finally:
+            db.session.remove()
+
+def submit(name, payload, created_by=None, track=False):
+    """
+    Run a job off the request path. With JOB_QUEUE_ENABLED the job is stored
+    and committed for `flask worker` to pick up, and its id is returned;
+    otherwise it runs once on a thread in this process and None is returned.
+    With `track` the job is stored either way, claimed by that thread when
+    there is no queue, so its status and result can be looked up by id.
+    """
+    if current_app.config.get('JOB_QUEUE_ENABLED'):
+        job = enqueue(name, payload, created_by=created_by)
+        db.session.commit()
+        return job.id
+
+    if get_handler(name) is None:
+        raise ValueError(f"Unknown job {name}")
+    app = current_app._get_current_object()
+    if not track:
+        _executor.submit(_run_in_thread, app, name, payload)
+        return None
+
+    job = enqueue(name, payload, created_by=created_by)
+    now = datetime.utcnow()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:thread"
+    job.status = 'running'
+    job.attempts = 1
+    job.locked_by = worker_id
+    job.locked_until = now + timedelta(seconds=current_app.config['JOB_VISIBILITY_TIMEOUT'])
+    job.started_at = now
+    db.session.commit()
+    _executor.submit(_run_claimed_in_thread, app, job.id, worker_id)
+    return job.id
+
+def claim_job(worker_id):
+    """
+    Claim the next job that is due, or whose previous worker let its
+    visibility timeout lapse. Commits and returns the job, or None.
+    """
+    now = datetime.utcnow()
+    expired = and_(Job.status == 'running', Job.locked_until < now)
+
+    # A job whose worker keeps dying is given up once it is out of attempts
+    db.session.execute(
+        update(Job)
+        .where(expired, Job.attempts >= Job.max_attempts)
+        .values(status='failed', last_error='Timed out', locked_by=None, locked_until=None, finished_at=now)
+        .execution_options(synchronize_session=False)
+    )
+
+    due = or_(and_(Job.status == 'queued', Job.run_at <= now), expired)
+    # PostgreSQL hands each worker a different row; elsewhere the
+    # conditional UPDATE below settles races
+    candidate_id = db.session.execute(
+        select(Job.id).where(due).order_by(Job.run_at, Job.id).limit(1).with_for_update(skip_locked=True)
+    ).scalar()
+    if candidate_id is None:
+        db.session.commit()
+        return None
+
+    timeout = current_app.config['JOB_VISIBILITY_TIMEOUT']
+    claimed = db.session.execute(
+        update(Job)
+        .where(Job.id == candidate_id, due)
+        .values(
+            status='running',
+            attempts=Job.attempts + 1,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=timeout),
+            started_at=now
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+
+    return db.session.get(Job, candidate_id) if claimed else None
+
+def backoff_seconds(attempts):
+    """Exponential backoff with jitter before retry number `attempts`"""
+    base = current_app.config['JOB_RETRY_BACKOFF']
+    delay = min(base * 2 ** (attempts - 1), current_app.config['JOB_RETRY_BACKOFF_MAX'])
+    return delay * random.uniform(0.5, 1.0)
+
+def run_job(job, worker_id):
+    """
+    Run a job claimed by `worker_id` and record its result, scheduling a
+    retry on failure. Nothing is recorded if the claim lapsed and another
+    worker took the job over meanwhile; the job is then left to that worker.
+    """
+    job_id, name, attempts, max_attempts = job.id, job.name, job.attempts, job.max_attempts
+    # Each claim bumps the attempts, so they identify this claim with the worker
+    claimed = and_(Job.id == job_id, Job.status == 'running', Job.locked_by == worker_id,
+                   Job.attempts == attempts)
+    handler = get_handler(name)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job {name}")
+        result = handler(**(job.payload or {}))
+    except Exception as e:
+        db.session.rollback()
+        values = {
+            'last_error': ''.join(traceback.format_exception_only(type(e), e)).strip()[:2000],
+            'locked_by': None,
+            'locked_until': None
+        }
+        failed = handler is None or attempts >= max_attempts
+        if failed:
+            values.update(status='failed', finished_at=datetime.utcnow())
+        else:
+            values.update(status='queued', run_at=datetime.utcnow() + timedelta(seconds=backoff_seconds(attempts)))
+        recorded = _record(claimed, values)
+
+        if not recorded:
+            logging.warning(f"Job {job_id} ({name}) failed after its claim lapsed; left to its new worker: {str(e)}")
+        elif failed:
+            logging.error(f"Job {job_id} ({name}) failed after {attempts} attempts: {str(e)}")
+        else:
+            logging.warning(f"Job {job_id} ({name}) attempt {attempts} failed, retrying: {str(e)}")
+        return False
+
+    recorded = _record(claimed, {
+        'status': 'done',
+        'result': result,
+        'last_error': None,
+        'locked_by': None,
+        'locked_until': None,
+        'finished_at': datetime.utcnow()
+    })
+    if not recorded:
+        logging.warning(f"Job {job_id} ({name}) finished after its claim lapsed; its result was not recorded")
+    return recorded
+
+def _record(claimed, values):
+    """Update the job if this worker still holds its claim; commits and returns whether it did"""
+    updated = db.session.execute(
+        update(Job).where(claimed).values(**values).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return updated == 1
+
+def work(worker_id, stop=lambda: False, burst=False):
+    """Claim and run jobs until `stop()` is true, or the queue is empty in burst mode"""
+    poll_interval = current_app.config['JOB_POLL_INTERVAL']
+    processed = 0
+    while not stop():
+        job = claim_job(worker_id)
+        if job is None:
+            db.session.remove()
+            if burst:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        logging.info(f"Worker {worker_id} running job {job.id} ({job.name}), attempt {job.attempts}")
+        run_job(job, worker_id)
+        db.session.remove()
+        processed += 1
+    return processed
+
+def _worker_process(app, index):
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+
+    with app.app_context():
+        # Connections inherited from the parent must not be shared
+        db.engine.dispose(close=False)
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        logging.info(f"Worker {worker_id} started")
+        work(worker_id, stop=lambda: bool(stopping))
+        logging.info(f"Worker {worker_id} stopped")
+
+@click.command('worker')
+@click.option('--processes', '-n', default=2, show_default=True, help='Number of worker processes.')
+@click.option('--burst', is_flag=True, help='Run the jobs that are due, then exit.')
+@with_appcontext
+def worker_command(processes, burst):
+    """Run background jobs from the database queue."""
+    if burst:
+        count = work(f"{socket.gethostname()}:{os.getpid()}", burst=True)
+        click.echo(f"Ran {count} jobs.")
+        return
+
+    # Forked workers share the loaded app instead of importing it again
+    app = current_app._get_current_object()
+    context = multiprocessing.get_context('fork')
+    workers = [
+        context.Process(target=_worker_process, args=(app, index), name=f'worker-{index}')
+        for index in range(processes)
+    ]
+    for process in workers:
+        process.start()
+
+    def stop_workers(signum, frame):
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    for process in workers:
+        process.join()
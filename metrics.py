@@ -0,0 +1,237 @@
+import functools
+import hmac
+import os
+import threading
+import time
+from flask import Response, abort, g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, *labels):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            values = list(self.values.items())
+        for labels, value in sorted(values):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def observe(self, value, *labels):
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            values = [(labels, (list(b), s, c)) for labels, (b, s, c) in self.values.items()]
+        for labels, (bucket_counts, total, count) in sorted(values):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                le_labels = _labels(self.labelnames + ('le',), labels + (_number(bound),))
+                lines.append(f"{self.name}_bucket{le_labels} {cumulative}")
+            inf_labels = _labels(self.labelnames + ('le',), labels + ('+Inf',))
+            lines.append(f"{self.name}_bucket{inf_labels} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method', 'status')
+)
+SQL_STATEMENTS = Counter(
+    'sql_statements_total', 'SQL statements executed, by endpoint.', ('endpoint',)
+)
+SQL_TIME = Counter(
+    'sql_statement_seconds_total', 'Time spent executing SQL statements, by endpoint.', ('endpoint',)
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a connection from the pool.',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+AI_CALL_DURATION = Histogram(
+    'ai_helper_duration_seconds', 'AI helper call duration by helper and status.', ('helper', 'status')
+)
+AI_STREAM_FIRST_CHUNK = Histogram(
+    'ai_helper_first_chunk_seconds', 'Time until a streaming AI helper produced its first chunk.', ('helper',)
+)
+AI_UPSTREAM_REQUESTS = Counter(
+    'ai_upstream_requests_total', 'Calls to the AI service by outcome (ok, retry, error, busy, circuit_open).', ('outcome',)
+)
+AI_RESPONSE_CACHE = Counter(
+    'ai_response_cache_lookups_total', 'AI assistant response cache lookups by tier and result.', ('tier', 'result')
+)
+
+REGISTRY = [REQUEST_LATENCY, SQL_STATEMENTS, SQL_TIME, POOL_CHECKOUT_WAIT, AI_CALL_DURATION, AI_STREAM_FIRST_CHUNK,
+            AI_UPSTREAM_REQUESTS, AI_RESPONSE_CACHE]
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'background'
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own context, so a statement that fails leaves nothing behind
+    if context is not None:
+        context.metrics_start = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'metrics_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    endpoint = _current_endpoint()
+    SQL_STATEMENTS.inc(1, endpoint)
+    SQL_TIME.inc(elapsed, endpoint)
+
+def _instrument_pool(pool):
+    # The pool has no "before checkout" event, so time its internal getter
+    do_get = getattr(pool, '_do_get', None)
+    if do_get is None or getattr(do_get, 'metrics_timed', False):
+        return
+
+    @functools.wraps(do_get)
+    def timed_do_get():
+        start = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+    timed_do_get.metrics_timed = True
+    pool._do_get = timed_do_get
+
+def _pool_replaced(engine):
+    # dispose() swaps in a new pool, as forked workers do, so time that one too
+    _instrument_pool(engine.pool)
+
+def observe_ai_call(func):
+    """Record the duration and status code of an AI helper returning (result, status)"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        status = 500
+        try:
+            result = func(*args, **kwargs)
+            if isinstance(result, tuple) and len(result) == 2:
+                status = result[1]
+            return result
+        finally:
+            AI_CALL_DURATION.observe(time.perf_counter() - start, func.__name__, str(status))
+    return wrapper
+
+def observe_ai_stream(func):
+    """
+    Record the time to the first chunk, and the duration and outcome, of a
+    streaming AI helper that yields (event, data) pairs
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        status = '499'  # The client went away before the stream finished
+        first_chunk = True
+        try:
+            for event, data in func(*args, **kwargs):
+                if event == 'chunk' and first_chunk:
+                    AI_STREAM_FIRST_CHUNK.observe(time.perf_counter() - start, func.__name__)
+                    first_chunk = False
+                elif event == 'done':
+                    status = '200'
+                elif event == 'error':
+                    status = '500'
+                yield event, data
+        except Exception:
+            status = '500'
+            raise
+        finally:
+            AI_CALL_DURATION.observe(time.perf_counter() - start, func.__name__, status)
+    return wrapper
+
+def _authorized():
+    token = os.environ.get('METRICS_TOKEN')
+    if token:
+        header = request.headers.get('Authorization', '')
+        if hmac.compare_digest(header, f'Bearer {token}'):
+            return True
+    return current_user.is_authenticated and current_user.is_admin()
+
+def init_app(app, db):
+    """Register request timing, pool instrumentation and the /metrics endpoint"""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - start,
+                request.endpoint or 'unmatched',
+                request.method,
+                str(response.status_code)
+            )
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        # Metrics are kept per worker process; each scrape reports the worker that served it
+        if not _authorized():
+            abort(403)
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    with app.app_context():
+        _instrument_pool(db.engine.pool)
+        event.listen(db.engine, 'engine_disposed', _pool_replaced)
@@ -0,0 +1,258 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime
+import click
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import inspect, select, text
+from app import db
+
+# Versions that have already been applied to this database
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('description', db.String(256), nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False, default=datetime.utcnow)
+)
+
+MIGRATIONS = []
+
+def migration(version, description):
+    """
+    Register a schema migration. Migrations are applied in version order,
+    each one in its own transaction, and must be safe to run against a schema
+    that `db.create_all()` has already brought up to date. A migration may
+    return a function, which is called only once its transaction has committed.
+    """
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+@migration(1, 'Composite indexes for the hot query shapes')
+def add_composite_indexes(conn):
+    # Keep only the latest attendance row per student and date so the
+    # unique index backing the attendance upsert can be built
+    conn.execute(text(
+        "DELETE FROM attendances WHERE id NOT IN "
+        "(SELECT MAX(id) FROM attendances GROUP BY student_id, date)"
+    ))
+
+    statements = [
+        "CREATE INDEX IF NOT EXISTS ix_grades_student_id_date ON grades (student_id, date)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_attendances_student_id_date ON attendances (student_id, date)",
+        "CREATE INDEX IF NOT EXISTS ix_attendances_recorded_by_date ON attendances (recorded_by, date)",
+        "CREATE INDEX IF NOT EXISTS ix_notifications_student_id_read_date ON notifications (student_id, read, date)",
+        "CREATE INDEX IF NOT EXISTS ix_notifications_sender_id_date ON notifications (sender_id, date)",
+        "CREATE INDEX IF NOT EXISTS ix_modules_grade_level_created_at ON modules (grade_level, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_modules_teacher_id_created_at ON modules (teacher_id, created_at)",
+    ]
+    for statement in statements:
+        conn.execute(text(statement))
+
+@migration(2, 'Denormalized unread notification counter on students')
+def add_unread_notifications_counter(conn):
+    if not column_exists(conn, 'students', 'unread_notifications'):
+        conn.execute(text(
+            "ALTER TABLE students ADD COLUMN unread_notifications INTEGER NOT NULL DEFAULT 0"
+        ))
+
+    conn.execute(text(
+        "UPDATE students SET unread_notifications = "
+        "(SELECT COUNT(*) FROM notifications "
+        "WHERE notifications.student_id = students.id AND NOT notifications.read)"
+    ))
+
+@migration(3, 'Content-addressed module uploads')
+def store_uploads_by_content(conn):
+    from flask import current_app
+    from storage import get_storage
+    from uploads import blob_key
+
+    for column, ddl in (
+        ('file_hash', "VARCHAR(64) REFERENCES stored_files (sha256)"),
+        ('file_name', "VARCHAR(256)"),
+    ):
+        if not column_exists(conn, 'modules', column):
+            conn.execute(text(f"ALTER TABLE modules ADD COLUMN {column} {ddl}"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_modules_file_hash ON modules (file_hash)"))
+
+    # Copy files saved as <uuid>_<name> into the store, one copy per distinct
+    # content. The originals are only removed once this has committed, so a
+    # rollback leaves every module pointing at a file that still exists.
+    folder = current_app.config['UPLOAD_FOLDER']
+    storage = get_storage()
+    references = {}
+    legacy_paths = []
+    modules = conn.execute(text(
+        "SELECT id, file_path FROM modules WHERE file_path IS NOT NULL AND file_hash IS NULL"
+    )).all()
+    for module_id, file_path in modules:
+        legacy_path = os.path.join(folder, os.path.basename(file_path))
+        if not os.path.exists(legacy_path):
+            logging.warning(f"Module {module_id} file {file_path} is missing, leaving it as is")
+            continue
+
+        digest = hashlib.sha256()
+        with open(legacy_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+
+        if not storage.exists(blob_key(sha256)):
+            if storage.temp_dir:
+                os.makedirs(storage.temp_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=storage.temp_dir)
+            os.close(fd)
+            shutil.copyfile(legacy_path, temp_path)
+            storage.put_file(blob_key(sha256), temp_path)
+        legacy_paths.append(legacy_path)
+
+        # Drop the uuid4 prefix the old upload code added
+        name = os.path.basename(file_path)
+        if len(name) > 37 and name[36] == '_':
+            name = name[37:]
+
+        if sha256 not in references and conn.execute(text(
+            "SELECT 1 FROM stored_files WHERE sha256 = :sha256"
+        ), {'sha256': sha256}).first() is None:
+            conn.execute(text(
+                "INSERT INTO stored_files (sha256, ref_count, created_at) VALUES (:sha256, 0, :now)"
+            ), {'sha256': sha256, 'now': datetime.utcnow()})
+        references[sha256] = references.get(sha256, 0) + 1
+        conn.execute(text(
+            "UPDATE modules SET file_hash = :sha256, file_name = :name, file_path = :key WHERE id = :id"
+        ), {'sha256': sha256, 'name': name, 'key': blob_key(sha256), 'id': module_id})
+
+    for sha256, count in references.items():
+        conn.execute(text(
+            "UPDATE stored_files SET ref_count = ref_count + :count WHERE sha256 = :sha256"
+        ), {'count': count, 'sha256': sha256})
+
+    def remove_legacy_files():
+        for path in legacy_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return remove_legacy_files
+
+@migration(4, 'Background processing results on modules')
+def add_module_processing_columns(conn):
+    for column, ddl in (
+        ('processing_status', "VARCHAR(20)"),
+        ('processing_error', "TEXT"),
+        ('processed_at', "TIMESTAMP"),
+        ('page_count', "INTEGER"),
+        ('word_count', "INTEGER"),
+        ('text_content', "TEXT"),
+        ('preview_path', "VARCHAR(256)"),
+    ):
+        if not column_exists(conn, 'modules', column):
+            conn.execute(text(f"ALTER TABLE modules ADD COLUMN {column} {ddl}"))
+
+    # Existing files are picked up by `flask process-modules`
+    conn.execute(text(
+        "UPDATE modules SET processing_status = 'pending' "
+        "WHERE file_hash IS NOT NULL AND processing_status IS NULL"
+    ))
+
+@migration(5, 'Keyset pagination sort columns are NOT NULL')
+def require_pagination_sort_columns(conn):
+    # Keyset cursors cannot carry NULL, and NULL rows would drop out of the
+    # (sort, id) < cursor comparison, so rows without a date get the oldest
+    # one possible and stay at the end of the newest-first lists
+    for table, column, oldest in (
+        ('grades', 'date', '1970-01-01'),
+        ('modules', 'created_at', '1970-01-01 00:00:00'),
+        ('notifications', 'date', '1970-01-01 00:00:00'),
+    ):
+        conn.execute(text(f"UPDATE {table} SET {column} = :oldest WHERE {column} IS NULL"), {'oldest': oldest})
+        # SQLite cannot add the constraint without rebuilding the table;
+        # tables it creates from now on have it from the models
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL"))
+
+@migration(6, 'Staging key of uploads waiting to be stored by content')
+def add_module_staging_key(conn):
+    if not column_exists(conn, 'modules', 'staging_key'):
+        conn.execute(text("ALTER TABLE modules ADD COLUMN staging_key VARCHAR(256)"))
+
+def column_exists(conn, table, column):
+    return column in {c['name'] for c in inspect(conn).get_columns(table)}
+
+def applied_versions():
+    """Return the set of migration versions recorded in the database"""
+    schema_migrations.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+def upgrade():
+    """
+    Create any missing tables, then apply every pending migration in order.
+    Returns the list of versions that were applied.
+    """
+    db.create_all()
+    applied = applied_versions()
+    newly_applied = []
+
+    for version, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+
+        with db.engine.begin() as conn:
+            after_commit = func(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow()
+            ))
+
+        if after_commit is not None:
+            after_commit()
+        logging.info(f"Applied migration {version}: {description}")
+        newly_applied.append(version)
+
+    return newly_applied
+
+db_cli = AppGroup('db', help='Manage the database schema.')
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """Apply all pending schema migrations."""
+    applied = upgrade()
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        click.echo("Database schema is up to date.")
+
+@db_cli.command('current')
+def current_command():
+    """Show the latest applied migration version."""
+    applied = applied_versions()
+    latest = max((m[0] for m in MIGRATIONS), default=0)
+    current = max(applied, default=0)
+    click.echo(f"Current version: {current} (latest available: {latest})")
+
+@click.command('seed-admin')
+@click.option('--username', default='admin', show_default=True)
+@click.option('--email', default='admin@example.com', show_default=True)
+@click.option('--password', envvar='ADMIN_PASSWORD', default='admin123', show_default=True,
+              help='Also read from ADMIN_PASSWORD.')
+@with_appcontext
+def seed_admin_command(username, email, password):
+    """Create the first admin account if there is none yet."""
+    from models import User
+
+    if User.query.filter_by(role='admin').first():
+        click.echo("An admin account already exists.")
+        return
+
+    admin = User(username=username, email=email, role='admin')
+    admin.set_password(password)
+    db.session.add(admin)
+    db.session.commit()
+    logging.info("Admin user created")
+    click.echo(f"Created admin account {username}.")
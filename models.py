@@ -1,7 +1,9 @@
 from datetime import datetime
 from app import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import deferred
+from werkzeug.security import check_password_hash
+from passwords import hash_password, needs_rehash
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -19,8 +21,16 @@ class User(UserMixin, db.Model):
     # Relationship with the teacher profile
     teacher = db.relationship('Teacher', backref='user', uselist=False, cascade='all, delete-orphan')
     
+    @property
+    def profile(self):
+        """The student or teacher profile of this user, if any"""
+        return self.student or self.teacher
+    
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
+    
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -47,11 +57,14 @@ class Student(db.Model):
     admission_date = db.Column(db.Date, default=datetime.utcnow)
     grade_level = db.Column(db.String(20))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), unique=True, nullable=False)
+    # Denormalized count of unread notifications, maintained by notifications.py
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     attendances = db.relationship('Attendance', backref='student', lazy='dynamic', cascade='all, delete-orphan')
     grades = db.relationship('Grade', backref='student', lazy='dynamic', cascade='all, delete-orphan')
     notifications = db.relationship('Notification', backref='student', lazy='dynamic', cascade='all, delete-orphan')
+    summary = db.relationship('StudentSummary', backref='student', uselist=False, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Student {self.first_name} {self.last_name}>'
@@ -75,12 +88,27 @@ class Teacher(db.Model):
 
 class Module(db.Model):
     __tablename__ = 'modules'
+    __table_args__ = (
+        db.Index('ix_modules_grade_level_created_at', 'grade_level', 'created_at'),
+        db.Index('ix_modules_teacher_id_created_at', 'teacher_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(128), nullable=False)
     description = db.Column(db.Text)
-    file_path = db.Column(db.String(256))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    file_path = db.Column(db.String(256))  # Key of the stored file, relative to UPLOAD_FOLDER
+    file_hash = db.Column(db.String(64), db.ForeignKey('stored_files.sha256'), index=True)
+    file_name = db.Column(db.String(256))  # Original name, used when downloading
+    # Filled in by the background processing of the file (see processing.py)
+    processing_status = db.Column(db.String(20))  # 'pending', 'processing', 'done', 'failed'
+    processing_error = db.Column(db.Text)
+    processed_at = db.Column(db.DateTime)
+    page_count = db.Column(db.Integer)
+    word_count = db.Column(db.Integer)
+    text_content = deferred(db.Column(db.Text))  # Can be large, so only loaded when used
+    preview_path = db.Column(db.String(256))  # Storage key of the thumbnail
+    staging_key = db.Column(db.String(256))  # Joined upload waiting to be stored by content (see uploads.store_upload)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     teacher_id = db.Column(db.Integer, db.ForeignKey('teachers.id'), nullable=False)
     grade_level = db.Column(db.String(20))  # To filter modules by grade level
     subject = db.Column(db.String(64))
@@ -91,8 +119,54 @@ class Module(db.Model):
     def __repr__(self):
         return f'<Module {self.title}>'
 
+class StoredFile(db.Model):
+    __tablename__ = 'stored_files'
+    
+    # Uploaded content is stored once under its SHA-256 and shared by every
+    # module that uploads the same bytes
+    sha256 = db.Column(db.String(64), primary_key=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StoredFile {self.sha256} refs={self.ref_count}>'
+
+class UploadSession(db.Model):
+    __tablename__ = 'upload_sessions'
+    
+    # A resumable upload: parts are sent one request at a time and joined
+    # into a module file when the upload is completed
+    id = db.Column(db.String(32), primary_key=True)  # Random token used in URLs
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teachers.id'), nullable=False)
+    file_name = db.Column(db.String(256), nullable=False)
+    size = db.Column(db.BigInteger)  # Declared by the client, checked on completion
+    part_size = db.Column(db.Integer, nullable=False)
+    storage_key = db.Column(db.String(256), nullable=False)
+    storage_token = db.Column(db.String(1024))  # Backend multipart id, e.g. the S3 UploadId
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    parts = db.relationship('UploadPart', backref='upload', lazy='dynamic', cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<UploadSession {self.id}>'
+
+class UploadPart(db.Model):
+    __tablename__ = 'upload_parts'
+    
+    upload_id = db.Column(db.String(32), db.ForeignKey('upload_sessions.id'), primary_key=True)
+    number = db.Column(db.Integer, primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    etag = db.Column(db.String(128))
+    
+    def __repr__(self):
+        return f'<UploadPart {self.upload_id} {self.number}>'
+
 class Attendance(db.Model):
     __tablename__ = 'attendances'
+    __table_args__ = (
+        db.Index('ux_attendances_student_id_date', 'student_id', 'date', unique=True),
+        db.Index('ix_attendances_recorded_by_date', 'recorded_by', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
@@ -109,11 +183,14 @@ class Attendance(db.Model):
 
 class Grade(db.Model):
     __tablename__ = 'grades'
+    __table_args__ = (
+        db.Index('ix_grades_student_id_date', 'student_id', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     score = db.Column(db.Float, nullable=False)
     max_score = db.Column(db.Float, nullable=False)
-    date = db.Column(db.Date, default=datetime.utcnow)
+    date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     comments = db.Column(db.Text)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
     module_id = db.Column(db.Integer, db.ForeignKey('modules.id'), nullable=False)
@@ -123,11 +200,15 @@ class Grade(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_student_id_read_date', 'student_id', 'read', 'date'),
+        db.Index('ix_notifications_sender_id_date', 'sender_id', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(128), nullable=False)
     message = db.Column(db.Text, nullable=False)
-    date = db.Column(db.DateTime, default=datetime.utcnow)
+    date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     read = db.Column(db.Boolean, default=False)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
     sender_id = db.Column(db.Integer, db.ForeignKey('teachers.id'))
@@ -137,3 +218,83 @@ class Notification(db.Model):
     
     def __repr__(self):
         return f'<Notification {self.id} {self.title}>'
+
+class StudentSummary(db.Model):
+    __tablename__ = 'student_summaries'
+    
+    # Dashboard figures for one student, maintained by summaries.py on every
+    # grade, attendance and module write
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), primary_key=True)
+    grade_count = db.Column(db.Integer, nullable=False, default=0)  # Grades with a non-zero maximum
+    grade_percentage_sum = db.Column(db.Float, nullable=False, default=0)
+    present_count = db.Column(db.Integer, nullable=False, default=0)
+    absent_count = db.Column(db.Integer, nullable=False, default=0)
+    late_count = db.Column(db.Integer, nullable=False, default=0)
+    modules_count = db.Column(db.Integer, nullable=False, default=0)
+    recent_grades = db.Column(db.JSON, nullable=False, default=list)
+    recent_attendance = db.Column(db.JSON, nullable=False, default=list)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @property
+    def average_grade(self):
+        return self.grade_percentage_sum / self.grade_count if self.grade_count else 0
+    
+    @property
+    def attendance_total(self):
+        return self.present_count + self.absent_count + self.late_count
+    
+    @property
+    def attendance_rate(self):
+        total = self.attendance_total
+        return (self.present_count / total * 100) if total > 0 else 0
+    
+    def __repr__(self):
+        return f'<StudentSummary {self.student_id}>'
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    
+    # Bumped whenever the data behind an in-process cache changes, so every
+    # worker can tell that its copy is stale
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name} {self.version}>'
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+    
+    # A unit of background work, claimed and run by `flask worker`
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Not before; pushed back on retry
+    locked_by = db.Column(db.String(128))
+    locked_until = db.Column(db.DateTime)  # Visibility timeout of the current attempt
+    last_error = db.Column(db.Text)
+    result = db.Column(db.JSON)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+class AIResponse(db.Model):
+    __tablename__ = 'ai_responses'
+    
+    # Shared tier of the assistant response cache, keyed by role and normalized prompt
+    key = db.Column(db.String(64), primary_key=True)
+    response = db.Column(db.JSON, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<AIResponse {self.key}>'
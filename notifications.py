@@ -0,0 +1,132 @@
+import logging
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert, literal, select, true, update
+from app import db
+from models import Student, Notification
+from jobs import job_handler, submit
+
+def audience_filter(audience, student_ids=None, grade_level=None):
+    """Return a filter on Student selecting the recipients of a broadcast"""
+    if audience == 'all':
+        return true()
+    if audience == 'grade':
+        return Student.grade_level == grade_level
+    if audience in ('student', 'students'):
+        return Student.id.in_(student_ids or [])
+    raise ValueError(f"Unknown audience: {audience}")
+
+def insert_notifications(sender_id, title, message, criterion):
+    """
+    Insert one notification per student matching `criterion` with a single
+    INSERT ... SELECT and commit. Returns the number of notifications created.
+    """
+    source = select(
+        literal(title),
+        literal(message),
+        literal(datetime.utcnow()),
+        literal(False),
+        Student.id,
+        literal(sender_id)
+    ).where(criterion)
+
+    stmt = insert(Notification).from_select(
+        ['title', 'message', 'date', 'read', 'student_id', 'sender_id'],
+        source
+    )
+
+    try:
+        result = db.session.execute(stmt)
+        # Keep the unread counters in step within the same transaction
+        db.session.execute(
+            update(Student)
+            .where(criterion)
+            .values(unread_notifications=Student.unread_notifications + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return result.rowcount
+
+def add_notification(student_id, sender_id, title, message):
+    """
+    Add a single notification and bump the student's unread counter. The
+    caller is responsible for committing.
+    """
+    notification = Notification(
+        title=title,
+        message=message,
+        student_id=student_id,
+        sender_id=sender_id,
+        date=datetime.utcnow()
+    )
+    db.session.add(notification)
+    db.session.execute(
+        update(Student)
+        .where(Student.id == student_id)
+        .values(unread_notifications=Student.unread_notifications + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return notification
+
+def mark_all_read(student_id):
+    """
+    Mark every unread notification of a student as read with one UPDATE and
+    decrement the unread counter by the number of rows changed. Returns that
+    number.
+    """
+    try:
+        result = db.session.execute(
+            update(Notification)
+            .where(Notification.student_id == student_id, Notification.read == False)
+            .values(read=True)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            db.session.execute(
+                update(Student)
+                .where(Student.id == student_id)
+                .values(unread_notifications=Student.unread_notifications - result.rowcount)
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return result.rowcount
+
+@job_handler('broadcast', max_attempts=1)
+def broadcast_job(sender_id, title, message, audience, student_ids=None, grade_level=None):
+    # Not retried: a retry after a commit that was not recorded would notify twice
+    count = insert_notifications(sender_id, title, message, audience_filter(audience, student_ids, grade_level))
+    logging.info(f"Background broadcast from teacher {sender_id} sent {count} notifications")
+    return {'sent': count}
+
+def broadcast(sender_id, title, message, audience, student_ids=None, grade_level=None, created_by=None):
+    """
+    Send a notification to every student in the audience (see audience_filter).
+    Audiences at or above NOTIFICATION_BACKGROUND_THRESHOLD are inserted in
+    the background; returns the number of notifications sent, or None if it
+    was queued.
+    """
+    criterion = audience_filter(audience, student_ids, grade_level)
+    threshold = current_app.config.get('NOTIFICATION_BACKGROUND_THRESHOLD')
+
+    if threshold:
+        audience_size = db.session.query(Student.id).filter(criterion).count()
+        if audience_size >= threshold:
+            submit('broadcast', {
+                'sender_id': sender_id,
+                'title': title,
+                'message': message,
+                'audience': audience,
+                'student_ids': student_ids,
+                'grade_level': grade_level,
+            }, created_by=created_by)
+            return None
+
+    return insert_notifications(sender_id, title, message, criterion)
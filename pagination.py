@@ -0,0 +1,85 @@
+import base64
+import json
+from datetime import date, datetime
+from flask import abort, current_app, request, url_for
+from sqlalchemy import tuple_
+
+class KeysetPage:
+    """One page of results from a keyset-paginated query"""
+
+    def __init__(self, items, next_cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def next_url(self):
+        """URL of the current view for the following page, for "load more" links"""
+        if not self.has_next:
+            return None
+        args = dict(request.view_args or {})
+        args.update(request.args.to_dict())
+        args['cursor'] = self.next_cursor
+        args['per_page'] = self.per_page
+        return url_for(request.endpoint, **args)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+def encode_cursor(sort_value, row_id):
+    if isinstance(sort_value, (date, datetime)):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def decode_cursor(cursor, sort_column):
+    """Decode a cursor into a (sort value, id) pair, or raise ValueError"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+    python_type = sort_column.type.python_type
+    if python_type is datetime:
+        sort_value = datetime.fromisoformat(sort_value)
+    elif python_type is date:
+        sort_value = date.fromisoformat(sort_value)
+
+    return sort_value, int(row_id)
+
+def get_per_page():
+    """Read the requested page size, clamped to the configured limits"""
+    per_page = request.args.get('per_page', current_app.config['ITEMS_PER_PAGE'], type=int)
+    return max(1, min(per_page, current_app.config['MAX_ITEMS_PER_PAGE']))
+
+def paginate_keyset(query, sort_column, id_column):
+    """
+    Return a page of `query` ordered newest first by (sort_column, id_column).
+    The position is carried in an opaque `cursor` query argument, so each page
+    is a bounded index range scan no matter how deep into the history it is.
+    """
+    per_page = get_per_page()
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            sort_value, row_id = decode_cursor(cursor, sort_column)
+        except (ValueError, TypeError):
+            abort(400)
+        query = query.filter(tuple_(sort_column, id_column) < tuple_(sort_value, row_id))
+
+    # Fetch one extra row to find out whether there is a next page
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    items = rows[:per_page]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+    return KeysetPage(items, next_cursor, per_page)
@@ -0,0 +1,24 @@
+import functools
+from flask import current_app
+from werkzeug.security import generate_password_hash
+
+DEFAULT_METHOD = 'scrypt'
+
+def configured_method():
+    return current_app.config.get('PASSWORD_HASH_METHOD') or DEFAULT_METHOD
+
+@functools.lru_cache(maxsize=None)
+def canonical_method(method):
+    """
+    Expand a method such as 'scrypt' or 'pbkdf2' to the full string Werkzeug
+    stores in front of the hash, e.g. 'scrypt:32768:8:1'
+    """
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+def hash_password(password, method=None):
+    return generate_password_hash(password, method=method or configured_method())
+
+def needs_rehash(password_hash, method=None):
+    """Whether a stored hash was made with a different algorithm or cost than configured"""
+    stored_method = password_hash.split('$', 1)[0]
+    return stored_method != canonical_method(method or configured_method())
@@ -0,0 +1,280 @@
+import io
+import logging
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from contextlib import closing
+from datetime import datetime
+from xml.etree import ElementTree
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app import db
+from models import Module
+from storage import get_storage
+from jobs import job_handler, submit
+from uploads import blob_key, preview_key, store_pending_uploads
+
+TEXT_EXTENSIONS = {'.txt', '.md', '.csv'}
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp'}
+THUMBNAIL_SIZE = (320, 320)
+WORD_PATTERN = re.compile(r'\w+')
+WORDPROCESSING_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+PDF_PAGE_PATTERN = re.compile(rb'/Type\s*/Page\b')
+CHUNK_CHARS = 64 * 1024
+
+class FileInfo:
+    """What was derived from an uploaded file"""
+
+    def __init__(self, text=None, page_count=None, thumbnail=None, word_count=None):
+        self.text = text  # At most the max_chars given to the extractor
+        self.page_count = page_count
+        self.thumbnail = thumbnail  # PNG bytes
+        self.word_count = word_count  # Of the whole text, however much of it was kept
+
+class TextCollector:
+    """
+    Gathers text fed in pieces, keeping only its first `max_chars` characters
+    (all of it when None) while counting the words of the whole text
+    """
+
+    def __init__(self, max_chars=None):
+        self.max_chars = max_chars
+        self.parts = []
+        self.kept = 0
+        self.word_count = 0
+        self.partial_word = ''  # The last word so far, which the next piece may continue
+
+    def feed(self, piece):
+        if self.max_chars is None or self.kept < self.max_chars:
+            keep = piece if self.max_chars is None else piece[:self.max_chars - self.kept]
+            self.parts.append(keep)
+            self.kept += len(keep)
+
+        text = self.partial_word + piece
+        last = None
+        for last in WORD_PATTERN.finditer(text):
+            self.word_count += 1
+        if last is not None and last.end() == len(text):
+            self.partial_word = last.group()
+            self.word_count -= 1
+        else:
+            self.partial_word = ''
+
+    def info(self, **kwargs):
+        word_count = self.word_count + (1 if self.partial_word else 0)
+        return FileInfo(text=''.join(self.parts), word_count=word_count, **kwargs)
+
+def extract_text_file(f, max_chars=None):
+    collector = TextCollector(max_chars)
+    stream = io.TextIOWrapper(f, encoding='utf-8', errors='replace')
+    try:
+        for piece in iter(lambda: stream.read(CHUNK_CHARS), ''):
+            collector.feed(piece)
+    finally:
+        stream.detach()
+    return collector.info()
+
+def extract_docx(f, max_chars=None):
+    collector = TextCollector(max_chars)
+    with zipfile.ZipFile(f) as docx:
+        # Parsed as it is decompressed, dropping each paragraph once it is read
+        first = True
+        with docx.open('word/document.xml') as document:
+            for event, node in ElementTree.iterparse(document, events=('start', 'end')):
+                if node.tag == f'{WORDPROCESSING_NS}p':
+                    if event == 'start':
+                        if not first:
+                            collector.feed('\n')
+                        first = False
+                    else:
+                        node.clear()
+                elif node.tag == f'{WORDPROCESSING_NS}t' and event == 'end' and node.text:
+                    collector.feed(node.text)
+
+        # Word records the page count it last laid out in the document properties
+        page_count = None
+        if 'docProps/app.xml' in docx.namelist():
+            match = re.search(rb'<Pages>(\d+)</Pages>', docx.read('docProps/app.xml'))
+            if match:
+                page_count = int(match.group(1))
+
+    return collector.info(page_count=page_count)
+
+def count_pdf_pages(f, chunk_size=64 * 1024, overlap=64):
+    """Count the page objects in a PDF without a PDF library, a chunk at a time"""
+    count = 0
+    data = b''
+    while True:
+        chunk = f.read(chunk_size)
+        data += chunk
+        if not chunk:
+            return count + len(PDF_PAGE_PATTERN.findall(data))
+        # A match starting in the last `overlap` bytes may continue in the next
+        # chunk, so it is counted on the next pass instead
+        limit = len(data) - overlap
+        count += sum(1 for match in PDF_PAGE_PATTERN.finditer(data) if match.start() < limit)
+        data = data[max(limit, 0):]
+
+def extract_pdf(f, max_chars=None):
+    try:
+        import pypdf
+    except ImportError:
+        # Without a PDF library only the page count can be read
+        return FileInfo(page_count=count_pdf_pages(f), thumbnail=_pdf_thumbnail(f.name))
+
+    reader = pypdf.PdfReader(f)
+    collector = TextCollector(max_chars)
+    for number, page in enumerate(reader.pages):
+        if number:
+            collector.feed('\n')
+        collector.feed(page.extract_text() or '')
+    return collector.info(page_count=len(reader.pages), thumbnail=_pdf_thumbnail(f.name))
+
+def _pdf_thumbnail(path):
+    try:
+        import fitz
+    except ImportError:
+        return None
+
+    # Opened from disk, so only the pages that are rendered are read
+    with fitz.open(path, filetype='pdf') as document:
+        if not document.page_count:
+            return None
+        page = document[0]
+        zoom = min(THUMBNAIL_SIZE[0] / page.rect.width, THUMBNAIL_SIZE[1] / page.rect.height)
+        return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).tobytes('png')
+
+def extract_image(f):
+    try:
+        from PIL import Image
+    except ImportError:
+        return FileInfo()
+
+    with Image.open(f) as image:
+        image.thumbnail(THUMBNAIL_SIZE)
+        out = io.BytesIO()
+        image.convert('RGB').save(out, 'PNG')
+    return FileInfo(page_count=1, thumbnail=out.getvalue())
+
+def _extension(file_name):
+    return os.path.splitext(file_name or '')[1].lower()
+
+def extract(f, file_name, max_chars=None):
+    """
+    Derive text, its word count, page count and a thumbnail from a file opened
+    from disk, whose `name` is its path. At most `max_chars` of the text are
+    kept, so large files are never held in memory whole.
+    """
+    extension = _extension(file_name)
+    if extension in TEXT_EXTENSIONS:
+        return extract_text_file(f, max_chars)
+    if extension == '.docx':
+        return extract_docx(f, max_chars)
+    if extension == '.pdf':
+        return extract_pdf(f, max_chars)
+    if extension in IMAGE_EXTENSIONS:
+        return extract_image(f)
+    return FileInfo()
+
+def _copy_results(module, source):
+    module.text_content = source.text_content
+    module.page_count = source.page_count
+    module.word_count = source.word_count
+    module.preview_path = source.preview_path
+
+@job_handler('process_module', max_attempts=3)
+def process_module(module_id):
+    """
+    Extract text, page and word counts and a thumbnail from a module's file
+    and store them on the module. Modules sharing the same file reuse the
+    first one's results. Commits; a failure is recorded on the module and
+    re-raised so the job can be retried.
+    """
+    module = db.session.get(Module, module_id)
+    if module is None or not module.file_hash:
+        return
+
+    module.processing_status = 'processing'
+    db.session.commit()
+
+    try:
+        # The same bytes under the same kind of name give the same results
+        done = next((
+            other for other in Module.query.filter(
+                Module.file_hash == module.file_hash,
+                Module.processing_status == 'done',
+                Module.id != module.id
+            )
+            if _extension(other.file_name) == _extension(module.file_name)
+        ), None)
+
+        if done is not None:
+            _copy_results(module, done)
+        else:
+            storage = get_storage()
+            max_chars = current_app.config.get('MODULE_TEXT_MAX_CHARS') or None
+            # Extractors need a file on disk, and remote storage only streams
+            with tempfile.NamedTemporaryFile() as local, closing(storage.open(blob_key(module.file_hash))) as source:
+                shutil.copyfileobj(source, local)
+                local.flush()  # Some extractors reopen it by name
+                local.seek(0)
+                info = extract(local, module.file_name, max_chars)
+
+            module.word_count = info.word_count
+            module.text_content = info.text
+            module.page_count = info.page_count
+            module.preview_path = None
+            if info.thumbnail:
+                key = preview_key(module.file_hash)
+                fd, temp_path = tempfile.mkstemp(suffix='.png')
+                with os.fdopen(fd, 'wb') as out:
+                    out.write(info.thumbnail)
+                storage.put_file(key, temp_path)
+                module.preview_path = key
+
+        module.processing_status = 'done'
+        module.processing_error = None
+    except Exception as e:
+        db.session.rollback()
+        module = db.session.get(Module, module_id)
+        if module is None:
+            return
+        logging.error(f"Error processing module {module_id}: {str(e)}")
+        module.processing_status = 'failed'
+        module.processing_error = str(e)[:1000]
+        module.processed_at = datetime.utcnow()
+        db.session.commit()
+        raise
+
+    module.processed_at = datetime.utcnow()
+    db.session.commit()
+
+def process_in_background(module_id, created_by=None):
+    """Queue a committed module's file for processing; returns the job id, if any"""
+    return submit('process_module', {'module_id': module_id}, created_by=created_by)
+
+@click.command('process-modules')
+@click.option('--all', 'process_all', is_flag=True, help='Reprocess modules that were already processed.')
+@with_appcontext
+def process_modules_command(process_all):
+    """Process module files that are pending or failed, e.g. after a restart."""
+    # Uploads whose file was never stored by content come first
+    stored = store_pending_uploads()
+    if stored:
+        click.echo(f"Stored the files of {len(stored)} completed uploads.")
+
+    query = db.session.query(Module.id).filter(Module.file_hash.isnot(None))
+    if not process_all:
+        query = query.filter(db.or_(Module.processing_status.is_(None), Module.processing_status != 'done'))
+    module_ids = [module_id for (module_id,) in query.order_by(Module.id)]
+
+    failed = 0
+    for module_id in module_ids:
+        try:
+            process_module(module_id)
+        except Exception:
+            failed += 1
+    click.echo(f"Processed {len(module_ids)} modules, {failed} failed.")
@@ -0,0 +1,96 @@
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Statement counters opened with count_queries() on this thread
+_local = threading.local()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    exempt = getattr(_local, 'exempt', 0)
+    for counter in getattr(_local, 'counters', ()):
+        if not (exempt and counter.budget):
+            counter.statements.append(statement)
+
+class QueryCounter:
+    """Collects the SQL statements executed while it is open"""
+
+    def __init__(self, budget=False):
+        self.statements = []
+        self.budget = budget
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+@contextmanager
+def count_queries(budget=False):
+    """
+    Count the SQL statements executed on this thread inside the block:
+
+        with count_queries() as counter:
+            client.get('/teacher/grades')
+        assert counter.count <= 4
+    """
+    counter = QueryCounter(budget)
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = []
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+@contextmanager
+def outside_budget():
+    """
+    Leave the statements run inside the block out of the enclosing view's
+    query budget, for one-off work such as building a row the view then keeps
+    reading. Counters opened with count_queries() still see them.
+    """
+    _local.exempt = getattr(_local, 'exempt', 0) + 1
+    try:
+        yield
+    finally:
+        _local.exempt -= 1
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+def query_budget(max_queries, methods=('GET',)):
+    """
+    Declare how many SQL statements a view may run when serving `methods`
+    requests (form submissions do their own writes). When QUERY_BUDGET_ENFORCE
+    is set (it defaults to on under TESTING) a view that goes over its budget
+    raises QueryBudgetExceeded, so N+1 regressions fail the test suite;
+    otherwise the overrun is logged as a warning.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in methods:
+                return view(*args, **kwargs)
+
+            with count_queries(budget=True) as counter:
+                response = view(*args, **kwargs)
+
+            if counter.count > max_queries:
+                message = (
+                    f"{view.__name__} ran {counter.count} SQL statements, "
+                    f"budget is {max_queries}:\n" + "\n".join(counter.statements)
+                )
+                enforce = current_app.config.get('QUERY_BUDGET_ENFORCE', current_app.testing)
+                if enforce:
+                    raise QueryBudgetExceeded(message)
+                logging.warning(message)
+
+            return response
+
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
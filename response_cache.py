@@ -0,0 +1,148 @@
+import functools
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from metrics import AI_RESPONSE_CACHE
+from models import AIResponse
+
+def normalize_prompt(prompt):
+    """Fold case, punctuation and whitespace so near-identical questions match"""
+    folded = unicodedata.normalize('NFKC', prompt).casefold()
+    words = ''.join(' ' if unicodedata.category(c)[0] in 'PZC' else c for c in folded).split()
+    return ' '.join(words)
+
+def cache_key(role, prompt):
+    return hashlib.sha256(f"{role}\n{normalize_prompt(prompt)}".encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    Per-worker LRU cache of assistant responses kept for AI_RESPONSE_CACHE_TTL
+    seconds, in front of an optional shared tier in the ai_responses table
+    so an answer generated by one worker is reused by the others.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.purged_at = 0
+
+    def get_local(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return response
+
+    def put_local(self, key, response, ttl, max_size):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+    def get_shared(self, key):
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(AIResponse.response, AIResponse.expires_at).where(AIResponse.key == key)
+            ).first()
+        if row is None or row.expires_at < datetime.utcnow():
+            return None, None
+        return row.response, (row.expires_at - datetime.utcnow()).total_seconds()
+
+    def put_shared(self, key, response, ttl):
+        table = AIResponse.__table__
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl)
+        with db.engine.begin() as connection:
+            dialect = connection.dialect.name
+            if dialect in ('postgresql', 'sqlite'):
+                insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+                stmt = insert(table).values(key=key, response=response, expires_at=expires_at)
+                connection.execute(stmt.on_conflict_do_update(
+                    index_elements=['key'],
+                    set_={'response': stmt.excluded.response, 'expires_at': stmt.excluded.expires_at}
+                ))
+            else:
+                result = connection.execute(
+                    update(table).where(table.c.key == key).values(response=response, expires_at=expires_at)
+                )
+                if result.rowcount == 0:
+                    connection.execute(table.insert().values(key=key, response=response, expires_at=expires_at))
+
+            # Expired rows are cleared out at most once per TTL by each worker
+            if time.monotonic() - self.purged_at >= ttl:
+                connection.execute(delete(table).where(table.c.expires_at < now))
+                self.purged_at = time.monotonic()
+
+    def get(self, role, prompt):
+        """Return a cached response for the prompt, or None"""
+        config = current_app.config
+        ttl = config.get('AI_RESPONSE_CACHE_TTL', 0)
+        if not ttl:
+            return None
+
+        key = cache_key(role, prompt)
+        response = self.get_local(key)
+        AI_RESPONSE_CACHE.inc(1, 'local', 'hit' if response is not None else 'miss')
+        if response is not None or not config.get('AI_RESPONSE_CACHE_SHARED'):
+            return response
+
+        try:
+            response, remaining = self.get_shared(key)
+        except SQLAlchemyError as e:
+            logging.warning(f"AI response cache lookup failed: {str(e)}")
+            return None
+        AI_RESPONSE_CACHE.inc(1, 'shared', 'hit' if response is not None else 'miss')
+        if response is not None:
+            # Keep it locally no longer than the shared copy lives
+            self.put_local(key, response, min(ttl, remaining), config.get('AI_RESPONSE_CACHE_SIZE', 1024))
+        return response
+
+    def put(self, role, prompt, response):
+        config = current_app.config
+        ttl = config.get('AI_RESPONSE_CACHE_TTL', 0)
+        if not ttl:
+            return
+
+        key = cache_key(role, prompt)
+        self.put_local(key, response, ttl, config.get('AI_RESPONSE_CACHE_SIZE', 1024))
+        if config.get('AI_RESPONSE_CACHE_SHARED'):
+            try:
+                self.put_shared(key, response, ttl)
+            except SQLAlchemyError as e:
+                logging.warning(f"AI response cache store failed: {str(e)}")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+response_cache = ResponseCache()
+
+def cached_response(func):
+    """Serve repeated (prompt, role) calls of an AI helper returning (result, status) from the cache"""
+    @functools.wraps(func)
+    def wrapper(prompt, role):
+        response = response_cache.get(role, prompt)
+        if response is not None:
+            return dict(response), 200
+
+        result, status_code = func(prompt, role)
+        # Errors are worth retrying, so only successful answers are kept
+        if status_code == 200:
+            response_cache.put(role, prompt, result)
+        return result, status_code
+    return wrapper
@@ -0,0 +1,129 @@
+import bisect
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event, select, update, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import Student, CacheVersion
+
+ROSTER_CACHE = 'roster'
+
+# Student attributes that appear in the roster
+ROSTER_FIELDS = ('first_name', 'last_name', 'grade_level')
+
+class RosterCache:
+    """
+    In-process copy of the student roster with a sorted prefix index on names.
+    The copy is rebuilt when the shared roster version in the database moves on,
+    which is checked at most every ROSTER_CACHE_CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked_at = 0
+        self.stale = True
+        # (students by id, sorted index keys, student id of each key); replaced
+        # whole so readers never see the parts of two different loads
+        self.snapshot = ({}, (), ())
+
+    def load(self, version):
+        rows = db.session.execute(
+            select(Student.id, Student.first_name, Student.last_name, Student.grade_level)
+        ).all()
+
+        students = {}
+        index = []
+        for student_id, first_name, last_name, grade_level in rows:
+            name = f"{first_name} {last_name}"
+            students[student_id] = {'id': student_id, 'name': name, 'grade_level': grade_level}
+            # Index the first name, last name and full name so any of them matches
+            for key in {first_name.lower(), last_name.lower(), name.lower()}:
+                index.append((key, student_id))
+        index.sort()
+
+        self.snapshot = (
+            students,
+            tuple(key for key, _ in index),
+            tuple(student_id for _, student_id in index)
+        )
+        self.version = version
+        self.stale = False
+
+    def refresh(self):
+        """Reload the roster if this worker's copy is out of date"""
+        interval = current_app.config.get('ROSTER_CACHE_CHECK_INTERVAL', 5)
+        now = time.monotonic()
+        if not self.stale and now - self.checked_at < interval:
+            return
+
+        with self.lock:
+            version = current_version()
+            if self.stale or version != self.version:
+                self.load(version)
+            self.checked_at = now
+
+    def get(self, student_id):
+        self.refresh()
+        students, _, _ = self.snapshot
+        return students.get(student_id)
+
+    def search(self, prefix, limit=10, grade_level=None):
+        """Return up to `limit` students whose first, last or full name starts with `prefix`"""
+        self.refresh()
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+
+        students, keys, key_ids = self.snapshot
+        results = []
+        seen = set()
+        position = bisect.bisect_left(keys, prefix)
+        while position < len(keys) and keys[position].startswith(prefix) and len(results) < limit:
+            student = students[key_ids[position]]
+            if student['id'] not in seen and (grade_level is None or student['grade_level'] == grade_level):
+                seen.add(student['id'])
+                results.append(student)
+            position += 1
+
+        return sorted(results, key=lambda s: s['name'].lower())
+
+roster_cache = RosterCache()
+
+def current_version():
+    version = db.session.execute(
+        select(CacheVersion.version).where(CacheVersion.name == ROSTER_CACHE)
+    ).scalar()
+    return version or 0
+
+def bump_roster_version(connection):
+    """Record that the roster changed; runs inside the caller's transaction"""
+    table = CacheVersion.__table__
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        # A single upsert, so two first bumps cannot both try to insert the row
+        upsert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = upsert(table).values(name=ROSTER_CACHE, version=1)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['name'],
+            set_={'version': table.c.version + 1}
+        ))
+    else:
+        result = connection.execute(
+            update(table).where(table.c.name == ROSTER_CACHE).values(version=table.c.version + 1)
+        )
+        if not result.rowcount:
+            connection.execute(insert(table).values(name=ROSTER_CACHE, version=1))
+    roster_cache.stale = True
+
+@event.listens_for(Student, 'after_insert')
+@event.listens_for(Student, 'after_delete')
+def _student_added_or_removed(mapper, connection, target):
+    bump_roster_version(connection)
+
+@event.listens_for(Student, 'after_update')
+def _student_changed(mapper, connection, target):
+    state = db.inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in ROSTER_FIELDS):
+        bump_roster_version(connection)
@@ -0,0 +1,227 @@
+import csv
+import io
+import logging
+import os
+import secrets
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+import click
+from email_validator import validate_email, EmailNotValidError
+from flask import current_app
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+from app import db
+from models import User, Student, Teacher
+from forms import RegisterForm
+from passwords import configured_method
+from roster import bump_roster_version
+from jobs import job_handler, submit
+from storage import get_storage
+from uploads import TEMP_DIR
+
+REQUIRED_COLUMNS = ('username', 'email', 'role', 'first_name', 'last_name', 'password')
+GRADE_LEVELS = {value for value, _ in RegisterForm.grade_level.kwargs['choices'] if value}
+DEPARTMENTS = {value for value, _ in RegisterForm.department.kwargs['choices'] if value}
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.errors = []  # (line number, message)
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+    def to_dict(self):
+        return {
+            'created': self.created,
+            'failed': len(self.errors),
+            'errors': [{'line': line, 'error': message} for line, message in self.errors],
+        }
+
+def _clean(row):
+    row = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+    for column in ('role', 'department'):
+        if column in row:
+            row[column] = row[column].lower()
+    return row
+
+def validate_row(row):
+    """Return an error message for a CSV row, or None if it can be imported"""
+    missing = [column for column in REQUIRED_COLUMNS if not row.get(column)]
+    if missing:
+        return f"Missing {', '.join(missing)}"
+    if not 4 <= len(row['username']) <= 64:
+        return "Username must be between 4 and 64 characters"
+    if len(row['password']) < 8:
+        return "Password must be at least 8 characters"
+    if row['role'] not in ('student', 'teacher'):
+        return "Role must be student or teacher"
+    if len(row['email']) > 120:
+        return "Email must be at most 120 characters"
+    if len(row['first_name']) > 64 or len(row['last_name']) > 64:
+        return "Names must be at most 64 characters"
+    if row.get('grade_level') and row['grade_level'] not in GRADE_LEVELS:
+        return f"Unknown grade level {row['grade_level']}"
+    if row.get('department') and row['department'] not in DEPARTMENTS:
+        return f"Unknown department {row['department']}"
+    try:
+        validate_email(row['email'], check_deliverability=False)
+    except EmailNotValidError as e:
+        return f"Invalid email: {str(e)}"
+    return None
+
+def _insert_accounts(rows, hashes):
+    """Insert users and their profiles for a chunk of valid rows; no commit"""
+    user_rows = [
+        {'username': row['username'], 'email': row['email'], 'role': row['role'], 'password_hash': password_hash}
+        for row, password_hash in zip(rows, hashes)
+    ]
+    user_ids = dict(db.session.execute(
+        insert(User).returning(User.username, User.id, sort_by_parameter_order=True),
+        user_rows
+    ).all())
+
+    students = []
+    teachers = []
+    for row in rows:
+        profile = {'first_name': row['first_name'], 'last_name': row['last_name'], 'user_id': user_ids[row['username']]}
+        if row['role'] == 'student':
+            students.append({**profile, 'grade_level': row.get('grade_level') or None})
+        else:
+            teachers.append({**profile, 'department': row.get('department') or None})
+
+    if students:
+        db.session.execute(insert(Student), students)
+        bump_roster_version(db.session.connection())
+    if teachers:
+        db.session.execute(insert(Teacher), teachers)
+
+def _import_chunk(chunk, executor, method, result):
+    # Reject rows that clash with each other or with existing accounts
+    usernames = [row['username'] for _, row in chunk]
+    emails = [row['email'] for _, row in chunk]
+    taken_usernames = set(db.session.execute(select(User.username).where(User.username.in_(usernames))).scalars())
+    taken_emails = set(db.session.execute(select(User.email).where(User.email.in_(emails))).scalars())
+
+    valid = []
+    for line, row in chunk:
+        if row['username'] in taken_usernames:
+            result.error(line, f"Username {row['username']} already exists")
+        elif row['email'] in taken_emails:
+            result.error(line, f"Email {row['email']} already exists")
+        else:
+            taken_usernames.add(row['username'])
+            taken_emails.add(row['email'])
+            valid.append((line, row))
+
+    if not valid:
+        return
+
+    rows = [row for _, row in valid]
+    hashes = list(executor.map(generate_password_hash, [row['password'] for row in rows], [method] * len(rows)))
+
+    try:
+        _insert_accounts(rows, hashes)
+        db.session.commit()
+        result.created += len(rows)
+        return
+    except Exception as e:
+        db.session.rollback()
+        logging.warning(f"Roster import chunk failed, retrying row by row: {str(e)}")
+
+    # Find the offending rows without losing the rest of the chunk
+    for (line, row), password_hash in zip(valid, hashes):
+        try:
+            _insert_accounts([row], [password_hash])
+            db.session.commit()
+            result.created += 1
+        except Exception as e:
+            db.session.rollback()
+            result.error(line, str(e.orig) if hasattr(e, 'orig') else str(e))
+
+def import_roster(stream, chunk_size=None, workers=None):
+    """
+    Import student and teacher accounts from a CSV text stream. Rows are
+    validated and inserted in chunks of `chunk_size`, one transaction per chunk,
+    with password hashing spread across a process pool. Invalid rows are
+    reported and skipped. Returns an ImportResult.
+    """
+    chunk_size = chunk_size or current_app.config.get('ROSTER_IMPORT_CHUNK_SIZE', 500)
+    workers = workers or current_app.config.get('ROSTER_IMPORT_WORKERS') or os.cpu_count()
+    method = configured_method()
+    result = ImportResult()
+
+    reader = csv.DictReader(stream)
+    missing = [column for column in REQUIRED_COLUMNS if column not in {(name or '').strip().lower() for name in reader.fieldnames or []}]
+    if missing:
+        result.error(1, f"Missing columns: {', '.join(missing)}")
+        return result
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunk = []
+        for row in reader:
+            line = reader.line_num
+            row = _clean(row)
+            error = validate_row(row)
+            if error:
+                result.error(line, error)
+                continue
+
+            chunk.append((line, row))
+            if len(chunk) >= chunk_size:
+                _import_chunk(chunk, executor, method, result)
+                chunk = []
+
+        if chunk:
+            _import_chunk(chunk, executor, method, result)
+
+    logging.info(f"Roster import created {result.created} accounts, {len(result.errors)} rows failed")
+    return result
+
+def submit_uploaded_roster(file_storage, created_by=None):
+    """
+    Spool an uploaded roster to storage and import it with a background job,
+    since hashing the passwords of a whole school takes longer than a request
+    may. Returns the id of the job, whose result is the import report.
+    """
+    storage = get_storage()
+    if storage.temp_dir:
+        os.makedirs(storage.temp_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=storage.temp_dir, suffix='.csv')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            shutil.copyfileobj(file_storage.stream, out)
+        # Under tmp/, so gc-uploads removes it if the job never runs
+        key = f"{TEMP_DIR}/roster-{secrets.token_hex(16)}.csv"
+        storage.put_file(key, temp_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return submit('import_roster', {'key': key}, created_by=created_by, track=True)
+
+@job_handler('import_roster', max_attempts=1)
+def import_roster_job(key):
+    """Import a roster spooled by submit_uploaded_roster, then delete it"""
+    # Not retried: the accounts of the chunks already committed would be
+    # reported as duplicates
+    storage = get_storage()
+    try:
+        with closing(storage.open(key)) as raw:
+            stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+            try:
+                return import_roster(stream).to_dict()
+            finally:
+                stream.detach()
+    finally:
+        storage.delete(key)
+
+def import_roster_file(path, chunk_size=None, workers=None):
+    """Import a CSV file for `flask import-roster`, echoing each failed row and a summary"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        result = import_roster(f, chunk_size=chunk_size, workers=workers)
+
+    for line, message in result.errors:
+        click.echo(f"line {line}: {message}", err=True)
+    click.echo(f"Created {result.created} accounts, {len(result.errors)} rows failed.")
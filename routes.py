@@ -1,13 +1,23 @@
+import json
 import os
-import uuid
 from datetime import datetime
-from flask import render_template, request, redirect, url_for, flash, send_from_directory, jsonify, session
+from flask import render_template, request, redirect, url_for, flash, jsonify, session, stream_with_context, abort
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
+from sqlalchemy import case, select
+from sqlalchemy.orm import joinedload, contains_eager
 from app import app, db
-from models import User, Student, Teacher, Module, Attendance, Grade, Notification
-from forms import ModuleForm, GradeForm, AttendanceForm, NotificationForm, AIAssistantForm
-from ai_assistant import text_to_speech, speech_to_text, speech_to_speech_translation, text_to_image, educational_assistant
+from models import User, Student, Teacher, Module, Attendance, Grade, Notification, StudentSummary, UploadSession, UploadPart, Job
+from forms import ModuleForm, GradeForm, AttendanceForm, RollCallForm, NotificationForm, AIAssistantForm
+from stats import grade_summary, attendance_summary
+from pagination import paginate_keyset
+from attendance import record_roll_call
+from notifications import broadcast, add_notification, mark_all_read
+from roster import roster_cache
+from querycount import query_budget, outside_budget
+from summaries import get_summary, grade_entries, attendance_entries, grade_added, attendance_changed, module_added, module_removed, rebuild_students
+from processing import process_in_background
+from jobs import submit
+from uploads import attach_file, collect_garbage, send_stored_file, start_chunked_upload, store_part, complete_chunked_upload, abort_chunked_upload
 
 @app.route('/')
 def index():
@@ -21,116 +31,131 @@ def index():
 # Student routes
 @app.route('/student/dashboard')
 @login_required
+@query_budget(1)
 def student_dashboard():
     if not current_user.is_student():
         flash('Access denied. Student privileges required.', 'danger')
         return redirect(url_for('index'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
-    
-    # Get recent grades
-    recent_grades = Grade.query.filter_by(student_id=student.id).order_by(Grade.date.desc()).limit(5).all()
-    
-    # Get recent attendance
-    recent_attendance = Attendance.query.filter_by(student_id=student.id).order_by(Attendance.date.desc()).limit(5).all()
-    
-    # Get unread notifications
-    unread_notifications = Notification.query.filter_by(student_id=student.id, read=False).count()
-    
-    # Get total modules available for the student's grade
-    modules_count = Module.query.filter_by(grade_level=student.grade_level).count()
+    # Load the student together with the maintained dashboard summary,
+    # refreshing the profile's unread counter that may come from the identity cache
+    query = db.session.query(Student, StudentSummary).outerjoin(
+        StudentSummary, StudentSummary.student_id == Student.id
+    ).filter(Student.id == current_user.profile.id).populate_existing()
+    student, summary = query.first()
+    
+    # The summary is built once, on the first visit, and kept up to date by
+    # every write after that, so only the visits that follow count
+    if summary is None:
+        with outside_budget():
+            get_summary(student.id, known_missing=True)
+            student, summary = query.first()
+    
+    grade_stats = {
+        'count': summary.grade_count,
+        'average_grade': summary.average_grade,
+    }
+    attendance_stats = {
+        'total': summary.attendance_total,
+        'present_count': summary.present_count,
+        'absent_count': summary.absent_count,
+        'late_count': summary.late_count,
+        'attendance_rate': summary.attendance_rate,
+    }
     
     return render_template('student/dashboard.html', 
                            student=student,
-                           recent_grades=recent_grades,
-                           recent_attendance=recent_attendance,
-                           unread_notifications=unread_notifications,
-                           modules_count=modules_count)
+                           recent_grades=grade_entries(summary),
+                           recent_attendance=attendance_entries(summary),
+                           unread_notifications=student.unread_notifications,
+                           modules_count=summary.modules_count,
+                           grade_stats=grade_stats,
+                           attendance_stats=attendance_stats)
 
 @app.route('/student/modules')
 @login_required
+@query_budget(1)
 def student_modules():
     if not current_user.is_student():
         flash('Access denied. Student privileges required.', 'danger')
         return redirect(url_for('index'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_user.profile
     
-    # Get modules for the student's grade level
-    modules = Module.query.filter_by(grade_level=student.grade_level).order_by(Module.created_at.desc()).all()
+    # Get one page of modules for the student's grade level
+    page = paginate_keyset(Module.query.options(joinedload(Module.teacher)).filter_by(grade_level=student.grade_level), Module.created_at, Module.id)
     
-    return render_template('student/modules.html', modules=modules)
+    return render_template('student/modules.html', modules=page.items, page=page)
 
 @app.route('/student/grades')
 @login_required
+@query_budget(2)
 def student_grades():
     if not current_user.is_student():
         flash('Access denied. Student privileges required.', 'danger')
         return redirect(url_for('index'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_user.profile
     
-    # Get all grades for the student
-    grades = Grade.query.filter_by(student_id=student.id).order_by(Grade.date.desc()).all()
+    # Get one page of grades for the student
+    page = paginate_keyset(Grade.query.options(joinedload(Grade.module)).filter_by(student_id=student.id), Grade.date, Grade.id)
     
-    # Calculate average grade
-    total_percentage = 0
-    if grades:
-        for grade in grades:
-            total_percentage += (grade.score / grade.max_score) * 100
-        average_grade = total_percentage / len(grades)
-    else:
-        average_grade = 0
+    # Calculate average grade in the database
+    stats = grade_summary(student.id)
     
-    return render_template('student/grades.html', grades=grades, average_grade=average_grade)
+    return render_template('student/grades.html', 
+                           grades=page.items,
+                           page=page,
+                           average_grade=stats['average_grade'])
 
 @app.route('/student/attendance')
 @login_required
+@query_budget(2)
 def student_attendance():
     if not current_user.is_student():
         flash('Access denied. Student privileges required.', 'danger')
         return redirect(url_for('index'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_user.profile
     
-    # Get all attendance records for the student
-    attendance_records = Attendance.query.filter_by(student_id=student.id).order_by(Attendance.date.desc()).all()
+    # Get one page of attendance records for the student
+    page = paginate_keyset(Attendance.query.options(joinedload(Attendance.teacher)).filter_by(student_id=student.id), Attendance.date, Attendance.id)
     
-    # Calculate attendance statistics
-    total_records = len(attendance_records)
-    present_count = sum(1 for record in attendance_records if record.status == 'present')
-    absent_count = sum(1 for record in attendance_records if record.status == 'absent')
-    late_count = sum(1 for record in attendance_records if record.status == 'late')
-    
-    attendance_rate = (present_count / total_records * 100) if total_records > 0 else 0
+    # Calculate attendance statistics in the database
+    stats = attendance_summary(student.id)
     
     return render_template('student/attendance.html', 
-                           attendance_records=attendance_records,
-                           attendance_rate=attendance_rate,
-                           present_count=present_count,
-                           absent_count=absent_count,
-                           late_count=late_count)
+                           attendance_records=page.items,
+                           page=page,
+                           attendance_rate=stats['attendance_rate'],
+                           present_count=stats['present_count'],
+                           absent_count=stats['absent_count'],
+                           late_count=stats['late_count'])
 
 @app.route('/student/notifications')
 @login_required
+@query_budget(4)
 def student_notifications():
     if not current_user.is_student():
         flash('Access denied. Student privileges required.', 'danger')
         return redirect(url_for('index'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
-    
-    # Get all notifications for the student
-    notifications = Notification.query.filter_by(student_id=student.id).order_by(Notification.date.desc()).all()
+    student = current_user.profile
+    student_id = student.id
     
-    # Mark all notifications as read
-    for notification in notifications:
-        if not notification.read:
-            notification.read = True
+    # The profile may come from the identity cache, so read the counter afresh;
+    # with nothing unread the UPDATE and its commit are skipped
+    unread = db.session.execute(
+        select(Student.unread_notifications).where(Student.id == student_id)
+    ).scalar()
+    if unread:
+        # Mark all notifications as read in a single UPDATE
+        mark_all_read(student_id)
     
-    db.session.commit()
+    # Get one page of notifications for the student
+    page = paginate_keyset(Notification.query.options(joinedload(Notification.sender)).filter_by(student_id=student_id), Notification.date, Notification.id)
     
-    return render_template('student/notifications.html', notifications=notifications)
+    return render_template('student/notifications.html', notifications=page.items, page=page)
 
 @app.route('/student/ai_assistant', methods=['GET', 'POST'])
 @login_required
@@ -146,12 +171,13 @@ def student_ai_assistant():
 # Teacher routes
 @app.route('/teacher/dashboard')
 @login_required
+@query_budget(3)
 def teacher_dashboard():
     if not current_user.is_teacher():
         flash('Access denied. Teacher privileges required.', 'danger')
         return redirect(url_for('index'))
     
-    teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+    teacher = current_user.profile
     
     # Get counts for dashboard
     module_count = Module.query.filter_by(teacher_id=teacher.id).count()
@@ -168,59 +194,90 @@ def teacher_dashboard():
 
 @app.route('/teacher/modules', methods=['GET', 'POST'])
 @login_required
+@query_budget(1)
 def teacher_modules():
     if not current_user.is_teacher():
         flash('Access denied. Teacher privileges required.', 'danger')
         return redirect(url_for('index'))
     
-    teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+    teacher = current_user.profile
     form = ModuleForm()
     
     if form.validate_on_submit():
-        # Handle file upload
-        file_path = None
-        if form.file.data:
-            file = form.file.data
-            filename = secure_filename(file.filename)
-            # Add unique identifier to avoid overwriting
-            unique_filename = f"{uuid.uuid4()}_{filename}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(file_path)
-        
         # Create new module
         module = Module(
             title=form.title.data,
             description=form.description.data,
-            file_path=file_path,
             teacher_id=teacher.id,
             grade_level=form.grade_level.data,
             subject=form.subject.data
         )
-        
         db.session.add(module)
+        
+        # Handle file upload, stored once per distinct content
+        has_file = bool(form.file.data)
+        if has_file:
+            attach_file(module, form.file.data)
+            module.processing_status = 'pending'
+        
+        module_added(module.grade_level)
+        db.session.flush()
+        module_id = module.id
+        user_id = current_user.id
         db.session.commit()
         
+        # Thumbnails and text are extracted off the request path
+        if has_file:
+            process_in_background(module_id, created_by=user_id)
+        
         flash('Module uploaded successfully!', 'success')
         return redirect(url_for('teacher_modules'))
     
-    # Get all modules created by the teacher
-    modules = Module.query.filter_by(teacher_id=teacher.id).order_by(Module.created_at.desc()).all()
+    # Get one page of modules created by the teacher
+    page = paginate_keyset(Module.query.filter_by(teacher_id=teacher.id), Module.created_at, Module.id)
+    
+    return render_template('teacher/modules.html', form=form, modules=page.items, page=page)
+
+@app.route('/teacher/modules/<int:module_id>/delete', methods=['POST'])
+@login_required
+def teacher_delete_module(module_id):
+    if not current_user.is_teacher():
+        flash('Access denied. Teacher privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    module = Module.query.filter_by(id=module_id, teacher_id=current_user.profile.id).first()
+    if module is None:
+        flash('Module not found.', 'danger')
+        return redirect(url_for('teacher_modules'))
+    
+    # The module's grades are deleted with it, so their students' summaries change
+    graded_student_ids = [sid for (sid,) in db.session.query(Grade.student_id).filter_by(module_id=module.id).distinct()]
+    file_hash = module.file_hash
+    
+    db.session.delete(module)
+    module_removed(module.grade_level)
+    db.session.flush()
+    rebuild_students(graded_student_ids)
+    db.session.commit()
+    
+    collect_garbage([file_hash])
     
-    return render_template('teacher/modules.html', form=form, modules=modules)
+    flash('Module deleted.', 'success')
+    return redirect(url_for('teacher_modules'))
 
 @app.route('/teacher/grades', methods=['GET', 'POST'])
 @login_required
+@query_budget(2)
 def teacher_grades():
     if not current_user.is_teacher():
         flash('Access denied. Teacher privileges required.', 'danger')
         return redirect(url_for('index'))
     
-    teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+    teacher = current_user.profile
     form = GradeForm()
     
     # Populate form choices
     form.module.choices = [(m.id, m.title) for m in Module.query.filter_by(teacher_id=teacher.id).all()]
-    form.student.choices = [(s.id, f"{s.first_name} {s.last_name}") for s in Student.query.all()]
     
     if form.validate_on_submit():
         # Create new grade entry
@@ -234,42 +291,46 @@ def teacher_grades():
         )
         
         db.session.add(grade)
+        db.session.flush()
+        
+        # Fold the grade into the student's dashboard summary
+        module = Module.query.get(form.module.data)
+        grade_added(grade, module.title)
         db.session.commit()
         
         # Create notification for the student
-        module = Module.query.get(form.module.data)
-        notification = Notification(
-            title=f"New grade for {module.title}",
-            message=f"You received a grade of {grade.score}/{grade.max_score} for {module.title}.",
-            student_id=form.student.data,
-            sender_id=teacher.id,
-            date=datetime.utcnow()
+        add_notification(
+            form.student.data,
+            teacher.id,
+            f"New grade for {module.title}",
+            f"You received a grade of {grade.score}/{grade.max_score} for {module.title}."
         )
         
-        db.session.add(notification)
         db.session.commit()
         
         flash('Grade submitted successfully!', 'success')
         return redirect(url_for('teacher_grades'))
     
-    # Get all grades for modules created by the teacher
-    grades = Grade.query.join(Module).filter(Module.teacher_id == teacher.id).order_by(Grade.date.desc()).all()
+    # Get one page of grades for modules created by the teacher
+    grades_query = Grade.query.join(Module).options(
+        contains_eager(Grade.module),
+        joinedload(Grade.student)
+    ).filter(Module.teacher_id == teacher.id)
+    page = paginate_keyset(grades_query, Grade.date, Grade.id)
     
-    return render_template('teacher/grades.html', form=form, grades=grades)
+    return render_template('teacher/grades.html', form=form, grades=page.items, page=page)
 
 @app.route('/teacher/attendance', methods=['GET', 'POST'])
 @login_required
+@query_budget(2)
 def teacher_attendance():
     if not current_user.is_teacher():
         flash('Access denied. Teacher privileges required.', 'danger')
         return redirect(url_for('index'))
     
-    teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+    teacher = current_user.profile
     form = AttendanceForm()
     
-    # Populate form choices
-    form.student.choices = [(s.id, f"{s.first_name} {s.last_name}") for s in Student.query.all()]
-    
     if form.validate_on_submit():
         # Check if attendance record already exists for this student and date
         existing_record = Attendance.query.filter_by(
@@ -295,6 +356,8 @@ def teacher_attendance():
             db.session.add(attendance)
             flash('Attendance recorded successfully!', 'success')
         
+        db.session.flush()
+        attendance_changed([form.student.data])
         db.session.commit()
         return redirect(url_for('teacher_attendance'))
     
@@ -302,44 +365,89 @@ def teacher_attendance():
     if not form.date.data:
         form.date.data = datetime.utcnow().date()
     
+    # Prepare a roll call for a whole class when a grade level is selected
+    roll_call_form = RollCallForm(formdata=None)
+    roll_call_form.date.data = form.date.data
+    roll_call_students = []
+    grade_level = request.args.get('grade_level')
+    if grade_level:
+        roll_call_students = Student.query.filter_by(grade_level=grade_level).order_by(Student.last_name, Student.first_name).all()
+        for student in roll_call_students:
+            roll_call_form.entries.append_entry({'student_id': student.id, 'status': 'present'})
+    
     # Get recent attendance records
-    attendance_records = Attendance.query.filter_by(recorded_by=teacher.id).order_by(Attendance.date.desc()).limit(20).all()
+    attendance_records = Attendance.query.options(joinedload(Attendance.student)).filter_by(recorded_by=teacher.id).order_by(Attendance.date.desc()).limit(20).all()
+    
+    return render_template('teacher/attendance.html', 
+                           form=form,
+                           roll_call_form=roll_call_form,
+                           roll_call_students=roll_call_students,
+                           attendance_records=attendance_records)
+
+@app.route('/teacher/attendance/roll_call', methods=['POST'])
+@login_required
+def teacher_roll_call():
+    if not current_user.is_teacher():
+        flash('Access denied. Teacher privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    teacher = current_user.profile
+    form = RollCallForm()
+    
+    if not form.validate_on_submit():
+        flash('Invalid roll call submission.', 'danger')
+        return redirect(url_for('teacher_attendance'))
+    
+    entries = [
+        {'student_id': entry.student_id.data, 'status': entry.status.data, 'notes': entry.notes.data}
+        for entry in form.entries
+    ]
+    
+    # Record the whole class in a single upsert and transaction
+    try:
+        count = record_roll_call(teacher.id, form.date.data, entries)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('teacher_attendance'))
     
-    return render_template('teacher/attendance.html', form=form, attendance_records=attendance_records)
+    flash(f'Attendance recorded for {count} students!', 'success')
+    return redirect(url_for('teacher_attendance'))
 
 @app.route('/teacher/notifications', methods=['GET', 'POST'])
 @login_required
+@query_budget(1)
 def teacher_notifications():
     if not current_user.is_teacher():
         flash('Access denied. Teacher privileges required.', 'danger')
         return redirect(url_for('index'))
     
-    teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+    teacher = current_user.profile
     form = NotificationForm()
     
-    # Populate form choices
-    form.student.choices = [(s.id, f"{s.first_name} {s.last_name}") for s in Student.query.all()]
-    
     if form.validate_on_submit():
-        # Create new notification
-        notification = Notification(
-            title=form.title.data,
-            message=form.message.data,
-            student_id=form.student.data,
-            sender_id=teacher.id,
-            date=datetime.utcnow()
+        # Resolve the recipients and insert all notifications in one statement
+        count = broadcast(
+            teacher.id,
+            form.title.data,
+            form.message.data,
+            form.audience.data,
+            student_ids=[form.student.data] if form.audience.data == 'student' else form.students.data,
+            grade_level=form.grade_level.data,
+            created_by=current_user.id
         )
         
-        db.session.add(notification)
-        db.session.commit()
-        
-        flash('Notification sent successfully!', 'success')
+        if count is None:
+            flash('Notification is being sent in the background.', 'info')
+        elif form.audience.data == 'student':
+            flash('Notification sent successfully!', 'success')
+        else:
+            flash(f'Notification sent to {count} students!', 'success')
         return redirect(url_for('teacher_notifications'))
     
-    # Get notifications sent by the teacher
-    notifications = Notification.query.filter_by(sender_id=teacher.id).order_by(Notification.date.desc()).all()
+    # Get one page of notifications sent by the teacher
+    page = paginate_keyset(Notification.query.options(joinedload(Notification.student)).filter_by(sender_id=teacher.id), Notification.date, Notification.id)
     
-    return render_template('teacher/notifications.html', form=form, notifications=notifications)
+    return render_template('teacher/notifications.html', form=form, notifications=page.items, page=page)
 
 @app.route('/teacher/ai_assistant', methods=['GET', 'POST'])
 @login_required
@@ -352,13 +460,194 @@ def teacher_ai_assistant():
     
     return render_template('teacher/ai_assistant.html', form=form)
 
+@app.route('/api/students/search')
+@login_required
+@query_budget(2)
+def api_student_search():
+    if not current_user.is_teacher():
+        return jsonify({"error": "Teacher privileges required"}), 403
+    
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    grade_level = request.args.get('grade_level') or None
+    
+    students = roster_cache.search(query, limit=limit, grade_level=grade_level)
+    return jsonify({"students": students})
+
+# Resumable uploads: start, PUT numbered parts (resending any that failed), then complete
+def get_teacher_upload(upload_id):
+    return UploadSession.query.filter_by(id=upload_id, teacher_id=current_user.profile.id).first()
+
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def api_start_upload():
+    if not current_user.is_teacher():
+        return jsonify({"error": "Teacher privileges required"}), 403
+    
+    data = request.get_json(silent=True) or {}
+    size = data.get('size')
+    if size is not None and not isinstance(size, int):
+        return jsonify({"error": "Size must be a number of bytes"}), 400
+    
+    try:
+        upload = start_chunked_upload(current_user.profile.id, data.get('file_name'), size)
+        db.session.commit()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"upload_id": upload.id, "part_size": upload.part_size}), 201
+
+@app.route('/api/uploads/<upload_id>')
+@login_required
+def api_upload_status(upload_id):
+    if not current_user.is_teacher():
+        return jsonify({"error": "Teacher privileges required"}), 403
+    
+    upload = get_teacher_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    
+    return jsonify({
+        "upload_id": upload.id,
+        "file_name": upload.file_name,
+        "size": upload.size,
+        "part_size": upload.part_size,
+        "parts": [{"number": part.number, "size": part.size} for part in upload.parts.order_by(UploadPart.number)]
+    })
+
+@app.route('/api/uploads/<upload_id>/parts/<int:number>', methods=['PUT'])
+@login_required
+def api_upload_part(upload_id, number):
+    if not current_user.is_teacher():
+        return jsonify({"error": "Teacher privileges required"}), 403
+    
+    upload = get_teacher_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    
+    try:
+        size = store_part(upload, number, request.stream, request.content_length)
+        db.session.commit()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"number": number, "size": size})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def api_complete_upload(upload_id):
+    if not current_user.is_teacher():
+        return jsonify({"error": "Teacher privileges required"}), 403
+    
+    upload = get_teacher_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    
+    # Module details are sent as JSON with the same fields as the upload form
+    form = ModuleForm(meta={'csrf': False})
+    if not form.validate():
+        return jsonify({"error": "Invalid module details", "fields": form.errors}), 400
+    
+    module = Module(
+        title=form.title.data,
+        description=form.description.data,
+        teacher_id=current_user.profile.id,
+        grade_level=form.grade_level.data,
+        subject=form.subject.data
+    )
+    
+    try:
+        complete_chunked_upload(upload, module)
+        module.processing_status = 'pending'
+        module_added(module.grade_level)
+        db.session.flush()
+        result = {"module_id": module.id, "status": "storing"}
+        user_id = current_user.id
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    
+    # The file is hashed and stored off the request path, then processed
+    job_id = submit('store_upload', {'module_id': result["module_id"], 'created_by': user_id}, created_by=user_id)
+    if job_id is not None:
+        result["job_id"] = job_id
+    return jsonify(result), 202
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def api_abort_upload(upload_id):
+    if not current_user.is_teacher():
+        return jsonify({"error": "Teacher privileges required"}), 403
+    
+    upload = get_teacher_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    
+    abort_chunked_upload(upload)
+    db.session.commit()
+    return jsonify({"status": "aborted"})
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def api_job_status(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None or (job.created_by != current_user.id and not current_user.is_admin()):
+        return jsonify({"error": "Job not found"}), 404
+    
+    return jsonify({
+        "id": job.id,
+        "name": job.name,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "result": job.result,
+        "error": job.last_error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    })
+
+@app.route('/api/admin/roster/import', methods=['POST'])
+@login_required
+def api_roster_import():
+    if not current_user.is_admin():
+        return jsonify({"error": "Admin privileges required"}), 403
+    
+    if 'file' not in request.files:
+        return jsonify({"error": "CSV file is required"}), 400
+    
+    # Imported by a background job; the report is its result at /api/jobs/<job_id>
+    from roster_import import submit_uploaded_roster
+    job_id = submit_uploaded_roster(request.files['file'], created_by=current_user.id)
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
 # Shared routes
+@app.route('/modules/<int:module_id>/download')
+@login_required
+def download_module(module_id):
+    module = db.get_or_404(Module, module_id)
+    if not module.file_path:
+        abort(404)
+    return send_stored_file(module.file_path, module.file_name)
+
 @app.route('/download/<path:filename>')
 @login_required
 def download_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+    # Content-addressed files are named by hash and may be shared by several
+    # modules; serve them under the name of the user's own module, else the oldest
+    preference = [Module.id]
+    if current_user.is_teacher():
+        preference.insert(0, case((Module.teacher_id == current_user.profile.id, 0), else_=1))
+    download_name = db.session.execute(
+        select(Module.file_name)
+        .where(Module.file_hash == os.path.basename(filename))
+        .order_by(*preference)
+        .limit(1)
+    ).scalar()
+    return send_stored_file(filename, download_name)
 
-# AI Assistant API routes
+# AI Assistant API routes; the helpers are imported on first use to keep startup fast
 @app.route('/api/ai/text_to_speech', methods=['POST'])
 @login_required
 def api_text_to_speech():
@@ -369,29 +658,36 @@ def api_text_to_speech():
     if not text:
         return jsonify({"error": "Text is required"}), 400
     
+    from ai_assistant import text_to_speech
     result, status_code = text_to_speech(text, voice)
     return jsonify(result), status_code
 
 @app.route('/api/ai/speech_to_text', methods=['POST'])
 @login_required
 def api_speech_to_text():
+    # Set before the form is parsed; the recording is spooled to disk, not memory
+    request.max_content_length = app.config['AUDIO_MAX_CONTENT_LENGTH']
     if 'audio' not in request.files:
         return jsonify({"error": "Audio file is required"}), 400
     
     audio_file = request.files['audio']
     
+    from ai_assistant import speech_to_text
     result, status_code = speech_to_text(audio_file)
     return jsonify(result), status_code
 
 @app.route('/api/ai/speech_to_speech_translation', methods=['POST'])
 @login_required
 def api_speech_to_speech_translation():
+    # Same recording limit as speech_to_text
+    request.max_content_length = app.config['AUDIO_MAX_CONTENT_LENGTH']
     if 'audio' not in request.files:
         return jsonify({"error": "Audio file is required"}), 400
     
     audio_file = request.files['audio']
     target_language = request.form.get('target_language', 'English')
     
+    from ai_assistant import speech_to_speech_translation
     result, status_code = speech_to_speech_translation(audio_file, target_language)
     return jsonify(result), status_code
 
@@ -404,6 +700,7 @@ def api_text_to_image():
     if not prompt:
         return jsonify({"error": "Prompt is required"}), 400
     
+    from ai_assistant import text_to_image
     result, status_code = text_to_image(prompt)
     return jsonify(result), status_code
 
@@ -417,5 +714,36 @@ def api_educational_assistant():
         return jsonify({"error": "Prompt is required"}), 400
     
     role = 'student' if current_user.is_student() else 'teacher'
+    from ai_assistant import educational_assistant
     result, status_code = educational_assistant(prompt, role)
     return jsonify(result), status_code
+
+def server_sent_events(events):
+    """Format (event, data) pairs as Server-Sent Events; chunks are sent as plain messages"""
+    for event, data in events:
+        payload = json.dumps({"text": data} if event == 'chunk' else data)
+        if event == 'chunk':
+            yield f"data: {payload}\n\n"
+        else:
+            yield f"event: {event}\ndata: {payload}\n\n"
+
+@app.route('/api/ai/educational_assistant/stream', methods=['POST'])
+@login_required
+def api_educational_assistant_stream():
+    data = request.json
+    prompt = data.get('prompt')
+    
+    if not prompt:
+        return jsonify({"error": "Prompt is required"}), 400
+    
+    role = 'student' if current_user.is_student() else 'teacher'
+    from ai_assistant import stream_educational_assistant
+    # Hand the connection back to the pool rather than hold it while the answer is written
+    db.session.close()
+    response = app.response_class(
+        stream_with_context(server_sent_events(stream_educational_assistant(prompt, role))),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx holding chunks back
+    return response
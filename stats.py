@@ -0,0 +1,43 @@
+from sqlalchemy import func
+from app import db
+from models import Grade, Attendance
+
+ATTENDANCE_STATUSES = ('present', 'absent', 'late')
+
+def grade_summary(student_id):
+    """
+    Return the number of grades and the average percentage for a student,
+    computed in a single aggregate query
+    """
+    percentage = Grade.score * 100.0 / func.nullif(Grade.max_score, 0)
+    count, average = db.session.query(
+        func.count(Grade.id),
+        func.avg(percentage)
+    ).filter(Grade.student_id == student_id).one()
+
+    return {
+        'count': count,
+        'average_grade': float(average) if average is not None else 0,
+    }
+
+def attendance_summary(student_id):
+    """
+    Return the count per status, the total and the attendance rate for a
+    student, computed in a single grouped query
+    """
+    rows = db.session.query(
+        Attendance.status,
+        func.count(Attendance.id)
+    ).filter(Attendance.student_id == student_id).group_by(Attendance.status).all()
+
+    counts = {status: 0 for status in ATTENDANCE_STATUSES}
+    counts.update({status: count for status, count in rows})
+    total = sum(counts.values())
+
+    return {
+        'total': total,
+        'present_count': counts['present'],
+        'absent_count': counts['absent'],
+        'late_count': counts['late'],
+        'attendance_rate': (counts['present'] / total * 100) if total > 0 else 0,
+    }
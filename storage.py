@@ -0,0 +1,255 @@
+import mimetypes
+import os
+import shutil
+import tempfile
+from flask import abort, current_app, redirect, request, send_from_directory
+from werkzeug.security import safe_join
+
+class LocalStorage:
+    """Files under a directory on this machine's disk"""
+
+    def __init__(self, root):
+        self.root = root
+        self.temp_dir = os.path.join(root, 'tmp')
+
+    def path(self, key):
+        path = safe_join(self.root, key)
+        if path is None:
+            raise ValueError(f"Invalid storage key {key}")
+        return path
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def put_file(self, key, local_path):
+        """Move a local file into storage under `key`"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(local_path, path)
+        except OSError:
+            # Temporary files on another filesystem cannot be renamed into place
+            shutil.move(local_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def move(self, source_key, key):
+        self.put_file(key, self.path(source_key))
+
+    # Multipart uploads keep each part in a directory next to the final key
+    # and concatenate them on completion
+
+    def start_multipart(self, key):
+        os.makedirs(self.path(f"{key}.parts"), exist_ok=True)
+        return None
+
+    def put_part(self, key, token, number, stream, chunk_size=64 * 1024):
+        """Write one part from a stream; return (size, etag)"""
+        parts_dir = self.path(f"{key}.parts")
+        fd, temp_path = tempfile.mkstemp(dir=parts_dir)
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    out.write(chunk)
+            # A re-sent part replaces the earlier attempt
+            os.replace(temp_path, os.path.join(parts_dir, f"{number:05d}"))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return size, None
+
+    def complete_multipart(self, key, token, parts):
+        """Join the parts, a list of (number, etag) in order, into `key`"""
+        parts_dir = self.path(f"{key}.parts")
+        if not os.path.isdir(parts_dir) and self.exists(key):
+            return  # Already completed by an earlier attempt
+
+        path = self.path(key)
+        with open(path, 'wb') as out:
+            for number, _ in parts:
+                with open(os.path.join(parts_dir, f"{number:05d}"), 'rb') as part:
+                    shutil.copyfileobj(part, out)
+        shutil.rmtree(parts_dir)
+
+    def abort_multipart(self, key, token):
+        shutil.rmtree(self.path(f"{key}.parts"), ignore_errors=True)
+        self.delete(key)
+
+    def iter_files(self):
+        """Yield (key, modified timestamp) for every stored file"""
+        for root, dirs, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    modified = os.path.getmtime(path)
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(path, self.root).replace(os.sep, '/'), modified
+
+    def send(self, key, download_name, etag=True):
+        """
+        Send a stored file as an attachment. Conditional and Range requests
+        are answered by Werkzeug. With DOWNLOAD_OFFLOAD set to
+        "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd) the
+        worker only sends headers and the web server moves the bytes.
+        """
+        try:
+            if not self.exists(key):
+                abort(404)
+        except ValueError:
+            abort(404)
+
+        if current_app.config.get('DOWNLOAD_OFFLOAD') == 'x-accel-redirect':
+            # nginx serves the internal location itself, including Range requests
+            response = current_app.response_class(
+                mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+            )
+            prefix = current_app.config.get('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')
+            response.headers['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{key}"
+            response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+            if etag is not True:
+                response.set_etag(etag)
+            response.make_conditional(request)
+            return response
+
+        # X-Sendfile is handled by Flask when USE_X_SENDFILE is on
+        return send_from_directory(self.root, key, as_attachment=True, download_name=download_name, etag=etag)
+
+class S3Storage:
+    """
+    Files in an S3-compatible bucket (AWS S3, MinIO, ...). Downloads redirect
+    to short-lived presigned URLs so file bytes never pass through a worker.
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, presign_expires=300):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("The S3 storage backend requires boto3 (pip install boto3)")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.presign_expires = presign_expires
+        self.temp_dir = None  # Spool uploads in the system temporary directory
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+
+    def object_key(self, key):
+        return self.prefix + key
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put_file(self, key, local_path):
+        """Upload a local file under `key` (multipart for large files) and remove it"""
+        content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        self.client.upload_file(local_path, self.bucket, self.object_key(key),
+                                ExtraArgs={'ContentType': content_type})
+        os.remove(local_path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))['Body']
+
+    def move(self, source_key, key):
+        # Server-side copy; large objects are copied in parts by boto3
+        self.client.copy({'Bucket': self.bucket, 'Key': self.object_key(source_key)}, self.bucket, self.object_key(key))
+        self.delete(source_key)
+
+    def start_multipart(self, key):
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=self.object_key(key))['UploadId']
+
+    def put_part(self, key, token, number, stream, chunk_size=64 * 1024):
+        """Upload one part from a stream; return (size, etag)"""
+        # Spool to disk so the part can be checksummed and retried without
+        # holding it in memory
+        with tempfile.TemporaryFile() as spool:
+            shutil.copyfileobj(stream, spool, chunk_size)
+            size = spool.tell()
+            spool.seek(0)
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=self.object_key(key), UploadId=token,
+                PartNumber=number, Body=spool, ContentLength=size
+            )
+        return size, response['ETag']
+
+    def complete_multipart(self, key, token, parts):
+        """Assemble the parts, a list of (number, etag) in order, into `key`"""
+        if self.exists(key):
+            return  # Already completed by an earlier attempt
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.object_key(key), UploadId=token,
+            MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etag} for number, etag in parts]}
+        )
+
+    def abort_multipart(self, key, token):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.object_key(key), UploadId=token)
+        except ClientError:
+            pass  # Already completed or aborted
+        self.delete(key)
+
+    def iter_files(self):
+        """Yield (key, modified timestamp) for every stored file"""
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'][len(self.prefix):], item['LastModified'].timestamp()
+
+    def send(self, key, download_name, etag=True):
+        """Redirect to a presigned URL that downloads the file under `download_name`"""
+        url = self.client.generate_presigned_url('get_object', Params={
+            'Bucket': self.bucket,
+            'Key': self.object_key(key),
+            'ResponseContentDisposition': f'attachment; filename="{download_name}"',
+            'ResponseContentType': mimetypes.guess_type(download_name)[0] or 'application/octet-stream',
+        }, ExpiresIn=self.presign_expires)
+        response = redirect(url)
+        # The URL expires, so the redirect itself must not be reused for long
+        response.cache_control.private = True
+        response.cache_control.max_age = max(self.presign_expires // 2, 0)
+        return response
+
+def create_storage(config):
+    """Build the storage backend selected by STORAGE_BACKEND"""
+    backend = config.get('STORAGE_BACKEND', 'local')
+    if backend == 'local':
+        return LocalStorage(config['UPLOAD_FOLDER'])
+    if backend == 's3':
+        return S3Storage(
+            config['S3_BUCKET'],
+            prefix=config.get('S3_PREFIX', ''),
+            endpoint_url=config.get('S3_ENDPOINT_URL'),
+            region=config.get('S3_REGION'),
+            presign_expires=config.get('S3_PRESIGN_EXPIRES', 300)
+        )
+    raise ValueError(f"Unknown storage backend {backend}")
+
+def get_storage():
+    """Return the current app's storage backend, creating it on first use"""
+    storage = current_app.extensions.get('storage')
+    if storage is None:
+        storage = current_app.extensions['storage'] = create_storage(current_app.config)
+    return storage
@@ -0,0 +1,299 @@
+import logging
+from types import SimpleNamespace
+from datetime import date
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import Student, Module, Attendance, Grade, StudentSummary
+
+RECENT_LIMIT = 5
+
+def _grade_entry(grade_id, score, max_score, grade_date, comments, module_id, module_title):
+    return {
+        'id': grade_id,
+        'score': score,
+        'max_score': max_score,
+        'date': grade_date.isoformat() if grade_date else None,
+        'comments': comments,
+        'module_id': module_id,
+        'module_title': module_title,
+    }
+
+def _attendance_entry(attendance_id, attendance_date, status, notes):
+    return {
+        'id': attendance_id,
+        'date': attendance_date.isoformat() if attendance_date else None,
+        'status': status,
+        'notes': notes,
+    }
+
+def _newest_first(entry):
+    return (entry['date'] or '', entry['id'])
+
+def grade_entries(summary):
+    """Recent grades of a summary as objects shaped like Grade rows, for templates"""
+    return [
+        SimpleNamespace(
+            id=entry['id'],
+            score=entry['score'],
+            max_score=entry['max_score'],
+            date=date.fromisoformat(entry['date']) if entry['date'] else None,
+            comments=entry['comments'],
+            module_id=entry['module_id'],
+            module=SimpleNamespace(id=entry['module_id'], title=entry['module_title'])
+        )
+        for entry in summary.recent_grades
+    ]
+
+def attendance_entries(summary):
+    """Recent attendance of a summary as objects shaped like Attendance rows, for templates"""
+    return [
+        SimpleNamespace(
+            id=entry['id'],
+            date=date.fromisoformat(entry['date']) if entry['date'] else None,
+            status=entry['status'],
+            notes=entry['notes']
+        )
+        for entry in summary.recent_attendance
+    ]
+
+def _grade_fields(student_ids):
+    """Grade count, percentage sum and recent grades for each student, set-based"""
+    fields = {sid: {'grade_count': 0, 'grade_percentage_sum': 0, 'recent_grades': []} for sid in student_ids}
+
+    totals = db.session.query(
+        Grade.student_id,
+        func.count(Grade.id),
+        func.sum(Grade.score * 100.0 / Grade.max_score)
+    ).filter(Grade.student_id.in_(student_ids), Grade.max_score != 0).group_by(Grade.student_id)
+    for student_id, count, percentage_sum in totals:
+        fields[student_id]['grade_count'] = count
+        fields[student_id]['grade_percentage_sum'] = float(percentage_sum or 0)
+
+    position = func.row_number().over(
+        partition_by=Grade.student_id,
+        order_by=(Grade.date.desc(), Grade.id.desc())
+    ).label('position')
+    ranked = select(
+        Grade.id, Grade.student_id, Grade.score, Grade.max_score, Grade.date, Grade.comments, Grade.module_id, position
+    ).where(Grade.student_id.in_(student_ids)).subquery()
+    recent = db.session.execute(
+        select(ranked, Module.title)
+        .join(Module, Module.id == ranked.c.module_id)
+        .where(ranked.c.position <= RECENT_LIMIT)
+        .order_by(ranked.c.student_id, ranked.c.position)
+    )
+    for row in recent:
+        fields[row.student_id]['recent_grades'].append(
+            _grade_entry(row.id, row.score, row.max_score, row.date, row.comments, row.module_id, row.title)
+        )
+
+    return fields
+
+def _attendance_fields(student_ids):
+    """Attendance counts and recent attendance for each student, set-based"""
+    fields = {
+        sid: {'present_count': 0, 'absent_count': 0, 'late_count': 0, 'recent_attendance': []}
+        for sid in student_ids
+    }
+
+    counts = db.session.query(
+        Attendance.student_id,
+        Attendance.status,
+        func.count(Attendance.id)
+    ).filter(Attendance.student_id.in_(student_ids)).group_by(Attendance.student_id, Attendance.status)
+    for student_id, status, count in counts:
+        if status in ('present', 'absent', 'late'):
+            fields[student_id][f'{status}_count'] = count
+
+    position = func.row_number().over(
+        partition_by=Attendance.student_id,
+        order_by=(Attendance.date.desc(), Attendance.id.desc())
+    ).label('position')
+    ranked = select(
+        Attendance.id, Attendance.student_id, Attendance.date, Attendance.status, Attendance.notes, position
+    ).where(Attendance.student_id.in_(student_ids)).subquery()
+    recent = db.session.execute(
+        select(ranked)
+        .where(ranked.c.position <= RECENT_LIMIT)
+        .order_by(ranked.c.student_id, ranked.c.position)
+    )
+    for row in recent:
+        fields[row.student_id]['recent_attendance'].append(
+            _attendance_entry(row.id, row.date, row.status, row.notes)
+        )
+
+    return fields
+
+def _modules_fields(student_ids):
+    grade_levels = dict(db.session.execute(
+        select(Student.id, Student.grade_level).where(Student.id.in_(student_ids))
+    ).all())
+    module_counts = dict(db.session.execute(
+        select(Module.grade_level, func.count(Module.id))
+        .where(Module.grade_level.in_(set(grade_levels.values())))
+        .group_by(Module.grade_level)
+    ).all())
+    return {sid: {'modules_count': module_counts.get(grade_levels.get(sid), 0)} for sid in student_ids}
+
+def _insert_missing(student_ids):
+    """
+    Insert empty summaries for the students, leaving any that already exist,
+    including ones a concurrent request has just inserted
+    """
+    table = StudentSummary.__table__
+    rows = [{'student_id': sid, 'recent_grades': [], 'recent_attendance': []} for sid in student_ids]
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        db.session.execute(insert(table).values(rows).on_conflict_do_nothing(index_elements=['student_id']))
+        return
+
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(**row))
+        except IntegrityError:
+            pass
+
+def _load_summaries(student_ids, create=True):
+    """Return summaries for the students, locked for update, creating missing ones"""
+    if create:
+        _insert_missing(student_ids)
+    return {
+        summary.student_id: summary
+        for summary in StudentSummary.query.filter(StudentSummary.student_id.in_(student_ids)).with_for_update()
+    }
+
+def rebuild_students(student_ids):
+    """
+    Recompute the summaries of the given students from scratch. The caller is
+    responsible for committing.
+    """
+    student_ids = list(set(student_ids))
+    if not student_ids:
+        return {}
+
+    summaries = _load_summaries(student_ids)
+    # The new figures are written in one UPDATE per summary when the caller flushes
+    with db.session.no_autoflush:
+        for fields in (_grade_fields(student_ids), _attendance_fields(student_ids), _modules_fields(student_ids)):
+            for student_id, values in fields.items():
+                for name, value in values.items():
+                    setattr(summaries[student_id], name, value)
+
+    return summaries
+
+def rebuild_all(batch_size=500):
+    """Recompute every student's summary, committing one batch at a time"""
+    total = 0
+    last_id = 0
+    while True:
+        student_ids = db.session.execute(
+            select(Student.id).where(Student.id > last_id).order_by(Student.id).limit(batch_size)
+        ).scalars().all()
+        if not student_ids:
+            break
+
+        rebuild_students(student_ids)
+        db.session.commit()
+
+        total += len(student_ids)
+        last_id = student_ids[-1]
+
+    return total
+
+def get_summary(student_id, known_missing=False):
+    """
+    Return a student's summary, building and committing it if it does not
+    exist yet. Pass known_missing when the caller has already looked for it.
+    """
+    summary = None if known_missing else db.session.get(StudentSummary, student_id)
+    if summary is None:
+        summary = rebuild_students([student_id])[student_id]
+        db.session.commit()
+    return summary
+
+def grade_added(grade, module_title):
+    """
+    Fold a newly flushed grade into its student's summary. The caller is
+    responsible for committing.
+    """
+    summary = _load_summaries([grade.student_id], create=False).get(grade.student_id)
+    if summary is None:
+        rebuild_students([grade.student_id])
+        return
+
+    if grade.max_score:
+        summary.grade_count += 1
+        summary.grade_percentage_sum += grade.score * 100.0 / grade.max_score
+
+    entry = _grade_entry(grade.id, grade.score, grade.max_score, grade.date, grade.comments, grade.module_id, module_title)
+    recent = sorted(summary.recent_grades + [entry], key=_newest_first, reverse=True)
+    summary.recent_grades = recent[:RECENT_LIMIT]
+
+def attendance_changed(student_ids):
+    """
+    Refresh the attendance figures of students whose attendance was written.
+    Upserts can change an existing status, so the counts are recomputed with
+    one grouped query over the affected students. The caller is responsible
+    for committing.
+    """
+    student_ids = list(set(student_ids))
+    if not student_ids:
+        return
+
+    summaries = _load_summaries(student_ids, create=False)
+    missing = [sid for sid in student_ids if sid not in summaries]
+    if missing:
+        rebuild_students(missing)
+
+    present = [sid for sid in student_ids if sid in summaries]
+    if present:
+        for student_id, values in _attendance_fields(present).items():
+            for name, value in values.items():
+                setattr(summaries[student_id], name, value)
+
+def module_added(grade_level, delta=1):
+    """
+    Adjust the module count of every student in a grade level with a single
+    UPDATE. The caller is responsible for committing.
+    """
+    if not grade_level:
+        return
+
+    db.session.execute(
+        update(StudentSummary)
+        .where(StudentSummary.student_id.in_(
+            select(Student.id).where(Student.grade_level == grade_level)
+        ))
+        .values(modules_count=StudentSummary.modules_count + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+def module_removed(grade_level):
+    module_added(grade_level, delta=-1)
+
+@event.listens_for(Student, 'after_update')
+def _student_grade_level_changed(mapper, connection, target):
+    # A student moving grade level sees a different set of modules
+    if db.inspect(target).attrs.grade_level.history.has_changes():
+        connection.execute(
+            update(StudentSummary.__table__)
+            .where(StudentSummary.__table__.c.student_id == target.id)
+            .values(modules_count=select(func.count(Module.id))
+                    .where(Module.grade_level == target.grade_level)
+                    .scalar_subquery())
+        )
+
+@click.command('rebuild-summaries')
+@click.option('--batch-size', default=500, show_default=True, help='Students per transaction.')
+@with_appcontext
+def rebuild_summaries_command(batch_size):
+    """Rebuild every student's dashboard summary."""
+    total = rebuild_all(batch_size)
+    logging.info(f"Rebuilt {total} student summaries")
+    click.echo(f"Rebuilt {total} student summaries.")
@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Never run against a real database: use TEST_DATABASE_URL or a throwaway SQLite file
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ.setdefault("SESSION_SECRET", "test")
+
+from datetime import date, timedelta
+
+import jinja2
+import pytest
+
+@pytest.fixture(scope="session")
+def app():
+    """The application on an upgraded test database, with page templates stubbed out"""
+    from app import app as flask_app
+    from migrations import upgrade
+
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, UPLOAD_FOLDER=tempfile.mkdtemp())
+    # Views are exercised for their queries; their markup is not under test
+    flask_app.jinja_loader = jinja2.FunctionLoader(lambda name: name)
+    with flask_app.app_context():
+        upgrade()
+    return flask_app
+
+@pytest.fixture(scope="session")
+def school(app):
+    """A teacher with a class of students, modules, grades, attendance and notifications"""
+    from app import db
+    from models import User, Teacher, Student, Module, Grade, Attendance
+    from notifications import add_notification
+
+    with app.app_context():
+        teacher_user = User(username="teacher", email="teacher@example.com", role="teacher", password_hash="x")
+        db.session.add(teacher_user)
+        db.session.flush()
+        teacher = Teacher(first_name="Tess", last_name="Teacher", user_id=teacher_user.id)
+        db.session.add(teacher)
+        db.session.flush()
+
+        modules = [
+            Module(title=f"Module {i}", description="", grade_level="5", subject="Maths", teacher_id=teacher.id)
+            for i in range(3)
+        ]
+        db.session.add_all(modules)
+
+        students = []
+        for i in range(5):
+            user = User(username=f"student{i}", email=f"student{i}@example.com", role="student", password_hash="x")
+            db.session.add(user)
+            db.session.flush()
+            student = Student(first_name="Sam", last_name=f"Student {i}", grade_level="5", user_id=user.id)
+            db.session.add(student)
+            students.append(student)
+        db.session.flush()
+
+        today = date.today()
+        for student in students:
+            for day in range(3):
+                db.session.add(Attendance(date=today - timedelta(days=day), status="present",
+                                          student_id=student.id, recorded_by=teacher.id))
+            for module in modules:
+                db.session.add(Grade(score=8, max_score=10, date=today, student_id=student.id, module_id=module.id))
+            add_notification(student.id, teacher.id, "Hello", "Welcome")
+        db.session.commit()
+
+        return {
+            "teacher_user_id": teacher_user.id,
+            "student_user_ids": [student.user_id for student in students],
+        }
+
+@pytest.fixture
+def login(app):
+    """Return a function that logs a test client in as a user id"""
+    def login(client, user_id):
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+            session["_fresh"] = True
+        return client
+    return login
@@ -0,0 +1,93 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+class SSEHandler(BaseHTTPRequestHandler):
+    """Streams each scripted answer as chat completion deltas, with no charset on the content type"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests += 1
+        status, pieces = self.server.script.pop(0)
+        body = b"".join(
+            b"data: " + json.dumps({"choices": [{"delta": {"content": piece}}]}, ensure_ascii=False).encode() + b"\n\n"
+            for piece in pieces
+        ) + b"data: [DONE]\n\n"
+        self.send_response(status)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def upstream_sse(app, monkeypatch):
+    import ai_assistant
+    from response_cache import response_cache
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SSEHandler)
+    server.script = []
+    server.requests = 0
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(ai_assistant, "GITHUB_TOKEN", "token")
+    monkeypatch.setitem(app.config, "AI_API_BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setitem(app.config, "AI_API_MAX_RETRIES", 0)
+    app.extensions.pop("ai_client", None)
+    response_cache.clear()
+    yield server
+    app.extensions.pop("ai_client", None)
+    response_cache.clear()
+    server.shutdown()
+    server.server_close()
+
+def read_events(response):
+    """Parse a Server-Sent Events body into (event, data) pairs"""
+    body = response.get_data(as_text=True)
+    assert body.endswith("\n\n")
+    events = []
+    for message in body[:-2].split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in message.split("\n"))
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+def ask(app, login, school, prompt):
+    client = login(app.test_client(), school["student_user_ids"][0])
+    response = client.post("/api/ai/educational_assistant/stream", json={"prompt": prompt})
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    return read_events(response)
+
+def test_answer_is_streamed_as_utf8_then_done(app, school, login, upstream_sse):
+    pieces = ["Café ", "au lait, ", "π ≈ 3.14 ", "🙂"]
+    upstream_sse.script = [(200, pieces)]
+
+    events = ask(app, login, school, "What is pi?")
+    assert events[:-1] == [("message", {"text": piece}) for piece in pieces]
+    assert events[-1] == ("done", {"message": "Comprehensive educational assistant response", "cached": False})
+
+def test_repeated_question_is_replayed_from_the_cache(app, school, login, upstream_sse):
+    upstream_sse.script = [(200, ["Photo", "synthesis"])]
+
+    ask(app, login, school, "Explain photosynthesis")
+    events = ask(app, login, school, "explain   PHOTOSYNTHESIS?")
+    assert events == [
+        ("message", {"text": "Photosynthesis"}),
+        ("done", {"message": "Comprehensive educational assistant response", "cached": True}),
+    ]
+    assert upstream_sse.requests == 1
+
+def test_failed_answer_ends_with_an_error_and_is_not_cached(app, school, login, upstream_sse):
+    upstream_sse.script = [(500, []), (200, ["Fine now"])]
+
+    events = ask(app, login, school, "Explain gravity")
+    assert [event for event, data in events] == ["error"]
+    assert "error" in events[0][1]
+
+    events = ask(app, login, school, "Explain gravity")
+    assert events[0] == ("message", {"text": "Fine now"})
+    assert upstream_sse.requests == 2
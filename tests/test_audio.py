@@ -0,0 +1,137 @@
+import io
+import threading
+import time
+import wave
+import pytest
+from audio import split_audio, stitch_transcripts, transcribe_segments
+
+FRAME_HEADER = b"\xff\xfb\x90\x00"  # MPEG-1 layer III, 128kbps, 44.1kHz
+FRAME_BYTES = 417
+FRAME_SECONDS = 1152 / 44100
+
+def make_wav(seconds, rate=8000):
+    data = io.BytesIO()
+    with wave.open(data, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        # Each frame holds its own number, so segments can be traced back
+        out.writeframes(b"".join((n % 65536).to_bytes(2, "little") for n in range(seconds * rate)))
+    data.seek(0)
+    return data
+
+def wav_frames(segment):
+    with wave.open(segment.data, "rb") as source:
+        samples = source.readframes(source.getnframes())
+    return [int.from_bytes(samples[i:i + 2], "little") for i in range(0, len(samples), 2)]
+
+def make_mp3(frames, id3=b""):
+    # Each frame's body carries its number after the header
+    return io.BytesIO(id3 + b"".join(
+        FRAME_HEADER + n.to_bytes(4, "big") + bytes(FRAME_BYTES - 8) for n in range(frames)
+    ))
+
+def mp3_frames(segment):
+    data = segment.data.getvalue()
+    assert len(data) % FRAME_BYTES == 0
+    return [int.from_bytes(data[i + 4:i + 8], "big") for i in range(0, len(data), FRAME_BYTES)]
+
+def test_wav_segments_overlap_and_cover_the_recording():
+    segments = list(split_audio(make_wav(10), "lecture.wav", "audio/wav", 4, 1))
+
+    assert [segment.start for segment in segments] == [0, 3, 6]
+    assert [segment.file_name for segment in segments] == ["lecture-0.wav", "lecture-1.wav", "lecture-2.wav"]
+    frames = [wav_frames(segment) for segment in segments]
+    assert [(f[0], len(f)) for f in frames] == [(0, 32000), (24000, 32000), (48000, 32000)]
+    # Each segment repeats the last second of the one before
+    assert frames[0][-8000:] == frames[1][:8000]
+
+def test_mp3_segments_are_cut_between_frames_with_overlap():
+    total = 200  # About 5.2 seconds
+    segments = list(split_audio(make_mp3(total), "lecture.mp3", "audio/mpeg", 2, 0.5))
+
+    frames = [mp3_frames(segment) for segment in segments]
+    assert [segment.start for segment in segments] == [0, 1.5, 3.0, 4.5]
+    for segment, numbers in zip(segments, frames):
+        # Whole frames from the segment's start up to its length
+        assert numbers == list(range(numbers[0], numbers[-1] + 1))
+        assert numbers[0] * FRAME_SECONDS >= segment.start
+        assert (numbers[-1] + 1) * FRAME_SECONDS <= segment.start + 2 + FRAME_SECONDS
+    for earlier, later in zip(frames, frames[1:]):
+        overlap = set(earlier) & set(later)
+        assert abs(len(overlap) * FRAME_SECONDS - 0.5) <= FRAME_SECONDS
+    assert frames[-1][-1] == total - 1
+
+def test_id3_tag_is_skipped():
+    # The tag's body looks like a frame header, so it must be skipped by its size
+    body = (FRAME_HEADER + bytes(8)) * 10
+    size = len(body)
+    id3 = b"ID3\x04\x00\x00" + bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F]) + body
+    segments = list(split_audio(make_mp3(50, id3=id3), "talk.mp3", "audio/mpeg", 60, 5))
+
+    assert len(segments) == 1
+    assert mp3_frames(segments[0]) == list(range(50))
+
+@pytest.mark.parametrize("file_name, data", [
+    ("broken.wav", b"RIFF not really a wave file"),
+    ("broken.mp3", b"no frames in here at all"),
+    ("voice.ogg", b"OggS an unsupported format"),
+])
+def test_unparseable_recordings_are_sent_whole(file_name, data):
+    stream = io.BytesIO(b"prefix" + data)
+    stream.seek(len(b"prefix"))
+
+    segments = list(split_audio(stream, file_name, "audio/x-test", 10, 1))
+    assert len(segments) == 1
+    segment = segments[0]
+    assert (segment.index, segment.start, segment.file_name) == (0, 0.0, file_name)
+    assert segment.data is stream
+    assert stream.read() == data
+
+def test_parallel_transcripts_come_back_in_order():
+    class Piece:
+        def __init__(self, index):
+            self.index = index
+
+    lock = threading.Lock()
+    running = []
+    most = []
+    finished = []
+    held = []
+
+    def pieces():
+        for index in range(12):
+            # Pieces read but not yet transcribed, counting this one
+            held.append(index + 1 - len(finished))
+            yield Piece(index)
+
+    def transcribe(piece):
+        with lock:
+            running.append(piece.index)
+            most.append(len(running))
+        # Earlier pieces take longer, so they finish out of order
+        time.sleep(0.002 * (12 - piece.index))
+        with lock:
+            running.remove(piece.index)
+            finished.append(piece.index)
+        return f"text {piece.index}"
+
+    assert transcribe_segments(pieces(), transcribe, workers=3) == [f"text {index}" for index in range(12)]
+    assert max(most) <= 3
+    assert max(held) <= 3
+
+def test_repeated_words_are_dropped_when_joining():
+    texts = ["so the mitochondria is the powerhouse", "The powerhouse, of the cell. Next we"]
+    assert stitch_transcripts(texts, 2) == "so the mitochondria is the powerhouse of the cell. Next we"
+    texts = ["we covered the cell", "the cell wall today"]
+    assert stitch_transcripts(texts, 2) == "we covered the cell wall today"
+
+def test_a_single_shared_word_is_kept():
+    texts = ["and that is the answer", "answer key is on page ten"]
+    assert stitch_transcripts(texts, 2) == "and that is the answer answer key is on page ten"
+
+def test_matches_longer_than_the_overlap_can_hold_are_ignored():
+    # Two seconds hold at most ten words, so a longer repeat is real speech
+    refrain = "row row row your boat gently down the stream merrily merrily"
+    texts = [f"sing {refrain}", f"{refrain} life is but a dream"]
+    assert stitch_transcripts(texts, 2).split().count("gently") == 2
@@ -0,0 +1,93 @@
+import hashlib
+import pytest
+
+CONTENT = b"0123456789 worksheet answers"
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+@pytest.fixture(scope="module")
+def shared_file(app, school, tmp_path_factory):
+    """One stored file used by an older module of another teacher and by the school teacher's module"""
+    from app import db
+    from models import Module, Teacher, User
+    from storage import get_storage
+    from summaries import module_added
+    from uploads import blob_key
+
+    path = tmp_path_factory.mktemp("download") / "worksheet"
+    path.write_bytes(CONTENT)
+    with app.app_context():
+        get_storage().put_file(blob_key(SHA256), str(path))
+
+        other_user = User(username="other-teacher", email="other@example.com", role="teacher", password_hash="x")
+        db.session.add(other_user)
+        db.session.flush()
+        other = Teacher(first_name="Otto", last_name="Other", user_id=other_user.id)
+        db.session.add(other)
+        db.session.flush()
+        teacher = db.session.get(User, school["teacher_user_id"]).teacher
+
+        modules = [
+            Module(title=title, description="", grade_level="5", subject="Maths", teacher_id=teacher_id,
+                   file_hash=SHA256, file_path=blob_key(SHA256), file_name=file_name)
+            for title, teacher_id, file_name in (
+                ("Older copy", other.id, "older.pdf"),
+                ("Own copy", teacher.id, "own.pdf"),
+            )
+        ]
+        db.session.add_all(modules)
+        module_added("5", delta=len(modules))
+        db.session.commit()
+        return {"key": blob_key(SHA256), "older": modules[0].id, "own": modules[1].id}
+
+def download_name(response):
+    return response.headers["Content-Disposition"].split("filename=")[1]
+
+def test_module_download_uses_its_own_name(app, school, login, shared_file):
+    client = login(app.test_client(), school["student_user_ids"][0])
+    for module, name in (("older", "older.pdf"), ("own", "own.pdf")):
+        response = client.get(f"/modules/{shared_file[module]}/download")
+        assert response.status_code == 200
+        assert download_name(response) == name
+        assert response.data == CONTENT
+    assert client.get("/modules/999999/download").status_code == 404
+
+def test_file_download_prefers_the_users_module_then_the_oldest(app, school, login, shared_file):
+    teacher = login(app.test_client(), school["teacher_user_id"])
+    student = login(app.test_client(), school["student_user_ids"][0])
+    assert download_name(teacher.get(f"/download/{shared_file['key']}")) == "own.pdf"
+    assert download_name(student.get(f"/download/{shared_file['key']}")) == "older.pdf"
+
+def test_unchanged_file_is_not_sent_again(app, school, login, shared_file):
+    client = login(app.test_client(), school["student_user_ids"][0])
+    url = f"/modules/{shared_file['own']}/download"
+
+    response = client.get(url)
+    assert response.headers["ETag"] == f'"{SHA256}"'
+    assert "immutable" in response.headers["Cache-Control"]
+
+    response = client.get(url, headers={"If-None-Match": f'"{SHA256}"'})
+    assert response.status_code == 304
+    assert response.data == b""
+
+def test_range_request_sends_part_of_the_file(app, school, login, shared_file):
+    client = login(app.test_client(), school["student_user_ids"][0])
+
+    response = client.get(f"/modules/{shared_file['own']}/download", headers={"Range": "bytes=2-5"})
+    assert response.status_code == 206
+    assert response.data == CONTENT[2:6]
+    assert response.headers["Content-Range"] == f"bytes 2-5/{len(CONTENT)}"
+
+def test_offloaded_download_leaves_the_bytes_to_nginx(app, school, login, shared_file, monkeypatch):
+    monkeypatch.setitem(app.config, "DOWNLOAD_OFFLOAD", "x-accel-redirect")
+    client = login(app.test_client(), school["student_user_ids"][0])
+    url = f"/modules/{shared_file['own']}/download"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers["X-Accel-Redirect"] == f"/protected-uploads/{shared_file['key']}"
+    assert download_name(response) == "own.pdf"
+    assert response.headers["ETag"] == f'"{SHA256}"'
+    assert response.data == b""
+
+    response = client.get(url, headers={"If-None-Match": f'"{SHA256}"'})
+    assert response.status_code == 304
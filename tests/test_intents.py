@@ -0,0 +1,17 @@
+import pytest
+from intents import topic_index
+
+@pytest.mark.parametrize("prompt, role, first_line", [
+    ("How do I solve this algebra equation?", "student", "Let me help you understand this mathematical concept clearly."),
+    ("Explain photosynthesis in biology", "student", "I'll help you understand this scientific concept thoroughly."),
+    ("Tell me about the French revolution", "student", "I'm happy to help you understand this concept thoroughly."),
+    ("Help me plan a lesson on fractions", "teacher", "# Comprehensive Lesson Plan Framework"),
+    ("How should I grade this test?", "teacher", "# Comprehensive Assessment Strategy Guide"),
+    ("How do I keep my class engaged?", "teacher", "# Comprehensive Teaching Strategy Guide"),
+])
+def test_prompt_gets_its_topics_answer(prompt, role, first_line):
+    topic = topic_index.match(prompt, role)
+    assert topic.response.strip().splitlines()[0] == first_line
+
+def test_every_role_has_a_default_topic():
+    assert set(topic_index.defaults) == {"student", "teacher"}
@@ -0,0 +1,65 @@
+from sqlalchemy import update
+from app import app as flask_app  # Loads the app before the job modules it imports
+from jobs import job_handler
+
+calls = []
+
+@job_handler("test_record")
+def record_call(value, fail=False):
+    calls.append(value)
+    if fail:
+        raise RuntimeError("boom")
+    return {"value": value}
+
+def claim(payload):
+    from app import db
+    from jobs import claim_job, enqueue
+
+    enqueue("test_record", payload)
+    db.session.commit()
+    return claim_job("worker-a")
+
+def take_over(job_id):
+    """Hand the job to another worker, as when the first one's claim lapses"""
+    from app import db
+    from models import Job
+
+    db.session.execute(update(Job).where(Job.id == job_id).values(locked_by="worker-b"))
+    db.session.commit()
+
+def test_finished_job_is_recorded(app):
+    from app import db
+    from jobs import run_job
+    from models import Job
+
+    with app.app_context():
+        job = claim({"value": 1})
+        assert run_job(job, "worker-a")
+        job = db.session.get(Job, job.id)
+        assert (job.status, job.result, job.locked_by) == ("done", {"value": 1}, None)
+
+def test_result_is_dropped_once_the_claim_is_lost(app):
+    from app import db
+    from jobs import run_job
+    from models import Job
+
+    with app.app_context():
+        job = claim({"value": 2})
+        job_id = job.id
+        take_over(job_id)
+        assert not run_job(job, "worker-a")
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.result, job.locked_by) == ("running", None, "worker-b")
+
+def test_failure_is_not_counted_once_the_claim_is_lost(app):
+    from app import db
+    from jobs import run_job
+    from models import Job
+
+    with app.app_context():
+        job = claim({"value": 3, "fail": True})
+        job_id = job.id
+        take_over(job_id)
+        assert not run_job(job, "worker-a")
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.last_error, job.locked_by) == ("running", None, "worker-b")
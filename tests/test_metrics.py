@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+def statement_count():
+    from metrics import SQL_STATEMENTS
+    return SQL_STATEMENTS.values.get(("background",), 0)
+
+def checkout_count():
+    from metrics import POOL_CHECKOUT_WAIT
+    series = POOL_CHECKOUT_WAIT.values.get(())
+    return series[2] if series else 0
+
+def test_failed_statement_does_not_skew_the_next(app):
+    from app import db
+
+    with app.app_context(), db.engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM no_such_table"))
+        conn.rollback()
+
+        before = statement_count()
+        conn.execute(text("SELECT 1"))
+        assert statement_count() == before + 1
+        assert "metrics_start" not in conn.info
+
+def test_checkouts_are_timed_after_dispose(app):
+    from app import db
+
+    with app.app_context():
+        db.engine.dispose()
+        before = checkout_count()
+        with db.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        assert checkout_count() == before + 1
@@ -0,0 +1,42 @@
+import hashlib
+import os
+from datetime import datetime
+from sqlalchemy import text
+
+def add_legacy_module(conn, teacher_id, file_path):
+    conn.execute(text(
+        "INSERT INTO modules (title, file_path, teacher_id, created_at) VALUES ('Legacy', :path, :teacher, :now)"
+    ), {"path": file_path, "teacher": teacher_id, "now": datetime.utcnow()})
+
+def test_legacy_files_are_removed_only_after_commit(app, school):
+    from app import db
+    from models import Teacher
+    from migrations import store_uploads_by_content
+    from storage import get_storage
+    from uploads import blob_key
+
+    content = b"legacy module file"
+    name = "0" * 36 + "_legacy.txt"
+    with app.app_context():
+        teacher_id = Teacher.query.filter_by(user_id=school["teacher_user_id"]).one().id
+        legacy_path = os.path.join(app.config["UPLOAD_FOLDER"], name)
+        with open(legacy_path, "wb") as f:
+            f.write(content)
+
+        # A migration that rolls back must leave the original in place
+        with db.engine.connect() as conn:
+            transaction = conn.begin()
+            add_legacy_module(conn, teacher_id, name)
+            store_uploads_by_content(conn)
+            transaction.rollback()
+        assert os.path.exists(legacy_path)
+
+        with db.engine.begin() as conn:
+            add_legacy_module(conn, teacher_id, name)
+            after_commit = store_uploads_by_content(conn)
+            assert os.path.exists(legacy_path)
+        after_commit()
+
+        assert not os.path.exists(legacy_path)
+        with get_storage().open(blob_key(hashlib.sha256(content).hexdigest())) as f:
+            assert f.read() == content
@@ -0,0 +1,34 @@
+from app import app as flask_app  # Loads the app before the job modules it imports
+from querycount import count_queries
+
+def unread(student_user_id):
+    from models import Notification, Student
+
+    student = Student.query.filter_by(user_id=student_user_id).one()
+    return student.unread_notifications, Notification.query.filter_by(student_id=student.id, read=False).count()
+
+def test_viewing_marks_new_notifications_read(app, school, login):
+    from app import db
+    from models import Student, Teacher
+    from notifications import add_notification
+
+    user_id = school["student_user_ids"][-1]
+    client = login(app.test_client(), user_id)
+    assert client.get("/student/notifications").status_code == 200
+
+    # Nothing is unread, so the view only reads
+    with count_queries() as counter:
+        assert client.get("/student/notifications").status_code == 200
+    assert not any(statement.lstrip().upper().startswith("UPDATE") for statement in counter.statements)
+
+    # The profile cached by the first views still says nothing is unread
+    with app.app_context():
+        student = Student.query.filter_by(user_id=user_id).one()
+        teacher = Teacher.query.filter_by(user_id=school["teacher_user_id"]).one()
+        add_notification(student.id, teacher.id, "Homework", "Page 12")
+        db.session.commit()
+        assert unread(user_id) == (1, 1)
+
+    assert client.get("/student/notifications").status_code == 200
+    with app.app_context():
+        assert unread(user_id) == (0, 0)
@@ -0,0 +1,107 @@
+import io
+import sys
+import zipfile
+import pytest
+from app import app as flask_app  # Loads the app before the job modules it imports
+from processing import PDF_PAGE_PATTERN, count_pdf_pages, extract
+
+def fake_pdf(pages):
+    objects = [b"1 0 obj << /Type /Pages /Count %d >> endobj" % pages]
+    for number in range(pages):
+        objects.append(b"%d 0 obj << /Type/Page /Parent 1 0 R >> endobj" % (number + 2))
+    return b"%PDF-1.4\n" + b"\n".join(objects) + b"\n%%EOF\n"
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 1000, 64 * 1024])
+def test_pages_are_counted_across_chunk_boundaries(chunk_size):
+    data = fake_pdf(25)
+    assert len(PDF_PAGE_PATTERN.findall(data)) == 25
+    assert count_pdf_pages(io.BytesIO(data), chunk_size=chunk_size, overlap=16) == 25
+
+def test_pdf_page_count_without_a_pdf_library(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pypdf", None)
+    monkeypatch.setitem(sys.modules, "fitz", None)
+    path = tmp_path / "lesson.pdf"
+    path.write_bytes(fake_pdf(3))
+    with open(path, "rb") as f:
+        assert extract(f, "lesson.pdf").page_count == 3
+
+def make_docx(paragraphs, pages=None):
+    ns = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+    body = "".join(
+        "<w:p>" + "".join(f"<w:r><w:t>{run}</w:t></w:r>" for run in runs) + "</w:p>"
+        for runs in paragraphs
+    )
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as docx:
+        docx.writestr("word/document.xml", f'<w:document xmlns:w="{ns}"><w:body>{body}</w:body></w:document>')
+        if pages:
+            docx.writestr("docProps/app.xml", f"<Properties><Pages>{pages}</Pages></Properties>")
+    data.seek(0)
+    return data
+
+def test_text_is_kept_up_to_the_limit_but_every_word_is_counted(monkeypatch):
+    import processing
+
+    # Small reads, so words and UTF-8 characters fall across them
+    monkeypatch.setattr(processing, "CHUNK_CHARS", 5)
+    content = "naïve café words " * 50
+    info = extract(io.BytesIO(content.encode()), "notes.txt", max_chars=20)
+    assert info.text == content[:20]
+    assert info.word_count == 150
+
+    info = extract(io.BytesIO(content.encode()), "notes.txt")
+    assert info.text == content
+    assert info.word_count == len(content.split())
+
+def test_docx_text_is_streamed_by_paragraph():
+    info = extract(make_docx([["Hello ", "world"], ["Second", " paragraph here"]], pages=2), "lesson.docx")
+    assert info.text == "Hello world\nSecond paragraph here"
+    assert (info.word_count, info.page_count) == (5, 2)
+
+    info = extract(make_docx([["Hello ", "world"], ["Second", " paragraph here"]]), "lesson.docx", max_chars=8)
+    assert (info.text, info.word_count, info.page_count) == ("Hello wo", 5, None)
+
+def text_pdf(pages):
+    """A PDF with one line of Helvetica text per page"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % (4 + 2 * n) for n in range(len(pages))), len(pages)),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for number, line in enumerate(pages):
+        stream = b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % line.encode()
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * number))
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return data
+
+def test_pdf_text_is_extracted_with_pypdf(tmp_path):
+    pytest.importorskip("pypdf")
+    path = tmp_path / "lesson.pdf"
+    path.write_bytes(text_pdf(["Fractions and decimals", "Long division"]))
+    with open(path, "rb") as f:
+        info = extract(f, "lesson.pdf", max_chars=15)
+    assert info.text == "Fractions and d"
+    assert (info.word_count, info.page_count) == (5, 2)
+
+def test_image_thumbnail_is_rendered_with_pillow():
+    Image = pytest.importorskip("PIL.Image")
+    data = io.BytesIO()
+    Image.new("RGBA", (1200, 600), (255, 0, 0, 128)).save(data, "PNG")
+    data.seek(0)
+
+    info = extract(data, "diagram.png")
+    assert info.page_count == 1
+    with Image.open(io.BytesIO(info.thumbnail)) as thumbnail:
+        assert thumbnail.format == "PNG"
+        assert thumbnail.mode == "RGB"
+        assert thumbnail.size == (320, 160)
@@ -0,0 +1,65 @@
+"""
+Serve every view declared with @query_budget under TESTING, where going
+over the budget raises QueryBudgetExceeded and fails the test. Page
+templates are stubbed, so queries issued from inside real templates are
+not counted here.
+"""
+import pytest
+from app import app as flask_app
+
+STUDENT_PAGES = [
+    "/student/dashboard",
+    "/student/modules",
+    "/student/grades",
+    "/student/attendance",
+    "/student/notifications",
+]
+TEACHER_PAGES = [
+    "/teacher/dashboard",
+    "/teacher/modules",
+    "/teacher/grades",
+    "/teacher/attendance",
+    "/teacher/notifications",
+    "/api/students/search?q=sam",
+]
+
+def budgeted_endpoints():
+    return {
+        endpoint for endpoint, view in flask_app.view_functions.items()
+        if hasattr(view, "query_budget")
+    }
+
+def test_every_budgeted_view_is_covered(app):
+    with app.test_request_context():
+        covered = {
+            app.url_map.bind("localhost").match(url.split("?")[0])[0]
+            for url in STUDENT_PAGES + TEACHER_PAGES
+        }
+    assert budgeted_endpoints() <= covered
+
+@pytest.mark.parametrize("url", STUDENT_PAGES)
+def test_student_page_within_budget(app, school, login, url):
+    client = login(app.test_client(), school["student_user_ids"][0])
+    # The second request is served from the built summaries and caches
+    for _ in range(2):
+        response = client.get(url)
+        assert response.status_code == 200
+
+@pytest.mark.parametrize("url", TEACHER_PAGES)
+def test_teacher_page_within_budget(app, school, login, url):
+    client = login(app.test_client(), school["teacher_user_id"])
+    for _ in range(2):
+        response = client.get(url)
+        assert response.status_code == 200
+
+def test_overrun_fails_under_testing(app):
+    from querycount import QueryBudgetExceeded, query_budget
+    from models import User
+
+    @query_budget(0)
+    def view():
+        return str(User.query.count())
+
+    with app.test_request_context():
+        with pytest.raises(QueryBudgetExceeded):
+            view()
@@ -0,0 +1,78 @@
+import time
+import pytest
+from app import app as flask_app  # Loads the app before the modules it imports
+from response_cache import ResponseCache, cache_key, cached_response, normalize_prompt, response_cache
+
+@pytest.fixture
+def config(app, monkeypatch):
+    monkeypatch.setitem(app.config, "AI_RESPONSE_CACHE_TTL", 10)
+    monkeypatch.setitem(app.config, "AI_RESPONSE_CACHE_SIZE", 1024)
+    monkeypatch.setitem(app.config, "AI_RESPONSE_CACHE_SHARED", False)
+    with app.app_context():
+        yield app.config
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+def test_prompts_are_folded_before_matching():
+    assert normalize_prompt("  What IS   photo-synthesis?!\n") == "what is photo synthesis"
+    assert normalize_prompt("Straße ﬁle") == "strasse file"
+    assert cache_key("student", "What is photosynthesis?") == cache_key("student", "what is PHOTOSYNTHESIS")
+    assert cache_key("student", "What is photosynthesis?") != cache_key("teacher", "What is photosynthesis?")
+
+def test_entries_expire_after_the_ttl(config, clock):
+    cache = ResponseCache()
+    cache.put("student", "question", {"response": "answer"})
+
+    clock[0] += 9.9
+    assert cache.get("student", "question") == {"response": "answer"}
+    clock[0] += 0.2
+    assert cache.get("student", "question") is None
+    assert not cache.entries
+
+def test_least_recently_used_entry_is_evicted(config, clock):
+    config["AI_RESPONSE_CACHE_SIZE"] = 2
+    cache = ResponseCache()
+    cache.put("student", "first", {"response": 1})
+    cache.put("student", "second", {"response": 2})
+    assert cache.get("student", "first") == {"response": 1}
+
+    cache.put("student", "third", {"response": 3})
+    assert len(cache.entries) == 2
+    assert cache.get("student", "second") is None
+    assert cache.get("student", "first") == {"response": 1}
+    assert cache.get("student", "third") == {"response": 3}
+
+def test_shared_hit_fills_the_local_tier(config, clock):
+    config["AI_RESPONSE_CACHE_SHARED"] = True
+    ResponseCache().put("teacher", "lesson plan for fractions", {"response": "plan"})
+
+    # Another worker finds it in the database and keeps it for no longer than it lives there
+    worker = ResponseCache()
+    assert worker.get("teacher", "Lesson plan for fractions?") == {"response": "plan"}
+    key = cache_key("teacher", "lesson plan for fractions")
+    expires_at, response = worker.entries[key]
+    assert response == {"response": "plan"}
+    assert expires_at <= clock[0] + 10
+
+    config["AI_RESPONSE_CACHE_SHARED"] = False
+    assert worker.get("teacher", "lesson plan for fractions") == {"response": "plan"}
+
+def test_error_responses_are_never_cached(config):
+    answers = [({"error": "upstream failed"}, 500), ({"response": "fine"}, 200)]
+    calls = []
+
+    @cached_response
+    def assistant(prompt, role):
+        calls.append(prompt)
+        return answers.pop(0)
+
+    response_cache.clear()
+    assert assistant("why is the sky blue", "student") == ({"error": "upstream failed"}, 500)
+    assert assistant("why is the sky blue", "student") == ({"response": "fine"}, 200)
+    assert assistant("Why is the sky blue?", "student") == ({"response": "fine"}, 200)
+    assert len(calls) == 2
+    response_cache.clear()
@@ -0,0 +1,21 @@
+def test_bump_creates_then_increments_the_version(app):
+    from app import db
+    from roster import bump_roster_version, current_version
+
+    with app.app_context():
+        before = current_version()
+        with db.engine.begin() as connection:
+            bump_roster_version(connection)
+            bump_roster_version(connection)
+        assert current_version() == before + 2
+
+def test_search_reads_one_snapshot(app, school):
+    from roster import roster_cache
+
+    with app.app_context():
+        results = roster_cache.search("sam", limit=3)
+        students, keys, key_ids = roster_cache.snapshot
+
+    assert len(results) == 3
+    assert len(keys) == len(key_ids)
+    assert all(result["id"] in students for result in results)
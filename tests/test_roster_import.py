@@ -0,0 +1,60 @@
+import io
+import time
+from app import app as flask_app  # Loads the app before the job modules it imports
+
+ROSTER = (
+    "username,email,role,first_name,last_name,password,grade_level\n"
+    "pupil1,pupil1@example.com,student,Pat,Pupil,password1,5\n"
+    "pupil2,pupil2@example.com,student,Pip,Pupil,password2,5\n"
+    "x,bad,student,No,Name,short,5\n"
+)
+
+def wait_for(client, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/jobs/{job_id}").get_json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+def test_uploaded_roster_is_imported_in_the_background(app, login, monkeypatch):
+    from app import db
+    from models import User
+
+    monkeypatch.setitem(app.config, "PASSWORD_HASH_METHOD", "pbkdf2:sha256:1000")
+    monkeypatch.setitem(app.config, "ROSTER_IMPORT_WORKERS", 1)
+    with app.app_context():
+        admin = User(username="importer", email="importer@example.com", role="admin", password_hash="x")
+        db.session.add(admin)
+        db.session.commit()
+        client = login(app.test_client(), admin.id)
+
+    response = client.post("/api/admin/roster/import", data={"file": (io.BytesIO(ROSTER.encode()), "roster.csv")})
+    assert response.status_code == 202
+    job = wait_for(client, response.get_json()["job_id"])
+
+    assert job["status"] == "done", job["error"]
+    assert job["result"]["created"] == 2
+    assert [error["line"] for error in job["result"]["errors"]] == [4]
+    with app.app_context():
+        assert User.query.filter(User.username.in_(["pupil1", "pupil2"])).count() == 2
+        # The spooled copy is gone once it has been imported
+        from storage import get_storage
+        assert not [key for key, _ in get_storage().iter_files() if "roster-" in key]
+
+def test_importer_is_loaded_only_when_used():
+    import os
+    import subprocess
+    import sys
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = (
+        "import sys, main\n"
+        "assert 'roster_import' not in sys.modules\n"
+        "assert 'import-roster' in main.app.cli.list_commands(None)\n"
+        "from jobs import get_handler\n"
+        "assert get_handler('import_roster') is not None\n"
+        "assert 'roster_import' in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=root, check=True)
@@ -0,0 +1,24 @@
+import io
+
+def post_recording(app, login, school, url, size):
+    client = login(app.test_client(), school["student_user_ids"][0])
+    return client.post(url, data={"audio": (io.BytesIO(b"\0" * size), "lecture.ogg")},
+                       content_type="multipart/form-data")
+
+def test_recordings_may_exceed_the_form_limit(app, school, login, monkeypatch):
+    import ai_assistant
+
+    monkeypatch.setattr(ai_assistant, "GITHUB_TOKEN", "token")
+    monkeypatch.setitem(app.config, "AI_API_BASE_URL", None)
+    monkeypatch.setitem(app.config, "MAX_CONTENT_LENGTH", 10_000)
+    monkeypatch.setitem(app.config, "AUDIO_MAX_CONTENT_LENGTH", 100_000)
+
+    response = post_recording(app, login, school, "/api/ai/speech_to_text", 50_000)
+    assert response.status_code == 200
+    assert response.json["segments"] == 1
+
+    assert post_recording(app, login, school, "/api/ai/speech_to_text", 150_000).status_code == 413
+    # Other forms keep the smaller limit
+    client = login(app.test_client(), school["student_user_ids"][0])
+    response = client.post("/api/ai/text_to_speech", json={"text": "x" * 50_000})
+    assert response.status_code == 413
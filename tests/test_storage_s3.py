@@ -0,0 +1,74 @@
+import io
+import os
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+PART_SIZE = 5 * 1024 * 1024  # S3's smallest part except the last
+
+@pytest.fixture
+def s3(monkeypatch):
+    from storage import S3Storage
+
+    for name, value in (("AWS_ACCESS_KEY_ID", "test"), ("AWS_SECRET_ACCESS_KEY", "test"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="modules")
+        yield S3Storage("modules", prefix="files", region="us-east-1", presign_expires=120)
+
+def read(storage, key):
+    body = storage.open(key)
+    try:
+        return body.read()
+    finally:
+        body.close()
+
+def test_multipart_upload_is_joined_in_order(s3):
+    first = os.urandom(PART_SIZE)
+    last = b"the end"
+    token = s3.start_multipart("partial/upload")
+
+    # Parts may arrive out of order and be sent again
+    assert s3.put_part("partial/upload", token, 2, io.BytesIO(last))[0] == len(last)
+    size, etag = s3.put_part("partial/upload", token, 1, io.BytesIO(first))
+    assert size == PART_SIZE
+    etags = {1: etag, 2: s3.put_part("partial/upload", token, 2, io.BytesIO(last))[1]}
+
+    s3.complete_multipart("partial/upload", token, sorted(etags.items()))
+    assert read(s3, "partial/upload") == first + last
+    # Completing again, as a retried request would, is harmless
+    s3.complete_multipart("partial/upload", token, sorted(etags.items()))
+
+    s3.move("partial/upload", "ab/blob")
+    assert not s3.exists("partial/upload")
+    assert read(s3, "ab/blob") == first + last
+    assert [key for key, _ in s3.iter_files()] == ["ab/blob"]
+
+def test_aborted_upload_leaves_nothing(s3):
+    token = s3.start_multipart("partial/aborted")
+    s3.put_part("partial/aborted", token, 1, io.BytesIO(b"data"))
+    s3.abort_multipart("partial/aborted", token)
+    s3.abort_multipart("partial/aborted", token)
+    assert list(s3.iter_files()) == []
+
+def test_put_file_uploads_and_removes_the_local_copy(s3, tmp_path):
+    local = tmp_path / "notes.txt"
+    local.write_bytes(b"notes")
+    s3.put_file("ab/notes", str(local))
+    assert not local.exists()
+    assert read(s3, "ab/notes") == b"notes"
+
+def test_download_redirects_to_a_presigned_url(s3, app):
+    with app.test_request_context():
+        response = s3.send("ab/blob", "Lesson 1.pdf")
+
+    assert response.status_code == 302
+    location = response.headers["Location"]
+    assert "/files/ab/blob?" in location
+    assert "Expires=" in location or "X-Amz-Expires=120" in location
+    assert "response-content-disposition=attachment" in location
+    assert "response-content-type=application%2Fpdf" in location
+    assert response.cache_control.private
+    assert response.cache_control.max_age == 60
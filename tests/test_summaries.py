@@ -0,0 +1,148 @@
+from sqlalchemy import select
+
+def student_ids(app):
+    from app import db
+    from models import Student
+
+    with app.app_context():
+        return db.session.execute(select(Student.id).order_by(Student.id)).scalars().all()
+
+def test_building_a_summary_another_request_inserted_keeps_it(app, school):
+    from app import db
+    from models import StudentSummary
+    from summaries import get_summary
+
+    student_id = student_ids(app)[0]
+    with app.app_context():
+        expected = get_summary(student_id).grade_count
+        db.session.remove()
+
+        # A concurrent first visit committed the summary after this one looked for it
+        summary = get_summary(student_id, known_missing=True)
+        assert summary.grade_count == expected
+        assert db.session.query(StudentSummary).filter_by(student_id=student_id).count() == 1
+
+FIGURES = ("grade_count", "grade_percentage_sum", "present_count", "absent_count", "late_count",
+           "modules_count", "recent_grades", "recent_attendance")
+
+def figures(summary):
+    return {name: getattr(summary, name) for name in FIGURES}
+
+def assert_matches_recompute(student_id):
+    """The maintained summary equals one rebuilt from scratch"""
+    from app import db
+    from models import StudentSummary
+    from summaries import rebuild_students
+
+    db.session.expire_all()
+    maintained = figures(db.session.get(StudentSummary, student_id))
+    recomputed = figures(rebuild_students([student_id])[student_id])
+    db.session.rollback()
+    assert maintained == recomputed
+
+def test_cold_dashboard_builds_the_summary_outside_the_budget(app, school, login):
+    from app import db
+    from models import StudentSummary, User
+    from querycount import count_queries
+
+    user_id = school["student_user_ids"][1]
+    with app.app_context():
+        student_id = db.session.get(User, user_id).student.id
+        StudentSummary.query.filter_by(student_id=student_id).delete()
+        db.session.commit()
+
+    client = login(app.test_client(), user_id)
+    with count_queries() as cold:
+        assert client.get("/student/dashboard").status_code == 200
+    # The first visit builds the summary, the second only reads it
+    with count_queries() as warm:
+        assert client.get("/student/dashboard").status_code == 200
+    assert cold.count > warm.count
+
+    with app.app_context():
+        assert_matches_recompute(student_id)
+
+def test_building_a_summary_is_set_based(app, school):
+    from app import db
+    from models import StudentSummary
+    from querycount import count_queries
+    from summaries import get_summary
+
+    student_id = student_ids(app)[1]
+    with app.app_context():
+        StudentSummary.query.filter_by(student_id=student_id).delete()
+        db.session.commit()
+        with count_queries() as counter:
+            get_summary(student_id, known_missing=True)
+    # Insert, lock, two queries each for grades, attendance and modules, and
+    # the update, however many grades and attendance rows the student has
+    assert counter.count == 9
+
+def test_grade_added_matches_a_recompute(app, school):
+    from datetime import date
+    from app import db
+    from models import Grade, Module
+    from summaries import get_summary, grade_added
+
+    student_id = student_ids(app)[2]
+    with app.app_context():
+        get_summary(student_id)
+        module = Module.query.filter_by(grade_level="5").first()
+        for score in (3, 9, 10, 6, 7, 2):
+            grade = Grade(score=score, max_score=10, date=date.today(), student_id=student_id, module_id=module.id)
+            db.session.add(grade)
+            db.session.flush()
+            grade_added(grade, module.title)
+        db.session.commit()
+
+        assert_matches_recompute(student_id)
+
+def test_attendance_changed_matches_a_recompute(app, school):
+    from datetime import date, timedelta
+    from app import db
+    from models import Attendance, Teacher
+    from summaries import attendance_changed, get_summary
+
+    student_id = student_ids(app)[3]
+    with app.app_context():
+        get_summary(student_id)
+        teacher = Teacher.query.first()
+        # A new absence and a changed status on an existing day
+        db.session.add(Attendance(date=date.today() - timedelta(days=10), status="absent",
+                                  student_id=student_id, recorded_by=teacher.id))
+        Attendance.query.filter_by(student_id=student_id, date=date.today()).one().status = "late"
+        db.session.flush()
+        attendance_changed([student_id])
+        db.session.commit()
+
+        assert_matches_recompute(student_id)
+
+def test_module_added_matches_a_recompute(app, school):
+    from app import db
+    from models import Module, Teacher
+    from summaries import get_summary, module_added
+
+    student_id = student_ids(app)[4]
+    with app.app_context():
+        get_summary(student_id)
+        db.session.add(Module(title="Extra", description="", grade_level="5", subject="Maths",
+                              teacher_id=Teacher.query.first().id))
+        module_added("5")
+        db.session.commit()
+
+        assert_matches_recompute(student_id)
+
+def test_grade_level_change_matches_a_recompute(app, school):
+    from app import db
+    from models import Student
+    from summaries import get_summary
+
+    student_id = student_ids(app)[0]
+    with app.app_context():
+        get_summary(student_id)
+        student = db.session.get(Student, student_id)
+        for grade_level in ("6", "5"):
+            student.grade_level = grade_level
+            db.session.commit()
+            assert_matches_recompute(student_id)
+            student = db.session.get(Student, student_id)
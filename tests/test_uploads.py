@@ -0,0 +1,95 @@
+import hashlib
+import os
+import pytest
+from app import app as flask_app  # Loads the app before the job modules it imports
+import processing  # Registers the process_module job
+
+@pytest.fixture
+def upload(app, school, login, monkeypatch):
+    """Return a function that sends a file through the resumable upload API and completes it"""
+    monkeypatch.setitem(app.config, "CHUNKED_UPLOAD_PART_SIZE", 4)
+    monkeypatch.setitem(app.config, "JOB_QUEUE_ENABLED", True)
+    client = login(app.test_client(), school["teacher_user_id"])
+
+    def upload(content, file_name="notes.txt"):
+        started = client.post("/api/uploads", json={"file_name": file_name, "size": len(content)})
+        assert started.status_code == 201
+        upload_id = started.get_json()["upload_id"]
+        for number, start in enumerate(range(0, len(content), 4), 1):
+            part = client.put(f"/api/uploads/{upload_id}/parts/{number}", data=content[start:start + 4])
+            assert part.status_code == 200
+
+        completed = client.post(f"/api/uploads/{upload_id}/complete", json={
+            "title": "Notes", "description": "", "grade_level": "5", "subject": "mathematics"
+        })
+        assert completed.status_code == 202, completed.get_json()
+        return completed.get_json()
+    return upload
+
+def stored(module, content):
+    from storage import get_storage
+    from uploads import blob_key
+
+    sha256 = hashlib.sha256(content).hexdigest()
+    assert (module.file_hash, module.file_path, module.staging_key) == (sha256, blob_key(sha256), None)
+    with get_storage().open(blob_key(sha256)) as f:
+        return f.read() == content
+
+def test_completed_upload_is_stored_in_the_background(app, upload):
+    from app import db
+    from models import Module, Job
+    from jobs import work
+
+    content = b"hello world"
+    result = upload(content)
+
+    with app.app_context():
+        # Nothing is hashed or stored by content until the job runs
+        module = db.session.get(Module, result["module_id"])
+        assert module.file_hash is None and module.staging_key
+        assert work("test", burst=True) == 2
+
+        module = db.session.get(Module, result["module_id"])
+        assert stored(module, content)
+        assert module.processing_status == "done"
+        assert db.session.get(Job, result["job_id"]).status == "done"
+
+def test_process_modules_stores_uploads_whose_job_was_lost(app, upload):
+    from app import db
+    from models import Job, Module
+
+    content = b"lost in a restart"
+    result = upload(content)
+    with app.app_context():
+        # As if the process running the job had died
+        db.session.delete(db.session.get(Job, result["job_id"]))
+        db.session.commit()
+
+    runner = app.test_cli_runner()
+    output = runner.invoke(args=["process-modules"]).output
+    assert "Stored the files of 1 completed uploads." in output
+
+    with app.app_context():
+        module = db.session.get(Module, result["module_id"])
+        assert stored(module, content)
+        assert module.processing_status == "done"
+
+def test_sweep_removes_joined_files_nothing_refers_to(app, upload):
+    from app import db
+    from models import Module
+    from storage import get_storage
+    from uploads import sweep_orphans
+
+    with app.app_context():
+        # A module deleted before its job ran leaves its joined file behind
+        deleted = db.session.get(Module, upload(b"deleted meanwhile")["module_id"])
+        deleted_key = deleted.staging_key
+        db.session.delete(deleted)
+        db.session.commit()
+        pending_key = db.session.get(Module, upload(b"pending")["module_id"]).staging_key
+
+        storage = get_storage()
+        assert storage.exists(deleted_key) and storage.exists(pending_key)
+        sweep_orphans(grace_seconds=-60)
+        assert not storage.exists(deleted_key)
+        assert storage.exists(pending_key)
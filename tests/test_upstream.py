@@ -0,0 +1,144 @@
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+import upstream
+from upstream import CircuitOpenError, UpstreamBusyError, UpstreamClient, UpstreamError
+
+def test_unexpected_error_in_trial_call_releases_the_circuit(monkeypatch):
+    client = UpstreamClient("http://upstream.invalid", max_retries=0, failure_threshold=1, reset_timeout=0)
+    client.breaker.record_failure()
+
+    def broken(*args, **kwargs):
+        raise KeyError("not a RequestException")
+    monkeypatch.setattr(client.session, "request", broken)
+
+    with pytest.raises(KeyError):
+        client.request("GET", "/")
+    # The trial call failed, so the next one is let through after the reset timeout
+    assert not client.breaker.trial_in_flight
+    assert client.breaker.allow()
+
+def test_open_circuit_refuses_calls():
+    client = UpstreamClient("http://upstream.invalid", failure_threshold=1, reset_timeout=60)
+    client.breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        client.request("GET", "/")
+
+def test_concurrent_first_calls_share_one_client(app, monkeypatch):
+    created = []
+    def slow_create(config, token):
+        time.sleep(0.05)
+        created.append(token)
+        return object()
+    monkeypatch.setattr(upstream, "create_client", slow_create)
+    monkeypatch.setitem(app.config, "AI_API_BASE_URL", "http://upstream.invalid")
+    app.extensions.pop("ai_client", None)
+
+    clients = []
+    def first_call():
+        with app.app_context():
+            clients.append(upstream.get_client("token"))
+    threads = [threading.Thread(target=first_call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    app.extensions.pop("ai_client", None)
+
+    assert len(created) == 1
+    assert len({id(client) for client in clients}) == 1
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers each request with the next scripted (status, body, delay) of its server"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.received.append(body)
+        status, payload, delay = self.server.script.pop(0) if self.server.script else (200, b"ok", 0)
+        time.sleep(delay)
+        try:
+            self.send_response(status)
+            if status == 503:
+                self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up waiting
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.script = []
+    server.received = []
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_client(server, **options):
+    options.setdefault("backoff", 0)
+    return UpstreamClient(f"http://127.0.0.1:{server.server_port}", **options)
+
+def test_transient_failures_are_retried(stub):
+    stub.script = [(503, b"busy", 0), (502, b"bad gateway", 0), (200, b"answer", 0)]
+    client = make_client(stub, max_retries=2)
+
+    response = client.request("POST", "/v1/chat", data=b"question")
+    assert (response.status_code, response.content) == (200, b"answer")
+    assert stub.received == [b"question"] * 3
+    assert client.breaker.failures == 0
+
+def test_uploaded_files_are_sent_whole_on_every_attempt(stub):
+    stub.script = [(503, b"busy", 0)]
+    client = make_client(stub, max_retries=1)
+
+    client.request("POST", "/v1/audio", files={"file": ("a.wav", io.BytesIO(b"RIFF audio"))})
+    assert len(stub.received) == 2
+    assert all(b"RIFF audio" in body for body in stub.received)
+
+def test_client_errors_are_returned_without_retrying(stub):
+    stub.script = [(400, b"bad request", 0)]
+    client = make_client(stub, max_retries=2)
+
+    assert client.request("POST", "/v1/chat").status_code == 400
+    assert len(stub.received) == 1
+
+def test_persistent_failures_open_the_circuit(stub):
+    stub.script = [(503, b"busy", 0)] * 3
+    client = make_client(stub, max_retries=2, failure_threshold=3, reset_timeout=60)
+
+    with pytest.raises(UpstreamError) as error:
+        client.request("POST", "/v1/chat")
+    assert error.value.response.status_code == 503
+
+    with pytest.raises(CircuitOpenError):
+        client.request("POST", "/v1/chat")
+    assert len(stub.received) == 3
+
+def test_slow_responses_time_out(stub):
+    stub.script = [(200, b"late", 0.5), (200, b"late", 0.5)]
+    client = make_client(stub, max_retries=1, read_timeout=0.1)
+
+    started = time.monotonic()
+    with pytest.raises(UpstreamError) as error:
+        client.request("POST", "/v1/chat")
+    assert isinstance(error.value.__cause__, requests.exceptions.Timeout)
+    assert time.monotonic() - started < 0.5 * 2
+    assert client.breaker.failures == 2
+
+def test_stream_holds_its_slot_until_closed(stub):
+    client = make_client(stub, max_in_flight=1, queue_timeout=0.05)
+
+    with client.stream("POST", "/v1/chat") as response:
+        assert response.raw.read() == b"ok"
+        with pytest.raises(UpstreamBusyError):
+            client.request("POST", "/v1/chat")
+    assert client.request("POST", "/v1/chat").content == b"ok"
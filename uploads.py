@@ -0,0 +1,357 @@
+import hashlib
+import logging
+import os
+import re
+import secrets
+import tempfile
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.utils import secure_filename
+from app import db
+from models import Module, StoredFile, UploadSession, UploadPart
+from jobs import job_handler, submit
+from storage import get_storage
+
+CHUNK_SIZE = 64 * 1024
+TEMP_DIR = 'tmp'
+PARTIAL_DIR = 'partial'
+MAX_PARTS = 10000  # S3's limit on parts per multipart upload
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+def blob_key(sha256):
+    """Storage key of a blob"""
+    return f"{sha256[:2]}/{sha256}"
+
+def preview_key(sha256):
+    """Storage key of the thumbnail generated for a blob"""
+    return f"previews/{sha256}.png"
+
+def _spool(stream):
+    """Copy a stream to a temporary file while hashing it; return (sha256, path)"""
+    temp_dir = get_storage().temp_dir
+    if temp_dir:
+        os.makedirs(temp_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+    return digest.hexdigest(), temp_path
+
+def attach_file(module, file_storage):
+    """
+    Stream an uploaded file into the content-addressed store and point the
+    module at it. The module is flushed first so its reference is counted
+    (and the stored file row locked) before the blob is put in place; the
+    caller is responsible for committing.
+    """
+    sha256, temp_path = _spool(file_storage.stream)
+    try:
+        module.file_hash = sha256
+        module.file_name = secure_filename(file_storage.filename)
+        module.file_path = blob_key(sha256)
+        db.session.add(module)
+        db.session.flush()
+
+        storage = get_storage()
+        if not storage.exists(blob_key(sha256)):
+            storage.put_file(blob_key(sha256), temp_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def start_chunked_upload(teacher_id, file_name, size=None):
+    """
+    Begin a resumable upload of a file that is sent in numbered parts of
+    CHUNKED_UPLOAD_PART_SIZE bytes. Raises ValueError for an unacceptable
+    file; the caller is responsible for committing.
+    """
+    file_name = secure_filename(file_name or '')
+    if not file_name:
+        raise ValueError("A file name is required")
+
+    part_size = current_app.config['CHUNKED_UPLOAD_PART_SIZE']
+    max_size = current_app.config['CHUNKED_UPLOAD_MAX_SIZE']
+    if size is not None and not 0 <= size <= max_size:
+        raise ValueError(f"Files may be at most {max_size} bytes")
+
+    upload_id = secrets.token_hex(16)
+    key = f"{PARTIAL_DIR}/{upload_id}"
+    upload = UploadSession(
+        id=upload_id,
+        teacher_id=teacher_id,
+        file_name=file_name,
+        size=size,
+        part_size=part_size,
+        storage_key=key,
+        storage_token=get_storage().start_multipart(key)
+    )
+    db.session.add(upload)
+    return upload
+
+def store_part(upload, number, stream, length):
+    """
+    Stream one part of an upload into storage. Sending a part again replaces
+    it, so a client can resume by re-sending whatever did not arrive. The
+    caller is responsible for committing.
+    """
+    max_size = current_app.config['CHUNKED_UPLOAD_MAX_SIZE']
+    last_part = min(MAX_PARTS, -(-max_size // upload.part_size))
+    if upload.size is not None:
+        last_part = min(last_part, max(1, -(-upload.size // upload.part_size)))
+    if not 1 <= number <= last_part:
+        raise ValueError(f"Part number must be between 1 and {last_part}")
+    if length is None:
+        raise ValueError("Content-Length is required")
+    if length > upload.part_size:
+        raise ValueError(f"Parts may be at most {upload.part_size} bytes")
+
+    size, etag = get_storage().put_part(upload.storage_key, upload.storage_token, number, stream)
+    db.session.merge(UploadPart(upload_id=upload.id, number=number, size=size, etag=etag))
+    return size
+
+def complete_chunked_upload(upload, module):
+    """
+    Join the parts of an upload and add the module, still without a file, to
+    the session. The module keeps the storage key of the joined file until
+    the 'store_upload' job has hashed it and moved it into the content-
+    addressed store, so large files are never read back inside a request.
+    Raises ValueError if parts are missing; the caller is responsible for
+    committing.
+    """
+    parts = upload.parts.order_by(UploadPart.number).all()
+    if not parts or [part.number for part in parts] != list(range(1, len(parts) + 1)):
+        raise ValueError("Some parts of the file have not been uploaded")
+    if any(part.size != upload.part_size for part in parts[:-1]):
+        raise ValueError(f"Every part except the last must be {upload.part_size} bytes")
+    total = sum(part.size for part in parts)
+    if upload.size is not None and total != upload.size:
+        raise ValueError(f"Received {total} bytes, expected {upload.size}")
+
+    get_storage().complete_multipart(upload.storage_key, upload.storage_token, [(part.number, part.etag) for part in parts])
+
+    module.file_name = upload.file_name
+    module.staging_key = upload.storage_key
+    db.session.add(module)
+    db.session.delete(upload)
+
+@job_handler('store_upload', max_attempts=3)
+def store_upload(module_id, created_by=None, process=True):
+    """
+    Hash the joined file of a completed upload, store it by content hash and
+    attach it to its module, then queue the module for processing unless
+    `process` is false. Commits.
+    """
+    module = db.session.get(Module, module_id)
+    if module is None or not module.staging_key:
+        # Deleted, or already stored by an earlier attempt; a joined file
+        # nothing refers to any more is removed by gc-uploads
+        return None
+
+    storage = get_storage()
+    staging_key = module.staging_key
+    digest = hashlib.sha256()
+    with closing(storage.open(staging_key)) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+
+    # Flushed first so the reference is counted before the blob is put in place
+    module.file_hash = sha256
+    module.file_path = blob_key(sha256)
+    module.staging_key = None
+    db.session.flush()
+
+    if storage.exists(blob_key(sha256)):
+        storage.delete(staging_key)
+    else:
+        storage.move(staging_key, blob_key(sha256))
+    db.session.commit()
+
+    if process:
+        submit('process_module', {'module_id': module_id}, created_by=created_by)
+    return {'sha256': sha256}
+
+def store_pending_uploads():
+    """
+    Store the joined files of completed uploads whose job never finished,
+    e.g. because the process running it restarted. Returns the ids of the
+    modules that were stored; a failure is logged and left for the next run.
+    """
+    module_ids = db.session.execute(
+        select(Module.id).where(Module.staging_key.isnot(None)).order_by(Module.id)
+    ).scalars().all()
+    stored = []
+    for module_id in module_ids:
+        try:
+            if store_upload(module_id, process=False):
+                stored.append(module_id)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error storing the upload of module {module_id}: {str(e)}")
+    return stored
+
+def abort_chunked_upload(upload):
+    """Discard an upload and its parts; the caller is responsible for committing"""
+    get_storage().abort_multipart(upload.storage_key, upload.storage_token)
+    db.session.delete(upload)
+
+def expire_chunked_uploads(max_age_seconds):
+    """Abort uploads started more than `max_age_seconds` ago; commits and returns how many"""
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+    uploads = UploadSession.query.filter(UploadSession.created_at < cutoff).all()
+    for upload in uploads:
+        abort_chunked_upload(upload)
+    db.session.commit()
+    return len(uploads)
+
+def send_stored_file(key, download_name=None):
+    """
+    Send an uploaded file from the configured storage. Content-addressed files
+    use their hash as a strong ETag and may be cached for good.
+    """
+    name = os.path.basename(key)
+    etag = name if HASH_PATTERN.match(name) else True
+    response = get_storage().send(key, download_name or name, etag)
+
+    if etag is not True and response.status_code != 302:
+        response.cache_control.no_cache = None
+        response.cache_control.private = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    return response
+
+def _adjust_references(connection, sha256, delta):
+    table = StoredFile.__table__
+    dialect = connection.dialect.name
+    if delta > 0 and dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table).values(sha256=sha256, ref_count=delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['sha256'],
+            set_={'ref_count': table.c.ref_count + delta}
+        )
+        connection.execute(stmt)
+        return
+
+    result = connection.execute(
+        update(table).where(table.c.sha256 == sha256).values(ref_count=table.c.ref_count + delta)
+    )
+    if result.rowcount == 0 and delta > 0:
+        connection.execute(table.insert().values(sha256=sha256, ref_count=delta))
+
+# The stored file row must exist before the module row that references it
+@event.listens_for(Module, 'before_insert')
+def _module_inserted(mapper, connection, target):
+    if target.file_hash:
+        _adjust_references(connection, target.file_hash, 1)
+
+@event.listens_for(Module, 'after_delete')
+def _module_deleted(mapper, connection, target):
+    if target.file_hash:
+        _adjust_references(connection, target.file_hash, -1)
+
+@event.listens_for(Module, 'before_update')
+def _module_file_replaced(mapper, connection, target):
+    history = db.inspect(target).attrs.file_hash.history
+    if history.has_changes():
+        for sha256 in history.added:
+            if sha256:
+                _adjust_references(connection, sha256, 1)
+        for sha256 in history.deleted:
+            if sha256:
+                _adjust_references(connection, sha256, -1)
+
+def collect_garbage(sha256s=None):
+    """
+    Delete stored files that no module references any more, limited to
+    `sha256s` when given. Commits and returns the number of files removed.
+    """
+    table = StoredFile.__table__
+    stmt = delete(table).where(table.c.ref_count <= 0)
+    if sha256s is not None:
+        sha256s = [sha256 for sha256 in set(sha256s) if sha256]
+        if not sha256s:
+            return 0
+        stmt = stmt.where(table.c.sha256.in_(sha256s))
+
+    removed = db.session.execute(stmt.returning(table.c.sha256)).scalars().all()
+
+    # Unlink while the deleted rows are still locked, so an upload of the same
+    # content waits for this commit and then puts the file back
+    storage = get_storage()
+    for sha256 in removed:
+        storage.delete(blob_key(sha256))
+        storage.delete(preview_key(sha256))
+    db.session.commit()
+
+    if removed:
+        logging.info(f"Removed {len(removed)} unreferenced uploads")
+    return len(removed)
+
+def _upload_key(key):
+    """The key of the upload a file under PARTIAL_DIR belongs to, parts included"""
+    name = key[len(PARTIAL_DIR) + 1:].split('/', 1)[0]
+    return f"{PARTIAL_DIR}/{name.removesuffix('.parts')}"
+
+def sweep_orphans(grace_seconds=3600):
+    """
+    Remove blobs without a stored file row, abandoned temporary files, and
+    upload files that neither an upload nor a module waiting for its file
+    refers to, left behind when a transaction rolled back or a module was
+    deleted. Files newer than `grace_seconds` may belong to an upload in
+    progress and are kept.
+    """
+    cutoff = time.time() - grace_seconds
+    known = set(db.session.execute(select(StoredFile.sha256)).scalars())
+    uploading = set(db.session.execute(select(UploadSession.storage_key)).scalars())
+    uploading.update(db.session.execute(
+        select(Module.staging_key).where(Module.staging_key.isnot(None))
+    ).scalars())
+    db.session.commit()
+
+    storage = get_storage()
+    removed = 0
+    for key, modified in list(storage.iter_files()):
+        name = key.rsplit('/', 1)[-1]
+        if key.startswith(PARTIAL_DIR + '/'):
+            orphaned = _upload_key(key) not in uploading
+        else:
+            orphaned = key.startswith(TEMP_DIR + '/') or (HASH_PATTERN.match(name) and name not in known)
+        if orphaned and modified < cutoff:
+            storage.delete(key)
+            removed += 1
+
+    return removed
+
+@click.command('gc-uploads')
+@click.option('--grace', default=3600, show_default=True, help='Keep orphaned files younger than this many seconds.')
+@with_appcontext
+def gc_uploads_command(grace):
+    """Delete uploaded files that are no longer referenced."""
+    expired = expire_chunked_uploads(current_app.config['CHUNKED_UPLOAD_EXPIRY'])
+    collected = collect_garbage()
+    swept = sweep_orphans(grace)
+    click.echo(f"Removed {collected} unreferenced and {swept} orphaned files, "
+               f"and {expired} abandoned uploads.")
@@ -0,0 +1,209 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+from metrics import AI_UPSTREAM_REQUESTS
+
+# Responses worth trying again: rate limiting and transient server trouble
+RETRY_STATUSES = {429, 502, 503, 504}
+
+class UpstreamError(requests.exceptions.RequestException):
+    """The upstream service could not be reached or kept failing"""
+
+class CircuitOpenError(UpstreamError):
+    """Calls are being refused while the upstream service recovers"""
+
+class UpstreamBusyError(UpstreamError):
+    """Too many calls to the upstream service are already in flight"""
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service after `failure_threshold` consecutive
+    failures. After `reset_timeout` seconds one trial call is let through;
+    it closes the circuit again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_in_flight or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    logging.warning(f"Upstream circuit opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+class UpstreamClient:
+    """
+    Shared HTTP client for one upstream service. Connections are kept alive
+    in a pool, every call has a timeout, transient failures are retried with
+    jittered exponential backoff, a circuit breaker stops calls to a service
+    that keeps failing, and at most `max_in_flight` calls run at once.
+    """
+
+    def __init__(self, base_url, headers=None, max_in_flight=8, queue_timeout=5,
+                 connect_timeout=3.05, read_timeout=30, max_retries=2, backoff=0.5,
+                 backoff_max=8, failure_threshold=5, reset_timeout=30):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self.semaphore = threading.BoundedSemaphore(max_in_flight)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        # Retries are done here so they can share the backoff and the breaker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, path):
+        return self.base_url + path.lstrip('/')
+
+    def backoff_seconds(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, or the server's Retry-After; never more than backoff_max"""
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff * 2 ** attempt, self.backoff_max))
+
+    def _send(self, method, path, stream=False, timeout=None, **kwargs):
+        """Send with retries; the caller must hold a slot of the semaphore"""
+        # Uploaded files are read by each attempt, so note where to rewind them to
+        files = kwargs.get('files') or {}
+        uploads = [value[1] if isinstance(value, tuple) else value for value in files.values()]
+        positions = [(f, f.tell()) for f in uploads if hasattr(f, 'seek')]
+
+        error = None
+        for attempt in range(self.max_retries + 1):
+            for f, position in positions:
+                f.seek(position)
+            if not self.breaker.allow():
+                AI_UPSTREAM_REQUESTS.inc(1, 'circuit_open')
+                raise CircuitOpenError(f"Circuit open for {self.base_url}")
+
+            retry_after = None
+            response = None
+            healthy = False
+            try:
+                response = self.session.request(method, self.url(path), stream=stream,
+                                                timeout=timeout or self.timeout, **kwargs)
+                # Other errors are the caller's to handle; the service itself is healthy
+                healthy = response.status_code not in RETRY_STATUSES
+            except requests.exceptions.RequestException as e:
+                error = e
+            finally:
+                # Recorded whatever is raised, so a trial call never holds the circuit open
+                if healthy:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+
+            if healthy:
+                AI_UPSTREAM_REQUESTS.inc(1, 'ok')
+                return response
+            if response is not None:
+                retry_after = response.headers.get('Retry-After')
+                error = UpstreamError(f"{method} {path} returned {response.status_code}", response=response)
+                response.close()
+
+            if attempt < self.max_retries:
+                AI_UPSTREAM_REQUESTS.inc(1, 'retry')
+                time.sleep(self.backoff_seconds(attempt, retry_after))
+
+        AI_UPSTREAM_REQUESTS.inc(1, 'error')
+        if isinstance(error, UpstreamError):
+            raise error
+        raise UpstreamError(f"{method} {path} failed: {str(error)}") from error
+
+    def _acquire(self):
+        if not self.semaphore.acquire(timeout=self.queue_timeout):
+            AI_UPSTREAM_REQUESTS.inc(1, 'busy')
+            raise UpstreamBusyError(f"Too many requests in flight to {self.base_url}")
+
+    def request(self, method, path, **kwargs):
+        """Make a call and return the response with its body read"""
+        self._acquire()
+        try:
+            response = self._send(method, path, **kwargs)
+            response.content  # Read the body so the connection goes back to the pool
+            return response
+        finally:
+            self.semaphore.release()
+
+    @contextmanager
+    def stream(self, method, path, **kwargs):
+        """Make a call whose body is read as it arrives; the call counts as in flight until the block exits"""
+        self._acquire()
+        try:
+            response = self._send(method, path, stream=True, **kwargs)
+            try:
+                yield response
+            finally:
+                response.close()
+        finally:
+            self.semaphore.release()
+
+    def close(self):
+        self.session.close()
+
+def create_client(config, token):
+    """Build the AI service client from the AI_API_* settings"""
+    return UpstreamClient(
+        config['AI_API_BASE_URL'],
+        headers={'Authorization': f'Bearer {token}', 'Accept': 'application/json'},
+        max_in_flight=config.get('AI_API_MAX_IN_FLIGHT', 8),
+        queue_timeout=config.get('AI_API_QUEUE_TIMEOUT', 5),
+        connect_timeout=config.get('AI_API_CONNECT_TIMEOUT', 3.05),
+        read_timeout=config.get('AI_API_READ_TIMEOUT', 30),
+        max_retries=config.get('AI_API_MAX_RETRIES', 2),
+        backoff=config.get('AI_API_RETRY_BACKOFF', 0.5),
+        failure_threshold=config.get('AI_API_CIRCUIT_FAILURES', 5),
+        reset_timeout=config.get('AI_API_CIRCUIT_RESET', 30)
+    )
+
+_client_lock = threading.Lock()
+
+def get_client(token):
+    """Return the current app's AI service client, or None when AI_API_BASE_URL is not set"""
+    if not current_app.config.get('AI_API_BASE_URL'):
+        return None
+    client = current_app.extensions.get('ai_client')
+    if client is None:
+        # Concurrent first calls must share one pool and one in-flight limit
+        with _client_lock:
+            client = current_app.extensions.get('ai_client')
+            if client is None:
+                client = current_app.extensions['ai_client'] = create_client(current_app.config, token)
+    return client